@@ -0,0 +1,344 @@
+import json
+from collections import defaultdict
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.exc import IntegrityError
+
+from settings import db, cache
+from models import House, RegionStat
+from house_changes import house_changes
+from utils import clean_price, parse_area
+
+# 散点图最多抽样的数据点数量
+POINT_SAMPLE_SIZE = 100
+# 柱状图展示的热门小区数量
+TOP_ADDRESS_LIMIT = 5
+# 影响统计结果的房源字段 (价格和面积使用同步好的数值列)，只有这些字段变化时才需要更新
+TRACKED_FIELDS = ('region', 'block', 'address', 'rooms', 'price_value', 'area_value', 'publish_time')
+
+
+# --- 辅助函数 ---
+def normalize_region(region):
+    """统一区名的写法 ('朝阳区' 与 '朝阳' 视为同一个区)"""
+    return (region or '').replace('区', '').strip()
+
+
+def parse_location(region_str):
+    """将'区-街道-小区'格式的字符串拆分为 (区, 街道, 小区)"""
+    parts = region_str.split('-')
+    region_part = normalize_region(parts[0]) if len(parts) > 0 else ''
+    block_part = parts[1].strip() if len(parts) > 1 else ''
+    address_part = parts[2].strip() if len(parts) > 2 else ''
+    return region_part, block_part, address_part
+
+
+def load_location_stats(region_str):
+    """
+    读取某个位置的全部预聚合数据 (一次索引查询)
+    返回 (汇总行, {户型: 统计行})，没有数据时汇总行为 None
+    """
+    region, block, address = parse_location(region_str)
+    rows = RegionStat.query.filter_by(region=region, block=block, address=address).all()
+    summary = None
+    rooms_stats = {}
+    for row in rows:
+        if row.rooms:
+            rooms_stats[row.rooms] = row
+        else:
+            summary = row
+    return summary, rooms_stats
+
+
+class RegionStatSource:
+    """图表数据：读取预聚合的区域统计表 (没有安装 NumPy 时使用)"""
+
+    def scatter_points(self, region_str):
+        summary, _ = load_location_stats(region_str)
+        return json.loads(summary.points) if summary and summary.points else []
+
+    def rooms_counts(self, region_str, limit):
+        _, rooms_stats = load_location_stats(region_str)
+        top_rooms = sorted(rooms_stats.values(), key=lambda s: s.house_count, reverse=True)[:limit]
+        return [(s.rooms, s.house_count) for s in top_rooms]
+
+    def top_addresses(self, region_str):
+        summary, _ = load_location_stats(region_str)
+        return json.loads(summary.top_addresses) if summary and summary.top_addresses else []
+
+    def price_series(self, region_str, rooms_list):
+        _, rooms_stats = load_location_stats(region_str)
+        series = {}
+        for rooms in rooms_list:
+            stat = rooms_stats.get(rooms)
+            series[rooms] = json.loads(stat.price_series) if stat and stat.price_series else []
+        return series
+
+    def dashboard(self, region_str, rooms_limit, rooms_list):
+        """一个位置的全部图表数据，只查询一次统计表"""
+        summary, rooms_stats = load_location_stats(region_str)
+        top_rooms = sorted(rooms_stats.values(), key=lambda s: s.house_count, reverse=True)[:rooms_limit]
+        series = {}
+        for rooms in rooms_list:
+            stat = rooms_stats.get(rooms)
+            series[rooms] = json.loads(stat.price_series) if stat and stat.price_series else []
+        return {
+            'scatter': json.loads(summary.points) if summary and summary.points else [],
+            'rooms': [(s.rooms, s.house_count) for s in top_rooms],
+            'top_addresses': json.loads(summary.top_addresses) if summary and summary.top_addresses else [],
+            'price_series': series,
+        }
+
+
+region_stats = RegionStatSource()
+
+
+class _Bucket:
+    """聚合过程中某个统计键对应的累加器"""
+
+    def __init__(self):
+        self.house_count = 0
+        self.prices = []
+        self.points = []
+        self.address_prices = defaultdict(list)
+        self.address_counts = defaultdict(int)
+
+    def add(self, row, price, area):
+        self.house_count += 1
+        if price > 0:
+            self.prices.append(price)
+        if area > 0 and price > 0 and len(self.points) < POINT_SAMPLE_SIZE:
+            self.points.append([area, price])
+        if row.address:
+            self.address_counts[row.address] += 1
+            if price > 0:
+                self.address_prices[row.address].append(price)
+
+    def to_record(self, key, with_summary):
+        region, block, address, rooms = key
+        price_sum = sum(self.prices)
+        record = {
+            'region': region,
+            'block': block,
+            'address': address,
+            'rooms': rooms,
+            'house_count': self.house_count,
+            'price_count': len(self.prices),
+            'price_sum': price_sum,
+            'price_avg': round(price_sum / len(self.prices), 2) if self.prices else 0,
+            'price_series': None,
+            'points': None,
+            'top_addresses': None,
+        }
+        if with_summary:
+            # 数量相同的小区按名称排序，与增量维护的 SQL 排序一致
+            top = sorted(self.address_counts.items(), key=lambda item: (-item[1], item[0]))[:TOP_ADDRESS_LIMIT]
+            record['points'] = json.dumps(self.points)
+            record['top_addresses'] = json.dumps([
+                [name, count, round(sum(self.address_prices[name]) / len(self.address_prices[name]), 2)
+                 if self.address_prices[name] else 0]
+                for name, count in top
+            ], ensure_ascii=False)
+        else:
+            record['price_series'] = json.dumps(self.prices)
+        return record
+
+
+def _location_keys(region, block, address):
+    """一套房源所属的各级位置键：区、区-街道、区-街道-小区"""
+    region = normalize_region(region)
+    block = block or ''
+    keys = [(region, '', '')]
+    if block:
+        keys.append((region, block, ''))
+        if address:
+            keys.append((region, block, address))
+    return keys
+
+
+def rebuild_region(conn, region):
+    """重新计算某个区下所有位置键的统计数据，并替换原有记录"""
+    region = normalize_region(region)
+    rows = conn.execute(
+        select(House.id, House.region, House.block, House.address, House.rooms,
+               House.price, House.area, House.price_value, House.area_value)
+        .where(House.region.in_([region, region + '区']))
+        .order_by(House.publish_time.asc(), House.id.asc())
+    ).all()
+
+    buckets = defaultdict(_Bucket)
+    # 散点图抽样按房源编号顺序选取，保证结果稳定
+    for row in sorted(rows, key=lambda r: r.id):
+        price = row.price_value if row.price_value is not None else clean_price(row.price)
+        area = row.area_value if row.area_value is not None else parse_area(row.area)
+        for location in _location_keys(row.region, row.block, row.address):
+            buckets[location + ('',)].add(row, price, area)
+    # 价格序列需要按发布时间排序
+    for row in rows:
+        price = row.price_value if row.price_value is not None else clean_price(row.price)
+        if not row.rooms:
+            continue
+        for location in _location_keys(row.region, row.block, row.address):
+            buckets[location + (row.rooms,)].add(row, price, 0)
+
+    records = [bucket.to_record(key, with_summary=not key[3]) for key, bucket in buckets.items()]
+    table = RegionStat.__table__
+    conn.execute(table.delete().where(table.c.region == region))
+    if records:
+        conn.execute(table.insert(), records)
+    return len(records)
+
+
+def rebuild_all(conn):
+    """重建全部区的统计数据，返回处理的区数量"""
+    regions = {normalize_region(r) for (r,) in conn.execute(select(House.region).distinct()) if r}
+    conn.execute(RegionStat.__table__.delete())
+    for region in regions:
+        rebuild_region(conn, region)
+    return len(regions)
+
+
+# --- 增量维护 ---
+class _StatDelta:
+    """某个统计键的增量：房源数量、有效价格的数量和总和"""
+    __slots__ = ('house_count', 'price_count', 'price_sum')
+
+    def __init__(self):
+        self.house_count = 0
+        self.price_count = 0
+        self.price_sum = 0.0
+
+    def add(self, price, sign):
+        self.house_count += sign
+        if price and price > 0:
+            self.price_count += sign
+            self.price_sum += sign * price
+
+
+def _stat_keys(values):
+    """一套房源 (字段值字典) 所属的全部统计键：各级位置的汇总行和户型行"""
+    keys = []
+    for location in _location_keys(values['region'], values['block'], values['address']):
+        keys.append(location + ('',))
+        if values['rooms']:
+            keys.append(location + (values['rooms'],))
+    return keys
+
+
+def _house_conditions(key):
+    """某个统计键包含的房源的查询条件"""
+    region, block, address, rooms = key
+    table = House.__table__
+    conditions = [table.c.region.in_([region, region + '区'])]
+    if block:
+        conditions.append(table.c.block == block)
+    if address:
+        conditions.append(table.c.address == address)
+    if rooms:
+        conditions.append(table.c.rooms == rooms)
+    return conditions
+
+
+def _key_lists(conn, key):
+    """
+    重新生成某个统计键的列表字段 (无法按增量合并)：
+    户型行的价格序列；汇总行的散点图抽样和热门小区，只查询这个位置键的房源
+    """
+    table = House.__table__
+    conditions = _house_conditions(key)
+    price = table.c.price_value
+    if key[3]:
+        series = conn.execute(select(price).where(*conditions, price > 0)
+                              .order_by(table.c.publish_time.asc(), table.c.id.asc())).scalars().all()
+        return {'price_series': json.dumps(series)}
+    points = conn.execute(select(table.c.area_value, price)
+                          .where(*conditions, table.c.area_value > 0, price > 0)
+                          .order_by(table.c.id).limit(POINT_SAMPLE_SIZE)).all()
+    count = func.count()
+    top = conn.execute(select(table.c.address, count, func.avg(case((price > 0, price))))
+                       .where(*conditions, table.c.address.isnot(None), table.c.address != '')
+                       .group_by(table.c.address).order_by(count.desc(), table.c.address)
+                       .limit(TOP_ADDRESS_LIMIT)).all()
+    return {
+        'points': json.dumps([[area, value] for area, value in points]),
+        'top_addresses': json.dumps([[name, n, round(avg, 2) if avg else 0] for name, n, avg in top],
+                                    ensure_ascii=False),
+    }
+
+
+def apply_house_changes(conn, changes):
+    """
+    把房源变化按统计键合并到统计表：数量和价格总和按增量更新 (行锁保证并发更新不丢失)，
+    列表字段只重新生成受影响的位置键；返回受影响的区
+    """
+    deltas = defaultdict(_StatDelta)
+    for change in changes:
+        for values, sign in ((change.old, -1), (change.new, 1)):
+            if values is not None:
+                for key in _stat_keys(values):
+                    deltas[key].add(values['price_value'], sign)
+
+    table = RegionStat.__table__
+    for key, delta in deltas.items():
+        if key[0]:
+            _merge_delta(conn, table, key, delta)
+    return {key[0] for key in deltas if key[0]}
+
+
+def _merge_delta(conn, table, key, delta):
+    where = and_(table.c.region == key[0], table.c.block == key[1], table.c.address == key[2], table.c.rooms == key[3])
+    row = conn.execute(select(table.c.id, table.c.house_count, table.c.price_count, table.c.price_sum)
+                       .where(where).with_for_update()).first()
+    if row is None:
+        if delta.house_count <= 0:
+            return
+        try:
+            # 行不存在时 SELECT ... FOR UPDATE 锁不住任何行，并发的第一次写入由唯一键保证只有一个成功
+            with conn.begin_nested():
+                conn.execute(table.insert().values(
+                    region=key[0], block=key[1], address=key[2], rooms=key[3],
+                    house_count=delta.house_count, price_count=delta.price_count, price_sum=delta.price_sum,
+                    price_avg=round(delta.price_sum / delta.price_count, 2) if delta.price_count else 0,
+                    **_key_lists(conn, key)))
+            return
+        except IntegrityError:
+            # 另一个进程先插入了这一行，改为在它的基础上合并
+            row = conn.execute(select(table.c.id, table.c.house_count, table.c.price_count, table.c.price_sum)
+                               .where(where).with_for_update()).one()
+    house_count = row.house_count + delta.house_count
+    if house_count <= 0:
+        conn.execute(table.delete().where(table.c.id == row.id))
+        return
+    price_count = row.price_count + delta.price_count
+    price_sum = row.price_sum + delta.price_sum
+    conn.execute(table.update().where(table.c.id == row.id).values(
+        house_count=house_count, price_count=price_count, price_sum=price_sum,
+        price_avg=round(price_sum / price_count, 2) if price_count else 0,
+        **_key_lists(conn, key)))
+
+
+def _update_region_stats(changes):
+    with db.engine.begin() as conn:
+        regions = apply_house_changes(conn, changes)
+    # 统计表写入之后图表缓存再失效一次 (提交时的失效可能已被旧的统计数据重新填充)
+    for region in regions:
+        cache.invalidate_prefix('charts', f'{region}|')
+
+
+def subscribe_region_stats():
+    """统计表作为图表数据来源时 (没有列式快照) 调用：房源变化提交后在后台增量维护统计表"""
+    house_changes.subscribe(_update_region_stats, TRACKED_FIELDS, old_fields=TRACKED_FIELDS, background=True)
+
+
+# --- 房源变化后缓存失效 ---
+def _invalidate_caches(changes):
+    # 房源换了区时原来的区的图表也要失效
+    regions = {normalize_region(values['region']) for change in changes
+               for values in (change.old, change.new) if values}
+    for region in regions:
+        if region:
+            cache.invalidate_prefix('charts', f'{region}|')
+    cache.invalidate('hot_houses')
+    cache.invalidate('new_houses')
+
+
+house_changes.subscribe(_invalidate_caches, TRACKED_FIELDS, old_fields=('region',))
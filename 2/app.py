@@ -1,139 +1,158 @@
-from flask import request, jsonify, redirect, url_for, session, Blueprint, render_template
-from settings import app, db
-from models import User, House
-from sqlalchemy import or_, func, and_
-import re
-import time
-from types import SimpleNamespace
+from urllib.parse import urlencode
+
+from flask import request, jsonify, redirect, url_for, session, Blueprint, render_template, Response
+from settings import app, db, cache, limiter, instrumentation
+from models import User, House, UserCollection, UserViewHistory, SavedSearch, SavedSearchMatch
+from sqlalchemy import false
+from sqlalchemy.exc import IntegrityError
+from analytics import parse_location, region_stats, subscribe_region_stats
+from snapshot import chart_snapshot
+import trends
+from utils import facilities_query_mask, encode_choice, DIRECTIONS, RENT_TYPES
+from search_index import search_index
+from facet_index import facet_index
+from location import location_index
+from read_model import card_query
+from database import read_engine
+import export
+import autocomplete
+import saved_search
+from auth import authenticate, current_user, hash_password, login_user
+import logging
 
 # 1. 从页面路由文件中导入 'pages' 蓝图
-from index_page import pages
+from index_page import pages, get_hot_houses
+# 注册命令行工具 (数据回填等)
+import commands  # noqa: F401
+# 启动预热和健康检查接口 (/health/live、/health/ready)
+from warmup import warmup
+from instrumentation import configure_logging
+
+logger = logging.getLogger(__name__)
 
 # 2. 创建一个名为 'api' 的新蓝图，用于处理所有后端数据接口
 api = Blueprint('api', __name__)
 
 
-# --- 辅助函数 ---
-def house_to_dict(house):
-    """将House对象转换为可序列化为JSON的字典"""
-    return {
-        'id': house.id,
-        'title': house.title or f"{house.address} {house.rooms}",  # 确保title不为空
-        'region': house.region,
-        'block': house.block,
-        'address': house.address,
-        'rooms': house.rooms,
-        'price': house.price,
-        'page_views': house.page_views
-    }
+# --- 3. 定义 'api' 蓝图的所有路由 ---
 
+# --- 房源检索的筛选条件 ---
+# 检索参数 (保存检索条件时只保留这些参数)
+SEARCH_PARAMS = ('keyword', 'region', 'area', 'price', 'rooms', 'rent_type', 'direction', 'facilities')
 
-def clean_price(price_str):
-    """从价格字符串（如 '3500元/月'）中提取数值"""
-    if not price_str:
-        return 0
-    match = re.search(r'(\d+)', str(price_str))
-    return float(match.group(1)) if match else 0
 
+def parse_range(range_str):
+    """'下限-上限' 格式的价格/面积区间，格式不正确时抛出 ValueError"""
+    low, high = map(int, range_str.split('-'))
+    return low, high
 
-def parse_area(area_str):
-    """从面积字符串 (如 '75平米') 中提取数值"""
-    if not area_str:
-        return 0
-    match = re.search(r'(\d+)', str(area_str))
-    return float(match.group(1)) if match else 0
 
+def search_range_filters(args):
+    """关键词、区域、面积和价格筛选 (在数据库端执行)，区间格式不正确时抛出 ValueError"""
+    keyword = args.get('keyword')
+    region = args.get('region')
+    area_range_str = args.get('area')
+    price_range_str = args.get('price')
 
-def build_location_query_filter(region_str):
+    filters = []
+    # 关键词通过 n-gram 倒排索引得到候选房源；区域是已知的区名时使用区编号等值查询，否则按关键词匹配
+    if keyword:
+        filters.append(search_index.keyword_filter(keyword, ('title', 'address', 'block')))
+    if region:
+        region_filters = location_index.filters(*parse_location(region)) if location_index.resolve(region) else None
+        filters.extend(region_filters or [search_index.keyword_filter(region, ('region',))])
+    # 价格和面积使用预先解析好的数值列，在数据库端完成范围筛选
+    if area_range_str:
+        min_area, max_area = parse_range(area_range_str)
+        filters.extend([House.area_value > 0, House.area_value >= min_area, House.area_value < max_area])
+    if price_range_str:
+        min_price, max_price = parse_range(price_range_str)
+        filters.extend([House.price_value > 0, House.price_value >= min_price, House.price_value < max_price])
+    return filters
+
+
+def search_facet_scope(args):
     """
-    【优化】根据'区-街道-小区'格式的字符串构建更精确的查询条件
+    关键词、区域、面积和价格条件对应的分面索引参数 (与 search_range_filters 的规则一致)，区间格式不正确时抛出 ValueError
+    关键词和无法按位置编号筛选的区域使用搜索索引中的房源ID，位置和价格/面积由分面索引的位图筛选
     """
-    parts = region_str.split('-')
-    region_part = parts[0].replace('区', '') if len(parts) > 0 else ''
-    block_part = parts[1] if len(parts) > 1 else ''
-    address_part = parts[2] if len(parts) > 2 else ''
-
-    conditions = []
-    if region_part:
-        conditions.append(House.region.like(f"%{region_part}%"))
-    if block_part:
-        conditions.append(House.block.like(f"%{block_part}%"))
-    if address_part:
-        conditions.append(House.address.like(f"%{address_part}%"))
+    keyword = args.get('keyword')
+    region = args.get('region')
+    scope = {}
+    candidate_ids = None
+    if keyword:
+        candidate_ids = set(search_index.search(keyword, ('title', 'address', 'block')))
+    if region:
+        location = location_index.match(*parse_location(region)) if location_index.resolve(region) else None
+        if location is not None:
+            scope['location'] = location
+        else:
+            region_ids = set(search_index.search(region, ('region',)))
+            candidate_ids = region_ids if candidate_ids is None else candidate_ids & region_ids
+    if args.get('area'):
+        scope['area_range'] = parse_range(args['area'])
+    if args.get('price'):
+        scope['price_range'] = parse_range(args['price'])
+    scope['candidate_ids'] = candidate_ids
+    return scope
+
+
+def search_facet_selection(args):
+    """户型、租住类型、朝向和配套设施 (多个设施用逗号分隔) 的筛选值，有无法识别的取值时返回 None"""
+    facilities = [name.strip() for name in args.get('facilities', '').split(',') if name.strip()]
+    selection = {
+        'rooms': args.get('rooms') or None,
+        'rent_type_code': encode_choice(args.get('rent_type'), RENT_TYPES) if args.get('rent_type') else None,
+        'direction_code': encode_choice(args.get('direction'), DIRECTIONS) if args.get('direction') else None,
+        'facilities_mask': facilities_query_mask(facilities),
+    }
+    if selection['facilities_mask'] is None or 0 in (selection['rent_type_code'], selection['direction_code']):
+        return None
+    return selection
 
-    return and_(*conditions)
 
+def search_facet_filters(selection):
+    """分面筛选值对应的数据库查询条件 (使用编码列和设施位掩码)"""
+    filters = []
+    rooms = selection['rooms']
+    if rooms:
+        if rooms == '4室及以上':
+            filters.append(House.rooms.like('4室%') | House.rooms.like('5室%') | House.rooms.like('6室%'))
+        else:
+            filters.append(House.rooms == rooms)
+    if selection['rent_type_code'] is not None:
+        filters.append(House.rent_type_code == selection['rent_type_code'])
+    if selection['direction_code'] is not None:
+        filters.append(House.direction_code == selection['direction_code'])
+    mask = selection['facilities_mask']
+    if mask:
+        filters.append(House.facilities_mask.op('&')(mask) == mask)
+    return filters
 
-# --- 3. 定义 'api' 蓝图的所有路由 ---
 
 # --- 房源检索API (已升级，支持分页) ---
 @api.route('/search', methods=['GET'])
 def search_houses():
     # 1. 获取所有筛选条件 (从 GET 请求的 URL 参数中获取)
     page = request.args.get('page', 1, type=int)
-    keyword = request.args.get('keyword')
-    region = request.args.get('region')
-    rooms = request.args.get('rooms')
-    rent_type = request.args.get('rent_type')
-    area_range_str = request.args.get('area')
-    price_range_str = request.args.get('price')
-
-    # 2. 构建基础数据库查询
-    query = House.query
-    if keyword:
-        search_term = f'%{keyword}%'
-        query = query.filter(or_(
-            House.title.like(search_term),
-            House.address.like(search_term),
-            House.block.like(search_term)
-        ))
-    if region:
-        search_term = f'%{region}%'
-        query = query.filter(House.region.like(search_term))
-
-    if rooms:
-        if rooms == '4室及以上':
-            query = query.filter(House.rooms.like('4室%') | House.rooms.like('5室%') | House.rooms.like('6室%'))
-        else:
-            query = query.filter(House.rooms == rooms)
-
-    if rent_type:
-        query = query.filter(House.rent_type == rent_type)
-
-    # 【注意】由于面积和价格是文本，无法在数据库层面高效分页。
-    # 我们先获取所有符合主要条件的房源。
-    initial_results = query.all()
-
-    # 3. 在内存中进行价格和面积的二次筛选
-    final_results = []
-    min_area, max_area = map(int, area_range_str.split('-')) if area_range_str else (None, None)
-    min_price, max_price = map(int, price_range_str.split('-')) if price_range_str else (None, None)
-
-    for house in initial_results:
-        area_ok = not min_area or (min_area <= parse_area(house.area) < max_area if parse_area(house.area) else False)
-        price_ok = not min_price or (
-            min_price <= clean_price(house.price) < max_price if clean_price(house.price) else False)
-        if area_ok and price_ok:
-            final_results.append(house)
+    selection = search_facet_selection(request.args)
+    try:
+        range_filters = search_range_filters(request.args)
+    except ValueError:
+        return jsonify(code=0, msg='无法识别的价格或面积区间')
+
+    # 2. 构建基础数据库查询 (只查询结果卡片需要的列)
+    query = card_query().filter(*range_filters)
+    if selection is None:
+        query = query.filter(false())
+    else:
+        query = query.filter(*search_facet_filters(selection))
 
-    # 4. 手动对内存中的结果进行分页
+    # 3. 在数据库端分页 (LIMIT/OFFSET)，只加载当前页的房源
     per_page = 9
-    total_items = len(final_results)
-    start = (page - 1) * per_page
-    end = start + per_page
-    items_on_page = final_results[start:end]
-
-    # 创建一个简单的分页对象，模拟 Flask-SQLAlchemy 的分页对象
-    from math import ceil
-    pagination = SimpleNamespace(
-        items=items_on_page,
-        page=page,
-        per_page=per_page,
-        total=total_items,
-        pages=ceil(total_items / per_page)
-    )
+    pagination = query.order_by(House.id).paginate(page=page, per_page=per_page, error_out=False)
 
-    user = User.query.filter(User.name == session.get('user_name')).first() if 'user_name' in session else None
+    user = current_user()
 
     # 【修复】创建一个干净的参数字典用于分页链接，移除旧的 'page' 参数
     pagination_args = request.args.copy()
@@ -153,16 +172,32 @@ def search_houses():
     )
 
 
+@api.route('/search/facets', methods=['GET'])
+def search_facets():
+    """
+    检索页的分面统计：按与 /api/search 相同的筛选条件，返回各户型/租住类型/朝向/配套设施的房源数量
+    全部条件都在内存索引中完成筛选和计数，不查询数据库
+    """
+    selection = search_facet_selection(request.args)
+    if selection is None:
+        return jsonify(code=0, msg='无法识别的筛选条件')
+    try:
+        scope = search_facet_scope(request.args)
+    except ValueError:
+        return jsonify(code=0, msg='无法识别的价格或面积区间')
+    return jsonify(code=1, data=facet_index.facets(**scope, **selection))
+
+
 # --- 搜索功能API (首页搜索框使用) ---
 @api.route('/search/recommendations')
 def search_recommendations():
     """获取热门推荐房源（用于点击搜索框时显示）"""
-    hot_houses = House.query.order_by(House.page_views.desc()).limit(10).all()
-    houses_dict = [house_to_dict(h) for h in hot_houses]
+    houses_dict = get_hot_houses(10)
     return jsonify(code=1, data=houses_dict)
 
 
 @api.route('/search/keyword/', methods=['POST'])
+@limiter.limit('autocomplete')
 def search_keyword():
     """根据关键词实时搜索房源"""
     keyword = request.form.get('kw', '')
@@ -171,19 +206,15 @@ def search_keyword():
     if not keyword:
         return jsonify(code=0, msg='关键词为空')
 
-    query = House.query
-    search_term = f'%{keyword}%'
     if '地区' in info_type:
-        query = query.filter(or_(
-            House.region.like(search_term),
-            House.block.like(search_term),
-            House.address.like(search_term)
-        ))
+        scope = 'region'
     elif '户型' in info_type:
-        query = query.filter(House.rooms.like(search_term))
+        scope = 'rooms'
+    else:
+        scope = 'all'
 
-    results = query.limit(10).all()
-    houses_dict = [house_to_dict(h) for h in results]
+    # 从倒排索引中取出相关度最高的10个房源 (结果短时间缓存，并发的相同请求只查询一次)
+    houses_dict = autocomplete.lookup(keyword, scope)
 
     if not houses_dict:
         return jsonify(code=0, msg=f'未找到关于 "{keyword}" 的房屋信息！')
@@ -196,10 +227,12 @@ def search_keyword():
 def login():
     username = request.form.get('username')
     password = request.form.get('password')
-    user = User.query.filter_by(name=username, password=password).first()
-    if user:
-        session['user_id'] = user.id
-        session['user_name'] = user.name
+    user = User.query.filter_by(name=username).first() if username else None
+    if authenticate(user, password):
+        # 旧的明文密码在登录成功时升级为哈希
+        if db.session.is_modified(user):
+            db.session.commit()
+        login_user(user)
     return redirect(url_for('pages.index'))
 
 
@@ -210,11 +243,10 @@ def register():
     email = request.form.get('email')
     if User.query.filter_by(name=username).first():
         return redirect(url_for('pages.index'))
-    new_user = User(name=username, password=password, email=email)
+    new_user = User(name=username, password=hash_password(password or ''), email=email)
     db.session.add(new_user)
     db.session.commit()
-    session['user_id'] = new_user.id
-    session['user_name'] = new_user.name
+    login_user(new_user)
     return redirect(url_for('pages.index'))
 
 
@@ -229,31 +261,30 @@ def logout():
 def add_collection(house_id):
     if 'user_id' not in session:
         return jsonify(valid='0', msg='请先登录！')
-    user = User.query.get(session['user_id'])
-    collect_ids = user.collect_id.split(',') if user.collect_id else []
-    if str(house_id) not in collect_ids:
-        collect_ids.append(str(house_id))
-        user.collect_id = ','.join(filter(None, collect_ids))
+    user_id = session['user_id']
+    if UserCollection.query.filter_by(user_id=user_id, house_id=house_id).first():
+        return jsonify(valid='0', msg='您已收藏过该房源！')
+    db.session.add(UserCollection(user_id=user_id, house_id=house_id))
+    try:
         db.session.commit()
-        return jsonify(valid='1', msg='收藏成功！')
-    else:
+    except IntegrityError:
+        # 并发重复收藏时由唯一索引拦截
+        db.session.rollback()
         return jsonify(valid='0', msg='您已收藏过该房源！')
+    return jsonify(valid='1', msg='收藏成功！')
 
 
 @api.route('/collect_off', methods=['POST'])
 def collect_off():
-    house_id = request.form.get('house_id')
+    house_id = request.form.get('house_id', type=int)
     user_name = request.form.get('user_name')
-    if session.get('user_name') != user_name:
+    if session.get('user_name') != user_name or 'user_id' not in session:
         return jsonify(valid='0', msg='用户验证失败！')
-    user = User.query.filter_by(name=user_name).first()
-    if not user or not user.collect_id:
+    if house_id is None:
         return jsonify(valid='0', msg='操作失败！')
-    collect_ids = user.collect_id.split(',')
-    if house_id in collect_ids:
-        collect_ids.remove(house_id)
-        user.collect_id = ','.join(collect_ids)
-        db.session.commit()
+    deleted = UserCollection.query.filter_by(user_id=session['user_id'], house_id=house_id).delete()
+    db.session.commit()
+    if deleted:
         return jsonify(valid='1', msg='已取消收藏')
     return jsonify(valid='0', msg='未找到该收藏记录')
 
@@ -261,21 +292,19 @@ def collect_off():
 @api.route('/del_record', methods=['POST'])
 def del_record():
     user_name = request.form.get('user_name')
-    if session.get('user_name') != user_name:
+    if session.get('user_name') != user_name or 'user_id' not in session:
         return jsonify(valid='0', msg='用户验证失败！')
-    user = User.query.filter_by(name=user_name).first()
-    if user:
-        user.seen_id = ''
-        db.session.commit()
-        return jsonify(valid='1', msg='浏览记录已清空')
-    return jsonify(valid='0', msg='操作失败')
+    UserViewHistory.query.filter_by(user_id=session['user_id']).delete()
+    db.session.commit()
+    return jsonify(valid='1', msg='浏览记录已清空')
 
 
 @api.route('/modify/userinfo/<string:field>', methods=['POST'])
 def modify_userinfo(field):
-    if 'user_name' not in session:
+    principal = current_user()
+    if principal is None:
         return jsonify(ok='0')
-    user = User.query.filter_by(name=session['user_name']).first()
+    user = db.session.get(User, principal.id)
     if not user:
         return jsonify(ok='0')
     if field == 'name':
@@ -287,7 +316,7 @@ def modify_userinfo(field):
     elif field == 'addr':
         user.addr = request.form.get('addr')
     elif field == 'pd':
-        user.password = request.form.get('pd')
+        user.password = hash_password(request.form.get('pd') or '')
     elif field == 'email':
         user.email = request.form.get('email')
     else:
@@ -296,104 +325,296 @@ def modify_userinfo(field):
     return jsonify(ok='1')
 
 
-# --- 图表数据API (已修正查询逻辑) ---
-@api.route('/get/scatterdata/<region>')
-def get_scatter_data(region):
-    print(f"--- [散点图] 正在查询复合区域: {region} ---")
-    location_filter = build_location_query_filter(region)
-    query = House.query.filter(location_filter).limit(100).all()
-    print(f"[散点图] 数据库查询到 {len(query)} 条原始记录")
-    data = []
-    for house in query:
-        try:
-            area_match = re.search(r'(\d+(\.\d+)?)', str(house.area))
-            if area_match:
-                area = float(area_match.group(1))
-                price = clean_price(house.price)
-                if area > 0 and price > 0:
-                    data.append([area, price])
-        except (ValueError, TypeError, AttributeError):
-            continue
-    print(f"[散点图] 清洗后得到 {len(data)} 条有效数据")
-    return jsonify(data=data)
+# --- 保存的检索条件API ---
+@api.route('/saved_searches', methods=['GET'])
+def list_saved_searches():
+    principal = current_user()
+    if principal is None:
+        return jsonify(code=0, msg='请先登录！')
+    searches = SavedSearch.query.filter_by(user_id=principal.id).order_by(SavedSearch.created_at.desc()).all()
+    return jsonify(code=1, data=[
+        {'id': s.id, 'name': s.name, 'params': s.params, 'created_at': s.created_at,
+         'url': f"{url_for('api.search_houses')}?{s.params}"}
+        for s in searches
+    ])
 
 
-@api.route('/get/piedata/<region>')
-def get_pie_data(region):
-    print(f"--- [饼图] 正在查询复合区域: {region} ---")
-    location_filter = build_location_query_filter(region)
-    query_result = db.session.query(
-        House.rooms, func.count(House.id)
-    ).filter(
-        location_filter
-    ).group_by(House.rooms).order_by(func.count(House.id).desc()).limit(5).all()
-    print(f"[饼图] 数据库查询到 {len(query_result)} 条分组记录")
-    data = [{'value': count, 'name': rooms} for rooms, count in query_result if rooms]
-    print(f"[饼图] 清洗后得到 {len(data)} 条有效数据")
-    return jsonify(data=data)
+@api.route('/saved_searches', methods=['POST'])
+def save_search():
+    """
+    保存检索条件 (参数与 /api/search 相同)，之后新发布或更新的房源满足条件时，会出现在个人主页的新房源列表中
+    条件在保存时解析为编码后的字段，匹配房源时不再解析参数
+    """
+    principal = current_user()
+    if principal is None:
+        return jsonify(code=0, msg='请先登录！')
+    params = {name: request.values.get(name, '').strip() for name in SEARCH_PARAMS}
+    params = {name: value for name, value in params.items() if value}
+    if not params:
+        return jsonify(code=0, msg='检索条件为空')
+    selection = search_facet_selection(params)
+    try:
+        min_price, max_price = parse_range(params['price']) if 'price' in params else (None, None)
+        min_area, max_area = parse_range(params['area']) if 'area' in params else (None, None)
+    except ValueError:
+        selection = None
+    if selection is None:
+        return jsonify(code=0, msg='无法识别的筛选条件')
+
+    normalized = urlencode(sorted(params.items()))
+    existing = SavedSearch.query.filter_by(user_id=principal.id, params=normalized).first()
+    if existing:
+        return jsonify(code=1, msg='已保存过该检索条件', data={'id': existing.id})
+    if SavedSearch.query.filter_by(user_id=principal.id).count() >= saved_search.MAX_SAVED_SEARCHES:
+        return jsonify(code=0, msg=f'最多保存 {saved_search.MAX_SAVED_SEARCHES} 个检索条件')
+    search = SavedSearch(
+        user_id=principal.id,
+        name=(request.values.get('name') or ' '.join(params.values()))[:100],
+        params=normalized,
+        keyword=params.get('keyword'),
+        region=params.get('region'),
+        rooms=selection['rooms'],
+        rent_type_code=selection['rent_type_code'],
+        direction_code=selection['direction_code'],
+        facilities_mask=selection['facilities_mask'],
+        min_price=min_price, max_price=max_price,
+        min_area=min_area, max_area=max_area,
+    )
+    db.session.add(search)
+    db.session.commit()
+    return jsonify(code=1, msg='检索条件已保存', data={'id': search.id})
+
+
+@api.route('/saved_searches/<int:search_id>/delete', methods=['POST'])
+def delete_saved_search(search_id):
+    principal = current_user()
+    if principal is None:
+        return jsonify(code=0, msg='请先登录！')
+    search = SavedSearch.query.filter_by(id=search_id, user_id=principal.id).first()
+    if search is None:
+        return jsonify(code=0, msg='未找到该检索条件')
+    SavedSearchMatch.query.filter_by(search_id=search.id).delete()
+    db.session.delete(search)
+    db.session.commit()
+    cache.invalidate('saved_search_matches', principal.id)
+    return jsonify(code=1, msg='检索条件已删除')
 
 
-@api.route('/get/columndata/<region>')
-def get_column_data(region):
-    print(f"--- [柱状图] 正在查询复合区域: {region} ---")
-    location_filter = build_location_query_filter(region)
-    top_communities_subquery = db.session.query(
-        House.address, func.count(House.id).label('house_count')
-    ).filter(
-        location_filter, House.address.isnot(None)
-    ).group_by(House.address).order_by(func.count(House.id).desc()).limit(5).subquery()
+# --- 图表数据API (读取预聚合的区域统计数据) ---
+def chart_cache_key(region, chart):
+    """图表缓存键以区名开头，便于某个区的数据变化时按前缀失效"""
+    return '|'.join(parse_location(region) + (chart,))
 
-    top_communities = db.session.query(top_communities_subquery).all()
-    print(f"[柱状图] 查询到 {len(top_communities)} 个热门小区")
 
-    if not top_communities:
-        return jsonify(data={'x_axis': [], 'y_axis': []})
+def chart_source():
+    """图表数据来源：安装了 NumPy 时在列式快照上实时计算，否则读取预聚合的统计表"""
+    return chart_snapshot if chart_snapshot.available else region_stats
 
-    community_names = [c.address for c in top_communities]
-    houses_in_top_communities = db.session.query(House).filter(
-        location_filter, House.address.in_(community_names)
-    ).all()
 
-    community_prices = {name: [] for name in community_names}
-    for house in houses_in_top_communities:
-        price = clean_price(house.price)
-        if price > 0 and house.address in community_prices:
-            community_prices[house.address].append(price)
+# 统计表只在作为图表数据来源时才随房源变化增量维护 (使用列式快照时由 flask build-analytics 全量重建)
+if chart_source() is region_stats:
+    subscribe_region_stats()
 
-    x_axis = list(community_prices.keys())
-    y_axis = [round(sum(prices) / len(prices), 2) if prices else 0 for prices in community_prices.values()]
 
-    print(f"[柱状图] 计算出 {len(x_axis)} 个小区的平均价格")
-    return jsonify(data={'x_axis': x_axis, 'y_axis': y_axis})
+# 饼图展示的户型数量、折线图展示的户型
+PIE_ROOMS_LIMIT = 5
+BROKEN_LINE_ROOMS = ['2室1厅', '3室1厅']
+# 图表面板接口一次最多查询的位置数量
+MAX_DASHBOARD_REGIONS = 20
 
 
-@api.route('/get/brokenlinedata/<region>')
-def get_broken_line_data(region):
-    print(f"--- [折线图] 正在查询复合区域: {region} ---")
-    location_filter = build_location_query_filter(region)
-    room_types = ['2室1厅', '3室1厅']
-    series = []
+def pie_payload(rooms_counts):
+    return [{'value': count, 'name': rooms} for rooms, count in rooms_counts]
 
-    for room_type in room_types:
-        query = db.session.query(House.price).filter(
-            location_filter,
-            House.rooms == room_type
-        ).order_by(House.publish_time.asc()).all()
 
-        print(f"[折线图] 查询到 '{room_type}' {len(query)} 条记录")
-        prices = [clean_price(p[0]) for p in query if clean_price(p[0]) > 0]
+def column_payload(top_addresses):
+    x_axis = [name for name, _, _ in top_addresses]
+    y_axis = [avg_price for _, _, avg_price in top_addresses]
+    return {'x_axis': x_axis, 'y_axis': y_axis}
 
-        if prices:
-            series.append({'name': room_type, 'type': 'line', 'data': prices})
 
+def broken_line_payload(price_series):
+    series = [{'name': room_type, 'type': 'line', 'data': prices}
+              for room_type, prices in price_series.items() if prices]
     max_len = max((len(s['data']) for s in series), default=0)
     x_axis_labels = [f"数据点 {i + 1}" for i in range(max_len)]
 
-    return jsonify(data={
+    return {
         'legend': [s['name'] for s in series],
         'x_axis': x_axis_labels,
         'series': series
-    })
+    }
+
+
+@api.route('/get/scatterdata/<region>')
+def get_scatter_data(region):
+    def load():
+        logger.debug('[散点图] 正在查询复合区域', extra={'chart': 'scatter', 'region': region})
+        data = chart_source().scatter_points(region)
+        logger.info('[散点图] 得到 %d 条有效数据', len(data), extra={'chart': 'scatter', 'region': region})
+        return data
+
+    return jsonify(data=cache.get_or_set('charts', chart_cache_key(region, 'scatter'), load))
+
+
+@api.route('/get/piedata/<region>')
+def get_pie_data(region):
+    def load():
+        logger.debug('[饼图] 正在查询复合区域', extra={'chart': 'pie', 'region': region})
+        data = pie_payload(chart_source().rooms_counts(region, PIE_ROOMS_LIMIT))
+        logger.info('[饼图] 得到 %d 条有效数据', len(data), extra={'chart': 'pie', 'region': region})
+        return data
+
+    return jsonify(data=cache.get_or_set('charts', chart_cache_key(region, 'pie'), load))
+
+
+@api.route('/get/columndata/<region>')
+def get_column_data(region):
+    def load():
+        logger.debug('[柱状图] 正在查询复合区域', extra={'chart': 'column', 'region': region})
+        top_addresses = chart_source().top_addresses(region)
+        logger.info('[柱状图] 查询到 %d 个热门小区', len(top_addresses), extra={'chart': 'column', 'region': region})
+        return column_payload(top_addresses)
+
+    return jsonify(data=cache.get_or_set('charts', chart_cache_key(region, 'column'), load))
+
+
+@api.route('/get/brokenlinedata/<region>')
+def get_broken_line_data(region):
+    def load():
+        logger.debug('[折线图] 正在查询复合区域', extra={'chart': 'broken_line', 'region': region})
+        price_series = chart_source().price_series(region, BROKEN_LINE_ROOMS)
+        for room_type, prices in price_series.items():
+            logger.info("[折线图] 查询到 '%s' %d 条记录", room_type, len(prices),
+                        extra={'chart': 'broken_line', 'region': region, 'rooms': room_type})
+        return broken_line_payload(price_series)
+
+    return jsonify(data=cache.get_or_set('charts', chart_cache_key(region, 'broken_line'), load))
+
+
+def load_dashboard(region):
+    """一个位置的四个图表数据 (与各图表接口返回的结构相同)，位置只筛选一次"""
+    def load():
+        charts = chart_source().dashboard(region, PIE_ROOMS_LIMIT, BROKEN_LINE_ROOMS)
+        logger.info('[图表面板] 得到 %d 个散点、%d 个热门小区', len(charts['scatter']), len(charts['top_addresses']),
+                    extra={'chart': 'dashboard', 'region': region})
+        return {
+            'scatter': charts['scatter'],
+            'pie': pie_payload(charts['rooms']),
+            'column': column_payload(charts['top_addresses']),
+            'broken_line': broken_line_payload(charts['price_series']),
+        }
+
+    return cache.get_or_set('charts', chart_cache_key(region, 'dashboard'), load)
+
+
+@api.route('/get/dashboard/<region>')
+def get_dashboard(region):
+    """区域分析页的全部图表数据 (散点图、饼图、柱状图、折线图) 一次返回"""
+    return jsonify(data=load_dashboard(region))
+
+
+@api.route('/get/dashboard')
+def get_dashboards():
+    """多个位置的图表数据 (对比视图)：?region=朝阳&region=海淀-望京，或 ?regions=朝阳,海淀-望京"""
+    regions = request.args.getlist('region') or request.args.get('regions', '').split(',')
+    regions = list(dict.fromkeys(r.strip() for r in regions if r.strip()))
+    if not regions:
+        return jsonify(code=0, msg='请指定位置'), 400
+    if len(regions) > MAX_DASHBOARD_REGIONS:
+        return jsonify(code=0, msg=f'一次最多查询 {MAX_DASHBOARD_REGIONS} 个位置'), 400
+    return jsonify(data={region: load_dashboard(region) for region in regions})
+
+
+@api.route('/get/trend/<region>')
+def get_price_trend(region):
+    """
+    价格走势：按天/周/月聚合的中位数、平均价格和 P90，x 轴为真实日期，返回的点数有上限
+    参数：rooms (户型，默认全部)、granularity (day/week/month)、points (时间桶数量)、window (滚动窗口大小)
+    """
+    rooms = request.args.get('rooms', '')
+    granularity = request.args.get('granularity', 'week')
+    if granularity not in trends.GRANULARITIES:
+        return jsonify(code=0, msg='granularity 只支持 day、week 或 month'), 400
+    points = min(max(request.args.get('points', 26, type=int), 1), trends.MAX_POINTS)
+    window = min(max(request.args.get('window', 1, type=int), 1), trends.MAX_WINDOW)
+    region_part = parse_location(region)[0]
+
+    def load():
+        with read_engine(db).connect() as conn:
+            return trends.load_trend(conn, region_part, rooms, granularity, points, window)
+
+    key = chart_cache_key(region_part, f'trend:{rooms}:{granularity}:{points}:{window}')
+    return jsonify(data=cache.get_or_set('charts', key, load))
+
+
+@api.route('/stream/scatterdata/<region>')
+@limiter.limit('export')
+def stream_scatter_data(region):
+    """
+    散点图的流式版本：返回该位置的数据点 (不限于预聚合的100个抽样点)，边查询边输出
+    与房源导出相同，需要登录、按用户限流，最多返回 EXPORT_MAX_ROWS 个数据点
+    """
+    if current_user() is None:
+        return jsonify(code=0, msg='请先登录！')
+    stmt = export.scatter_statement(region).limit(app.config['EXPORT_MAX_ROWS'])
+    rows = export.iter_rows(read_engine(db), stmt)
+    return Response(export.stream_scatter(rows), mimetype='application/json')
+
+
+# --- 位置API (区 -> 街道 -> 小区，直接读取内存中的位置索引) ---
+@api.route('/get/locations')
+def get_locations():
+    """图表下钻菜单：parent 为空时返回全部区，为 '区' 或 '区-街道' 时返回下一级位置"""
+    children = location_index.children(request.args.get('parent', ''))
+    if children is None:
+        return jsonify(code=0, msg='未找到该位置'), 404
+    return jsonify(code=1, data=children)
+
+
+@api.route('/get/locations/suggest')
+def suggest_locations():
+    """位置输入联想：返回名称以 q 开头的区/街道/小区，path 可以直接用于图表接口"""
+    prefix = request.args.get('q', '').strip()
+    if not prefix:
+        return jsonify(code=0, msg='关键词为空')
+    return jsonify(code=1, data=location_index.suggest(prefix))
+
+
+# --- 房源导出API (流式输出，内存占用与导出的行数无关) ---
+@api.route('/export/houses')
+@limiter.limit('export')
+def export_houses():
+    """导出房源 (需要登录，按用户限流)，一次最多导出 EXPORT_MAX_ROWS 行，limit 参数可以指定更少的行数"""
+    if current_user() is None:
+        return jsonify(code=0, msg='请先登录！')
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify(code=0, msg='format 只支持 ndjson 或 csv'), 400
+    max_rows = app.config['EXPORT_MAX_ROWS']
+    limit = min(max(request.args.get('limit', max_rows, type=int), 1), max_rows)
+    stmt = export.export_statement(
+        region=request.args.get('region'),
+        block=request.args.get('block'),
+        rooms=request.args.get('rooms'),
+        price_range=export.parse_range(request.args.get('price')),
+        area_range=export.parse_range(request.args.get('area')),
+    ).limit(limit)
+    rows = export.iter_rows(read_engine(db), stmt)
+    # 不设置 Content-Length，响应以 chunked 方式传输
+    if fmt == 'csv':
+        body, mimetype = export.stream_csv(rows), 'text/csv; charset=utf-8'
+    else:
+        body, mimetype = export.stream_ndjson(rows), 'application/x-ndjson; charset=utf-8'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=houses.{fmt}'})
+
+
+@api.route('/cache/stats')
+def cache_stats():
+    """查看缓存命中/未命中统计 (与 /metrics 相同，只对内部开放)"""
+    instrumentation.check_access()
+    return jsonify(cache.stats())
 
 
 # --- 4. 最后，将配置完成的蓝图注册到主应用 ---
@@ -401,6 +622,9 @@ app.register_blueprint(pages)
 app.register_blueprint(api, url_prefix='/api')
 
 if __name__ == '__main__':
+    # 开发服务器：后台预热，生产环境请使用 wsgi.py (见 gunicorn.conf.py)
+    configure_logging(app)
+    warmup.start(background=True)
     app.run(debug=True)
 
 
@@ -0,0 +1,259 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# 构建结果输出到 static 下的子目录 (文件名带内容哈希)
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# 不参与构建的目录
+SKIP_DIRS = ('dist', 'scss')
+# 只保留 woff2/woff 两种字体格式 (所有现代浏览器都支持)，其余格式不再输出，CSS 中对应的引用一并删除
+DROPPED_FONT_FORMATS = ('.eot', '.ttf', '.svg', '.otf')
+FONT_DIRS = ('fonts', 'webfonts')
+# 生成 gzip/brotli 预压缩版本的文件类型 (图片和 woff/woff2 本身已经压缩)
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.ico', '.txt')
+MIN_COMPRESS_SIZE = 1024
+HASH_LENGTH = 10
+
+# 按页面合并的资源: 合并后的文件名 -> 按顺序合并的源文件
+BUNDLES = {
+    'css/detail.bundle.css': ('css/all.css', 'css/clean-blog.min.css'),
+    'css/list.bundle.css': ('css/bootstrapValidator.min.css', 'css/font-awesome.min.css',
+                            'css/clean-blog.min.css', 'css/zxf_page.css'),
+    'js/site.bundle.js': ('js/bootstrapValidator.min.js', 'js/login.js', 'js/clean-blog.min.js'),
+    'js/list.bundle.js': ('js/bootstrapValidator.min.js', 'js/login.js', 'js/zxf_page.js',
+                          'js/clean-blog.min.js'),
+    'js/detail-charts.bundle.js': ('js/infographic.js', 'js/show_data_pie.js', 'js/f_data.js',
+                                   'js/show_column_data.js', 'js/show_broken_line_data.js'),
+}
+
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+FONT_SRC_RE = re.compile(r'src\s*:\s*([^;}]*)(;?)')
+
+
+# --- 压缩 ---
+def minify_css(text):
+    """CSS 压缩：安装了 rcssmin 时使用，否则只删除注释和多余的空白"""
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    text = re.sub(r'/\*(?!!).*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """JS 压缩：需要安装 rjsmin，未安装时原样输出 (不做不安全的文本替换)"""
+    return rjsmin.jsmin(text) if rjsmin is not None else text
+
+
+def _url_path(url):
+    return url.split('#', 1)[0].split('?', 1)[0]
+
+
+def drop_font_formats(css):
+    """删除 @font-face 中 eot/ttf/svg 格式的字体引用，只剩这些格式的 src 声明整条删除"""
+    def replace(match):
+        entries = [entry.strip() for entry in match.group(1).split(',')]
+        kept = [entry for entry in entries
+                if not any(_url_path(url).lower().endswith(DROPPED_FONT_FORMATS)
+                           for _, url in CSS_URL_RE.findall(entry))]
+        if len(kept) == len(entries):
+            return match.group(0)
+        return f'src:{",".join(kept)}{match.group(2)}' if kept else ''
+    return FONT_SRC_RE.sub(replace, css)
+
+
+def rewrite_css_urls(css, source, output, manifest):
+    """把 CSS 中引用的本地文件改为带哈希的文件名 (相对于输出文件所在的目录)"""
+    source_dir = posixpath.dirname(source)
+    output_dir = posixpath.dirname(output)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/')):
+            return match.group(0)
+        path = _url_path(url)
+        target = manifest.get(posixpath.normpath(posixpath.join(source_dir, path)))
+        if target is None:
+            return match.group(0)
+        suffix = url[len(path):]
+        return f'url({quote}{posixpath.relpath(target, output_dir)}{suffix}{quote})'
+    return CSS_URL_RE.sub(replace, css)
+
+
+# --- 构建 ---
+def _sources(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder).replace(os.sep, '/')
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+            rel_root = ''
+        for name in files:
+            rel = posixpath.join(rel_root, name)
+            if rel_root.split('/')[0] in FONT_DIRS and name.lower().endswith(DROPPED_FONT_FORMATS):
+                continue
+            yield rel
+
+
+def _hashed_name(rel, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    base, ext = posixpath.splitext(rel)
+    return f'{base}.{digest}{ext}'
+
+
+def _emit(out_dir, rel, content, manifest):
+    """写出带哈希的文件及其 gzip/brotli 预压缩版本 (压缩后更小时才保留)"""
+    hashed = _hashed_name(rel, content)
+    path = os.path.join(out_dir, hashed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    if rel.lower().endswith(COMPRESSIBLE) and len(content) >= MIN_COMPRESS_SIZE:
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+    manifest[rel] = hashed
+    return hashed
+
+
+def _read(static_folder, rel):
+    with open(os.path.join(static_folder, rel), 'rb') as f:
+        return f.read()
+
+
+def _process_css(static_folder, rel, output, manifest):
+    text = _read(static_folder, rel).decode('utf-8')
+    text = rewrite_css_urls(drop_font_formats(text), rel, output, manifest)
+    return text if rel.endswith('.min.css') else minify_css(text)
+
+
+def _process_js(static_folder, rel):
+    text = _read(static_folder, rel).decode('utf-8')
+    return text if rel.endswith('.min.js') else minify_js(text)
+
+
+def build_assets(static_folder):
+    """
+    构建静态资源：压缩 CSS/JS、按页面合并、去掉旧字体格式，输出带内容哈希的文件名和预压缩版本，
+    并生成 manifest.json (源文件名 -> 带哈希的文件名)
+    字体和图片先输出，CSS 中的 url() 才能改写为带哈希的文件名；
+    旧版本的文件不删除，发布期间仍在使用旧页面 (或旧的页面片段缓存) 的客户端不受影响
+    """
+    out_dir = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    sources = sorted(_sources(static_folder))
+    for rel in sources:
+        if rel.endswith('.css'):
+            continue
+        content = _read(static_folder, rel)
+        if rel.endswith('.js'):
+            content = _process_js(static_folder, rel).encode('utf-8')
+        _emit(out_dir, rel, content, manifest)
+    for rel in sources:
+        if rel.endswith('.css'):
+            _emit(out_dir, rel, _process_css(static_folder, rel, rel, manifest).encode('utf-8'), manifest)
+    for name, members in BUNDLES.items():
+        if name.endswith('.css'):
+            parts = [_process_css(static_folder, rel, name, manifest) for rel in members]
+            content = '\n'.join(parts)
+        else:
+            # 每个脚本末尾补分号，避免合并后与下一个文件的开头连在一起
+            content = '\n;\n'.join(_process_js(static_folder, rel) for rel in members)
+        _emit(out_dir, name, content.encode('utf-8'), manifest)
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    return manifest
+
+
+# --- 运行时 ---
+class StaticAssets:
+    """
+    静态资源的地址和响应头：
+    模板中用 static_url('css/x.css') 代替 url_for('static', ...)，构建过的文件返回带哈希的地址 (/assets/...)，
+    按 Accept-Encoding 返回预压缩的 br/gzip 版本，并设置一年有效期的 immutable 缓存；
+    没有构建 (开发环境) 时退回 Flask 默认的静态文件地址
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.dist_folder = None
+        self.max_age = 31536000
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_ENABLED', True)
+        app.config.setdefault('ASSETS_MAX_AGE', 31536000)
+        self.max_age = app.config['ASSETS_MAX_AGE']
+        self.dist_folder = os.path.join(app.static_folder, DIST_DIR)
+        if app.config['ASSETS_ENABLED']:
+            self.load_manifest()
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals.update(static_url=self.static_url, bundle_urls=self.bundle_urls)
+
+    def load_manifest(self):
+        """读取构建生成的 manifest.json，不存在时使用原始文件"""
+        try:
+            with open(os.path.join(self.dist_folder, MANIFEST_NAME), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def static_url(self, filename):
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=hashed)
+
+    def bundle_urls(self, name):
+        """合并资源的地址：已构建时只有一个文件，否则依次返回各个源文件"""
+        if name in self.manifest:
+            return [self.static_url(name)]
+        return [self.static_url(rel) for rel in BUNDLES[name]]
+
+    def serve(self, filename):
+        if not self.manifest:
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accepted = request.accept_encodings
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[candidate] and os.path.isfile(os.path.join(self.dist_folder, filename + suffix)):
+                encoding = candidate
+                filename += suffix
+                break
+        response = send_from_directory(self.dist_folder, filename, mimetype=mimetype, max_age=self.max_age)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # 文件名包含内容哈希，内容变化时地址也会变化，浏览器在有效期内无需再验证
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
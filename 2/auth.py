@@ -0,0 +1,99 @@
+import base64
+import hashlib
+import hmac
+import os
+from collections import namedtuple
+
+from flask import current_app, session
+
+# 密码哈希格式: pbkdf2_sha256$迭代次数$盐$哈希 (盐和哈希为不带填充的 base64，总长度不超过 user_info.password 的 100 个字符)
+HASH_ALGORITHM = 'pbkdf2_sha256'
+DEFAULT_ITERATIONS = 260000
+SALT_BYTES = 16
+
+# 会话中保存的当前用户 (只有页面头部需要的字段)，渲染页面时不再查询 user_info
+Principal = namedtuple('Principal', ('id', 'name'))
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _iterations():
+    return current_app.config.get('PASSWORD_HASH_ITERATIONS', DEFAULT_ITERATIONS)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+
+def hash_password(password):
+    """生成加盐的密码哈希，迭代次数 (工作因子) 由 PASSWORD_HASH_ITERATIONS 配置"""
+    iterations = _iterations()
+    salt = os.urandom(SALT_BYTES)
+    return '$'.join((HASH_ALGORITHM, str(iterations), _b64encode(salt),
+                     _b64encode(_pbkdf2(password, salt, iterations))))
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(HASH_ALGORITHM + '$')
+
+
+def check_password(stored, password):
+    """校验密码；兼容尚未升级的明文密码"""
+    if not stored or password is None:
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+    try:
+        _, iterations, salt, expected = stored.split('$')
+        computed = _pbkdf2(password, _b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(_b64encode(computed), expected)
+
+
+def needs_rehash(stored):
+    """明文密码或迭代次数与当前配置不同的哈希，需要在登录成功后重新生成"""
+    if not is_hashed(stored):
+        return True
+    try:
+        return int(stored.split('$')[1]) != _iterations()
+    except (IndexError, ValueError):
+        return True
+
+
+def authenticate(user, password):
+    """
+    校验用户密码，成功时按需把旧的明文密码或弱哈希升级为当前配置的哈希 (由调用方提交)
+    用户不存在时也计算一次哈希，避免通过响应时间判断用户名是否存在
+    """
+    if user is None:
+        _pbkdf2(password or '', bytes(SALT_BYTES), _iterations())
+        return False
+    if not check_password(user.password, password):
+        return False
+    if needs_rehash(user.password):
+        user.password = hash_password(password)
+    return True
+
+
+# --- 会话中的当前用户 ---
+def login_user(user):
+    """登录：清空旧会话 (防止会话固定)，只在会话中保存用户ID和用户名"""
+    session.clear()
+    session['user_id'] = user.id
+    session['user_name'] = user.name
+
+
+def current_user():
+    """当前登录用户 (Principal)，未登录时返回 None；直接读取会话，不查询数据库"""
+    user_id = session.get('user_id')
+    user_name = session.get('user_name')
+    if user_id is None or not user_name:
+        return None
+    return Principal(user_id, user_name)
@@ -0,0 +1,65 @@
+from settings import cache
+from models import House
+from read_model import card_query
+from search_index import FIELDS, score_fields, search_index
+from utils import house_to_dict
+
+# 搜索框的查找范围 -> 参与匹配的房源字段
+SCOPE_FIELDS = {
+    'region': ('region', 'block', 'address'),
+    'rooms': ('rooms',),
+    'all': ('title', 'region', 'block', 'address', 'rooms'),
+}
+# 每个关键词缓存的候选房源数量上限：不超过该数量时缓存的是完整结果，更长的关键词可以直接在其中筛选
+CANDIDATE_LIMIT = 100
+RESULT_LIMIT = 10
+
+
+def _rank(entries, keyword, fields):
+    """对缓存的候选重新筛选排序，规则与 search_index.search 一致"""
+    scored = []
+    for doc, house in entries:
+        score = score_fields(zip(FIELDS, doc), keyword, fields)
+        if score:
+            scored.append((-score, house['id'], doc, house))
+    scored.sort(key=lambda item: item[:2])
+    return [(doc, house) for _, _, doc, house in scored]
+
+
+def _refine_from_prefix(scope, keyword, fields):
+    """
+    在已缓存的更短前缀的结果中筛选 (如 '京' -> '京西')
+    只使用完整的前缀结果：包含 '京西' 的字段一定包含 '京'，筛选结果与重新查询一致
+    """
+    for end in range(len(keyword) - 1, 0, -1):
+        parent = cache.peek('autocomplete', f'{scope}:{keyword[:end]}')
+        if parent is not None and parent['complete']:
+            return {'complete': True, 'entries': _rank(parent['entries'], keyword, fields)}
+    return None
+
+
+def _load(scope, keyword, fields):
+    refined = _refine_from_prefix(scope, keyword, fields)
+    if refined is not None:
+        return refined
+    house_ids = search_index.search(keyword, fields)
+    candidate_ids = house_ids[:CANDIDATE_LIMIT]
+    houses = {h.id: h for h in card_query().filter(House.id.in_(candidate_ids))} if candidate_ids else {}
+    entries = [
+        (tuple((getattr(houses[i], f) or '').lower() for f in FIELDS), house_to_dict(houses[i]))
+        for i in candidate_ids if i in houses
+    ]
+    return {'complete': len(house_ids) <= CANDIDATE_LIMIT, 'entries': entries}
+
+
+def lookup(keyword, scope='all'):
+    """
+    搜索框的实时联想：返回相关度最高的 RESULT_LIMIT 个房源字典
+    结果按 (范围, 关键词) 短时间缓存，同一关键词的并发请求只查询一次数据库
+    """
+    keyword = (keyword or '').strip().lower()
+    if not keyword:
+        return []
+    fields = SCOPE_FIELDS[scope]
+    result = cache.get_or_set('autocomplete', f'{scope}:{keyword}', lambda: _load(scope, keyword, fields))
+    return [house for _, house in result['entries'][:RESULT_LIMIT]]
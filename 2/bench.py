@@ -0,0 +1,367 @@
+"""
+压测脚本：生成模拟数据并对热点接口做基准测试
+
+    # 生成 10 万套房源的 SQLite 数据库，并用 Flask 测试客户端跑一遍所有场景
+    python bench.py --db sqlite:///bench.db --houses 100000 --seed-data
+
+    # 对已经启动的服务做并发 HTTP 压测
+    python bench.py --db sqlite:///bench.db --url http://127.0.0.1:5000 --concurrency 16 --requests 2000
+
+    # 与上一次的结果比较，p95 变慢超过 20% 时以非零状态退出
+    python bench.py --db sqlite:///bench.db --json result.json --baseline last.json --max-regression 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import utils
+
+# 各区及其街道 (北京)，区的权重决定房源数量的分布
+REGIONS = {
+    '朝阳区': (18, ['望京', '三里屯', '国贸', '酒仙桥', '双井', '劲松', '亚运村', '大屯']),
+    '海淀区': (16, ['中关村', '五道口', '上地', '学院路', '万柳', '公主坟', '清河']),
+    '丰台区': (10, ['方庄', '丽泽', '六里桥', '科技园', '马家堡']),
+    '西城区': (6, ['金融街', '西直门', '德胜门', '广安门']),
+    '东城区': (6, ['东直门', '和平里', '崇文门', '天坛']),
+    '通州区': (9, ['梨园', '果园', '九棵树', '运河']),
+    '昌平区': (10, ['回龙观', '天通苑', '沙河', '北七家']),
+    '大兴区': (8, ['亦庄', '黄村', '西红门', '旧宫']),
+    '石景山区': (4, ['鲁谷', '八角', '古城', '苹果园']),
+    '顺义区': (5, ['后沙峪', '马坡', '石园']),
+    '房山区': (4, ['长阳', '良乡', '拱辰']),
+    '门头沟区': (2, ['城子', '永定']),
+}
+# 区的价格系数
+REGION_PRICE_FACTOR = {'西城区': 1.6, '东城区': 1.5, '海淀区': 1.4, '朝阳区': 1.35, '丰台区': 1.0, '石景山区': 0.95,
+                       '通州区': 0.8, '昌平区': 0.8, '大兴区': 0.75, '顺义区': 0.7, '房山区': 0.6, '门头沟区': 0.6}
+COMMUNITY_PREFIXES = ['阳光', '金地', '万科', '华润', '富力', '远洋', '首开', '融创', '龙湖', '保利', '中海', '绿地']
+COMMUNITY_SUFFIXES = ['花园', '家园', '小区', '公寓', '新城', '嘉园', '雅苑', '国际']
+ROOMS = [('1室1厅', 20), ('2室1厅', 30), ('2室2厅', 10), ('3室1厅', 15), ('3室2厅', 10), ('1室0厅', 8),
+         ('4室2厅', 5), ('5室2厅', 2)]
+ROOM_AREA = {'1': (25, 55), '2': (50, 95), '3': (80, 140), '4': (120, 200), '5': (150, 260)}
+DIRECTIONS = ['南', '南北', '东', '西', '北', '东南', '西南']
+RENT_TYPES = [('整租', 70), ('合租', 30)]
+FACILITIES = ['冰箱', '洗衣机', '电视', '空调', '暖气', '热水器', '燃气', '床', '网络', '衣柜', '电梯']
+
+# 压测场景，按顺序轮流发送
+SCENARIOS = ('search', 'keyword', 'list', 'detail', 'scatter', 'pie', 'column', 'broken_line')
+
+
+def weighted_choice(rnd, pairs):
+    values, weights = zip(*pairs)
+    return rnd.choices(values, weights=weights)[0]
+
+
+# --- 生成模拟数据 ---
+def make_house(rnd, i, now):
+    region = rnd.choices(list(REGIONS), weights=[w for w, _ in REGIONS.values()])[0]
+    block = rnd.choice(REGIONS[region][1])
+    # 小区数量有限，热门小区集中了更多房源
+    community = int(rnd.paretovariate(1.2)) % 40
+    address = COMMUNITY_PREFIXES[community % len(COMMUNITY_PREFIXES)] + \
+        COMMUNITY_SUFFIXES[community % len(COMMUNITY_SUFFIXES)] + (str(community // 12) if community >= 12 else '')
+    rooms = weighted_choice(rnd, ROOMS)
+    low, high = ROOM_AREA[rooms[0]]
+    area = rnd.randint(low, high)
+    rent_type = weighted_choice(rnd, RENT_TYPES)
+    price = int(area * rnd.uniform(55, 110) * REGION_PRICE_FACTOR[region] * (0.45 if rent_type == '合租' else 1))
+    direction = rnd.choice(DIRECTIONS)
+    facilities = '-'.join(rnd.sample(FACILITIES, rnd.randint(3, len(FACILITIES))))
+    return {
+        'title': f'{block} {address} {rooms} {rnd.choice(DIRECTIONS)}向',
+        'rooms': rooms,
+        'area': f'{area}平米',
+        'price': f'{price}元/月',
+        'direction': direction,
+        'rent_type': rent_type,
+        'region': region,
+        'block': block,
+        'address': address,
+        'traffic': f'距{block}地铁站{rnd.randint(200, 2500)}米',
+        'publish_time': now - rnd.randint(0, 2 * 365 * 86400),
+        'facilities': facilities,
+        'highlights': '拎包入住，随时看房',
+        'matching': '周边商场、超市、医院齐全',
+        'travel': f'{block}公交站步行{rnd.randint(2, 15)}分钟',
+        'page_views': int(rnd.paretovariate(1.1) * 10),
+        'landlord': rnd.choice('王李张刘陈杨赵黄周吴') + '先生',
+        'phone_num': f'1{rnd.randint(3, 9)}{rnd.randint(100000000, 999999999)}',
+        'house_num': f'BJ{i:08d}',
+        'price_value': float(price),
+        'area_value': float(area),
+        'facilities_mask': utils.parse_facilities(facilities),
+        'direction_code': utils.encode_choice(direction, utils.DIRECTIONS),
+        'rent_type_code': utils.encode_choice(rent_type, utils.RENT_TYPES),
+        'updated_at': now,
+    }
+
+
+def seed_database(houses, users, batch_size=5000, seed=1):
+    from settings import app, db
+    from models import House, User, UserCollection, UserViewHistory
+    import analytics
+
+    rnd = random.Random(seed)
+    now = int(time.time())
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        with db.engine.begin() as conn:
+            batch = []
+            for i in range(houses):
+                batch.append(make_house(rnd, i, now))
+                if len(batch) >= batch_size:
+                    conn.execute(House.__table__.insert(), batch)
+                    batch = []
+            if batch:
+                conn.execute(House.__table__.insert(), batch)
+            conn.execute(User.__table__.insert(), [
+                {'name': f'user{u}', 'password': 'bench', 'email': f'user{u}@example.com'} for u in range(1, users + 1)])
+            # 浏览和收藏集中在热门房源上
+            views, collects = [], []
+            for user_id in range(1, users + 1):
+                seen = {min(int(rnd.paretovariate(0.8)), houses) for _ in range(rnd.randint(3, 30))}
+                views += [{'user_id': user_id, 'house_id': h, 'viewed_at': now - rnd.randint(0, 86400 * 30)} for h in seen]
+                collects += [{'user_id': user_id, 'house_id': h, 'created_at': now} for h in list(seen)[:2]]
+            if views:
+                conn.execute(UserViewHistory.__table__.insert(), views)
+            if collects:
+                conn.execute(UserCollection.__table__.insert(), collects)
+            analytics.rebuild_all(conn)
+
+
+# --- 请求场景 ---
+def build_requests(rnd, houses, count):
+    """生成 (场景, 方法, 路径, 表单) 列表，各场景轮流出现"""
+    region_blocks = [(region, block) for region, (_, blocks) in REGIONS.items() for block in blocks]
+    requests = []
+    for i in range(count):
+        scenario = SCENARIOS[i % len(SCENARIOS)]
+        region, block = rnd.choice(region_blocks)
+        location = urllib.parse.quote(f'{region}-{block}')
+        if scenario == 'search':
+            low = rnd.choice([1000, 2000, 3000, 5000])
+            query = urllib.parse.urlencode({'region': region.rstrip('区'), 'price': f'{low}-{low * 2}',
+                                            'page': rnd.randint(1, 5)})
+            requests.append((scenario, 'GET', f'/api/search?{query}', None))
+        elif scenario == 'keyword':
+            requests.append((scenario, 'POST', '/api/search/keyword/', {'kw': block[:rnd.randint(1, len(block))],
+                                                                        'info': '地区'}))
+        elif scenario == 'list':
+            category = rnd.choice(['pattern', 'hot_house'])
+            requests.append((scenario, 'GET', f'/list/{category}/{rnd.randint(1, 50)}', None))
+        elif scenario == 'detail':
+            requests.append((scenario, 'GET', f'/house/{min(int(rnd.paretovariate(0.8)), houses)}', None))
+        else:
+            endpoint = {'scatter': 'scatterdata', 'pie': 'piedata', 'column': 'columndata',
+                        'broken_line': 'brokenlinedata'}[scenario]
+            requests.append((scenario, 'GET', f'/api/get/{endpoint}/{location}', None))
+    return requests
+
+
+class QueryCounter:
+    """统计当前线程执行的 SQL 条数"""
+
+    def __init__(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        self._local = threading.local()
+        event.listen(Engine, 'after_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+def run_test_client(requests, cold=False):
+    """通过 Flask 测试客户端逐个发送请求，记录耗时和 SQL 条数"""
+    import app as app_module
+    from settings import cache
+
+    # 压测时只保留警告日志
+    logging.getLogger().setLevel(logging.WARNING)
+    client = app_module.app.test_client()
+    counter = QueryCounter()
+    latencies = defaultdict(list)
+    queries = defaultdict(list)
+    started = time.perf_counter()
+    for scenario, method, path, form in requests:
+        if cold:
+            cache.backend.clear()
+        counter.reset()
+        t0 = time.perf_counter()
+        response = client.open(path, method=method, data=form)
+        latencies[scenario].append(time.perf_counter() - t0)
+        queries[scenario].append(counter.count)
+        if response.status_code >= 500:
+            print(f'{path} 返回 {response.status_code}', file=sys.stderr)
+    return latencies, queries, time.perf_counter() - started
+
+
+def scrape_query_totals(url):
+    """从 /metrics 读取各接口累计的 SQL 条数"""
+    totals = {}
+    try:
+        with urllib.request.urlopen(url.rstrip('/') + '/metrics', timeout=10) as resp:
+            for line in resp.read().decode().splitlines():
+                if line.startswith('db_queries_total{'):
+                    labels, value = line.rsplit(' ', 1)
+                    totals[labels] = float(value)
+    except OSError:
+        pass
+    return totals
+
+
+def run_http(url, requests, concurrency):
+    """
+    并发 HTTP 压测 (服务需要已经启动)
+    /metrics 只有各接口的累计值，无法区分场景，SQL 条数只返回全部请求的平均值 (读取不到时为 None)
+    """
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+
+    def send(item):
+        scenario, method, path, form = item
+        data = urllib.parse.urlencode(form).encode() if form else None
+        req = urllib.request.Request(url.rstrip('/') + path, data=data, method=method)
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                resp.read()
+        except OSError as e:
+            print(f'{path} 请求失败: {e}', file=sys.stderr)
+            return
+        with lock:
+            latencies[scenario].append(time.perf_counter() - t0)
+
+    before = scrape_query_totals(url)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, requests))
+    elapsed = time.perf_counter() - started
+    after = scrape_query_totals(url)
+    overall_queries = (sum(after.values()) - sum(before.values())) / len(requests) if after and requests else None
+    return latencies, {}, elapsed, overall_queries
+
+
+# --- 报告 ---
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(latencies, queries, elapsed, overall_queries=None):
+    """
+    各场景的耗时分位数和平均 SQL 条数 (拿不到时为 None)
+    场景交替发送、并发执行，无法得到单个场景的墙钟时间：serial_rps 是 1 / 平均耗时，即单个 worker
+    串行处理该场景的等效吞吐，不是实际吞吐；实际吞吐只在总计中按墙钟时间计算
+    """
+    report = {}
+    for scenario, values in sorted(latencies.items()):
+        report[scenario] = {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'serial_rps': round(len(values) / sum(values), 1) if sum(values) else 0,
+            'queries_per_request': round(statistics.mean(queries[scenario]), 2) if queries.get(scenario) else None,
+        }
+    total = sum(len(v) for v in latencies.values())
+    if overall_queries is None and queries:
+        overall_queries = statistics.mean(n for values in queries.values() for n in values)
+    report['_total'] = {'count': total, 'elapsed_s': round(elapsed, 2),
+                        'throughput_rps': round(total / elapsed, 1) if elapsed else 0,
+                        'queries_per_request': round(overall_queries, 2) if overall_queries is not None else None}
+    return report
+
+
+def print_report(report):
+    print(f"{'场景':<12}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'串行req/s':>10}{'SQL/请求':>10}")
+    for scenario, row in report.items():
+        if scenario.startswith('_'):
+            continue
+        queries = '-' if row['queries_per_request'] is None else row['queries_per_request']
+        print(f"{scenario:<12}{row['count']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+              f"{row['serial_rps']:>10}{queries:>10}")
+    total = report['_total']
+    queries = '-' if total['queries_per_request'] is None else total['queries_per_request']
+    print(f"总计 {total['count']} 个请求，耗时 {total['elapsed_s']} 秒，吞吐 {total['throughput_rps']} req/s，"
+          f"平均 SQL {queries} 条/请求")
+
+
+def compare(report, baseline, max_regression):
+    """返回 p95 变慢超过阈值的场景"""
+    regressions = []
+    for scenario, row in report.items():
+        old = baseline.get(scenario)
+        if scenario.startswith('_') or not old or not old.get('p95_ms'):
+            continue
+        change = row['p95_ms'] / old['p95_ms'] - 1
+        if change > max_regression:
+            regressions.append(f"{scenario}: p95 {old['p95_ms']}ms -> {row['p95_ms']}ms (+{change:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='二手房网站热点接口压测')
+    parser.add_argument('--db', default='sqlite:///bench.db', help='压测使用的数据库 URI')
+    parser.add_argument('--seed-data', action='store_true', help='重新生成模拟数据 (会清空该数据库)')
+    parser.add_argument('--houses', type=int, default=10000, help='生成的房源数量')
+    parser.add_argument('--users', type=int, default=1000, help='生成的用户数量')
+    parser.add_argument('--requests', type=int, default=800, help='发送的请求总数')
+    parser.add_argument('--url', help='对已启动的服务做 HTTP 压测，不指定时使用 Flask 测试客户端')
+    parser.add_argument('--concurrency', type=int, default=8, help='HTTP 压测的并发数')
+    parser.add_argument('--cold', action='store_true', help='每个请求前清空缓存，测量未命中缓存时的耗时')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    parser.add_argument('--baseline', help='与之前的 JSON 结果比较')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='允许的 p95 变慢比例')
+    parser.add_argument('--random-seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    # 必须在导入应用之前设置数据库
+    os.environ['DATABASE_URL'] = args.db
+    if args.seed_data:
+        t0 = time.perf_counter()
+        seed_database(args.houses, args.users, seed=args.random_seed)
+        print(f'已生成 {args.houses} 套房源、{args.users} 个用户，耗时 {time.perf_counter() - t0:.1f} 秒')
+
+    requests = build_requests(random.Random(args.random_seed), args.houses, args.requests)
+    overall_queries = None
+    if args.url:
+        latencies, queries, elapsed, overall_queries = run_http(args.url, requests, args.concurrency)
+    else:
+        latencies, queries, elapsed = run_test_client(requests, cold=args.cold)
+
+    report = summarize(latencies, queries, elapsed, overall_queries)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print('性能回退：\n' + '\n'.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+# 缓存未命中时的占位对象 (缓存值本身可能是 None / 空列表)
+MISSING = object()
+
+
+class MemoryBackend:
+    """进程内缓存：带过期时间 (TTL) 的 LRU 字典，超过容量时淘汰最久未使用的条目"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISSING
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """共享缓存：多个 gunicorn worker 通过本地 Redis (或兼容 Redis 协议的服务) 共享缓存内容"""
+
+    def __init__(self, url, namespace='house'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis 需要安装 redis 包: pip install redis')
+        self._client = redis.Redis.from_url(url)
+        self._namespace = namespace
+
+    def _key(self, key):
+        return f'{self._namespace}:{key}'
+
+    def get(self, key):
+        raw = self._client.get(self._key(key))
+        return MISSING if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        # 容量上限交给 Redis 的 maxmemory + allkeys-lru 策略
+        self._client.set(self._key(key), json.dumps(value, ensure_ascii=False), ex=max(int(ttl), 1))
+
+    def delete(self, key):
+        self._client.delete(self._key(key))
+
+    def delete_prefix(self, prefix):
+        keys = list(self._client.scan_iter(match=self._key(prefix) + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix('')
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(match=self._key('*')))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合并同一个键的并发调用：第一个调用者执行函数，同时到达的其他调用者等待并共享它的结果 (或异常)
+    用于避免缓存失效瞬间大量相同的请求同时查询数据库
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """返回 (结果, 是否共享了其他调用者的结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class FragmentCacheExtension(Extension):
+    """
+    模板片段缓存：{% cache 'detail', house.id, house.updated_at %} ... {% endcache %}
+    参数拼接为缓存键，块内渲染出的 HTML 存入 'fragments' 命名空间；
+    键中应包含会影响该片段内容的所有数据 (例如修改时间)，片段内不要放与当前用户相关的内容
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render_fragment', [nodes.List(key_parts)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, key_parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = '|'.join(str(part) for part in key_parts)
+        return Markup(cache.get_or_set('fragments', key, lambda: str(caller())))
+
+
+class ResponseCache:
+    """
+    热点接口的缓存层
+    每个接口使用一个命名空间 (如 'hot_houses')，TTL 按命名空间配置，并分别统计命中/未命中次数
+    缓存的值必须可以序列化为 JSON (列表、字典等)，以便切换到共享后端
+    """
+
+    def __init__(self, app=None):
+        self.backend = MemoryBackend()
+        self.ttls = {}
+        self.default_ttl = 60
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.coalesced = defaultdict(int)
+        self._flight = SingleFlight()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'memory')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 60)
+        app.config.setdefault('CACHE_TTLS', {})
+        if app.config['CACHE_BACKEND'] == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+        else:
+            self.backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self.ttls = dict(app.config['CACHE_TTLS'])
+        # 模板中可以使用 {% cache ... %} 缓存渲染结果
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+    @staticmethod
+    def make_key(namespace, key=''):
+        return f'{namespace}:{key}'
+
+    def get_or_set(self, namespace, key, loader):
+        """
+        读取缓存，未命中时调用 loader() 计算并写入缓存
+        同一个键的并发未命中只调用一次 loader()，其余请求等待并共享结果
+        """
+        full_key = self.make_key(namespace, key)
+        value = self.backend.get(full_key)
+        if value is not MISSING:
+            self.hits[namespace] += 1
+            return value
+
+        def load():
+            self.misses[namespace] += 1
+            loaded = loader()
+            self.backend.set(full_key, loaded, self.ttls.get(namespace, self.default_ttl))
+            return loaded
+
+        value, shared = self._flight.do(full_key, load)
+        if shared:
+            self.coalesced[namespace] += 1
+        return value
+
+    def peek(self, namespace, key=''):
+        """只读取缓存内容，不计入命中统计；不存在时返回 None"""
+        value = self.backend.get(self.make_key(namespace, key))
+        return None if value is MISSING else value
+
+    def invalidate(self, namespace, key=None):
+        """使缓存失效：不传 key 时清空整个命名空间"""
+        if key is None:
+            self.backend.delete_prefix(self.make_key(namespace))
+        else:
+            self.backend.delete(self.make_key(namespace, key))
+
+    def invalidate_prefix(self, namespace, prefix):
+        self.backend.delete_prefix(self.make_key(namespace, prefix))
+
+    def stats(self):
+        namespaces = set(self.hits) | set(self.misses)
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'namespaces': {
+                name: {'hits': self.hits[name], 'misses': self.misses[name], 'coalesced': self.coalesced[name]}
+                for name in sorted(namespaces)
+            },
+        }
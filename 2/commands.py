@@ -0,0 +1,256 @@
+import time
+
+import click
+from sqlalchemy import inspect, or_, text
+
+from settings import app, db, cache, assets
+from models import (House, PriceTrend, Recommend, RegionStat, User, UserCollection, UserViewHistory,
+                    Region, Block, Community)
+import recommender
+import saved_search
+import analytics
+import trends
+from ingest import ingest
+from database import replica_engines
+from search_index import search_index
+from facet_index import facet_index
+from snapshot import chart_snapshot
+from location import ensure_location, location_index
+from assets import build_assets
+from utils import clean_price, parse_area, parse_facilities, encode_choice, DIRECTIONS, RENT_TYPES
+
+
+# --- 辅助函数 ---
+def ensure_columns(model):
+    """为已存在的数据表补齐模型中新增的列和索引 (项目没有迁移工具，这里做最小化的 ALTER TABLE)"""
+    table = model.__table__
+    inspector = inspect(db.engine)
+    if not inspector.has_table(table.name):
+        table.create(db.engine)
+        return
+    existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+    existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+    with db.engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                click.echo(f'已添加列 {table.name}.{column.name}')
+    for index in table.indexes:
+        if index.name not in existing_indexes:
+            index.create(db.engine)
+            click.echo(f'已创建索引 {index.name}')
+
+
+# --- 命令行工具 (flask --app app <命令>) ---
+@app.cli.command('sync-schema')
+def sync_schema():
+    """创建缺失的数据表，并为已有数据表补齐新增的列和索引"""
+    # 先按外键依赖顺序创建缺失的表
+    db.create_all()
+    for model in db.Model.__subclasses__():
+        ensure_columns(model)
+    click.echo('数据表结构已同步')
+
+
+@app.cli.command('backfill-numeric')
+@click.option('--batch-size', default=1000, show_default=True, help='每批处理的房源数量')
+def backfill_numeric(batch_size):
+    """解析所有房源的文本字段，回填价格/面积数值列、设施位掩码以及朝向/租住类型编码"""
+    ensure_columns(House)
+    last_id = 0
+    total = 0
+    while True:
+        # 按主键分批读取，只取需要的列，避免一次性加载整张表
+        rows = db.session.query(
+            House.id, House.price, House.area, House.facilities, House.direction, House.rent_type
+        ).filter(
+            House.id > last_id
+        ).order_by(House.id).limit(batch_size).all()
+        if not rows:
+            break
+        mappings = [
+            {
+                'id': row.id,
+                'price_value': clean_price(row.price),
+                'area_value': parse_area(row.area),
+                'facilities_mask': parse_facilities(row.facilities),
+                'direction_code': encode_choice(row.direction, DIRECTIONS),
+                'rent_type_code': encode_choice(row.rent_type, RENT_TYPES),
+            }
+            for row in rows
+        ]
+        db.session.bulk_update_mappings(House, mappings)
+        db.session.commit()
+        last_id = rows[-1].id
+        total += len(rows)
+        click.echo(f'已回填 {total} 条房源')
+    click.echo(f'回填完成，共处理 {total} 条房源，请运行 build-analytics 刷新统计表')
+
+
+@app.cli.command('build-locations')
+@click.option('--batch-size', default=1000, show_default=True, help='每批处理的房源数量')
+def build_locations(batch_size):
+    """由房源的 region/block/address 建立 区/街道/小区 位置表，并回填房源的位置编号"""
+    for model in (Region, Block, Community, House):
+        ensure_columns(model)
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.session.query(House.id, House.region, House.block, House.address).filter(
+            House.id > last_id
+        ).order_by(House.id).limit(batch_size).all()
+        if not rows:
+            break
+        conn = db.session.connection()
+        locations = {}
+        mappings = [
+            dict(ensure_location(conn, row.region, row.block, row.address, locations)._asdict(), id=row.id)
+            for row in rows
+        ]
+        db.session.bulk_update_mappings(House, mappings)
+        db.session.commit()
+        last_id = rows[-1].id
+        total += len(rows)
+        click.echo(f'已回填 {total} 条房源')
+    location_index.invalidate()
+    regions, blocks, communities = location_index.rebuild()
+    click.echo(f'位置表已建立：{regions} 个区，{blocks} 个街道，{communities} 个小区')
+
+
+@app.cli.command('build-analytics')
+def build_analytics():
+    """全量重建区域统计表 (house_region_stat)，供图表接口读取"""
+    RegionStat.__table__.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        region_count = analytics.rebuild_all(conn)
+    cache.invalidate('charts')
+    click.echo(f'统计表重建完成，共处理 {region_count} 个区')
+
+
+def parse_legacy_ids(id_str):
+    """解析旧字段中逗号分隔的房源编号，去重并保持原有顺序"""
+    ids = []
+    for part in (id_str or '').split(','):
+        part = part.strip()
+        if part.isdigit() and int(part) not in ids:
+            ids.append(int(part))
+    return ids
+
+
+@app.cli.command('build-trends')
+def build_trends():
+    """全量重建价格走势表 (house_price_trend)，之后由提交钩子增量维护"""
+    PriceTrend.__table__.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        count = trends.rebuild_all(conn)
+    cache.invalidate('charts')
+    click.echo(f'价格走势重建完成，共处理 {count} 个区')
+
+
+@app.cli.command('migrate-user-relations')
+def migrate_user_relations():
+    """把 user_info 中的 collect_id/seen_id 旧字段迁移到 user_collection/user_view_history 表"""
+    UserCollection.__table__.create(db.engine, checkfirst=True)
+    UserViewHistory.__table__.create(db.engine, checkfirst=True)
+    now = int(time.time())
+    collection_count = history_count = 0
+    users = db.session.query(User.id, User.collect_id, User.seen_id).filter(
+        or_(User.collect_id.isnot(None), User.seen_id.isnot(None))
+    ).all()
+    for user in users:
+        existing_collections = {c.house_id for c in UserCollection.query.filter_by(user_id=user.id)}
+        existing_history = {h.house_id for h in UserViewHistory.query.filter_by(user_id=user.id)}
+        collect_ids = parse_legacy_ids(user.collect_id)
+        seen_ids = parse_legacy_ids(user.seen_id)
+        # 旧字段没有时间信息，按原有先后顺序生成递增的时间戳
+        for offset, house_id in enumerate(collect_ids):
+            if house_id not in existing_collections:
+                db.session.add(UserCollection(user_id=user.id, house_id=house_id,
+                                              created_at=now - len(collect_ids) + offset))
+                collection_count += 1
+        for offset, house_id in enumerate(seen_ids):
+            if house_id not in existing_history:
+                db.session.add(UserViewHistory(user_id=user.id, house_id=house_id,
+                                               viewed_at=now - len(seen_ids) + offset))
+                history_count += 1
+        db.session.commit()
+    click.echo(f'迁移完成：{len(users)} 个用户，{collection_count} 条收藏，{history_count} 条浏览记录')
+
+
+@app.cli.command('build-recommendations')
+@click.option('--shards', default=1, show_default=True, help='按房源ID分片计算，降低内存占用')
+@click.option('--top-k', default=recommender.TOP_K, show_default=True, help='每个房源保留的相似房源数量')
+@click.option('--since', type=int, default=None, help='只更新最近N秒内有浏览/收藏的房源 (增量模式)')
+def build_recommendations(shards, top_k, since):
+    """根据浏览记录和收藏计算房源之间的相似度，写入 house_recommend 表"""
+    ensure_columns(Recommend)
+    with db.engine.begin() as conn:
+        if since is None:
+            count = recommender.rebuild_all(conn, shards=shards, top_k=top_k)
+        else:
+            house_ids = recommender.recently_active_houses(conn, int(time.time()) - since)
+            count = recommender.refresh_houses(conn, house_ids, top_k=top_k)
+    click.echo(f'推荐数据更新完成，共处理 {count} 个房源')
+
+
+@app.cli.command('ingest')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None, help='默认按文件扩展名判断')
+@click.option('--batch-size', default=1000, show_default=True, help='每个事务写入的房源数量')
+def ingest_listings(paths, fmt, batch_size):
+    """导入爬取的房源数据 (CSV/JSONL)，按房源编号去重后批量写入 house_info"""
+    ensure_columns(House)
+
+    def report(stats):
+        click.echo(f'已处理 {stats.read} 条 ({stats.inserted} 新增 / {stats.updated} 更新)')
+
+    started_at = int(time.time())
+    stats = ingest(db.engine, paths, fmt=fmt, batch_size=batch_size, on_batch=report)
+    # 批量写入绕过了 ORM 事件，这里统一刷新派生数据
+    with db.engine.begin() as conn:
+        for region in {analytics.normalize_region(r) for r in stats.regions}:
+            analytics.rebuild_region(conn, region)
+            trends.rebuild_region(conn, region)
+            cache.invalidate_prefix('charts', f'{region}|')
+        # 本次写入或更新的房源与保存的检索条件匹配
+        matched = saved_search.match_updated_since(conn, started_at)
+    cache.invalidate('hot_houses')
+    cache.invalidate('new_houses')
+    cache.invalidate('counts')
+    search_index.invalidate()
+    facet_index.invalidate()
+    chart_snapshot.invalidate()
+    location_index.invalidate()
+    click.echo(stats.summary())
+    click.echo(f'保存的检索条件新匹配 {matched} 个房源')
+
+
+@app.cli.command('sync-replicas')
+@click.option('--batch-size', default=5000, show_default=True, help='每批复制的行数')
+def sync_replicas(batch_size):
+    """
+    把主库的全部数据复制到只读副本 (仅用于本地测试，例如用两个 SQLite 文件模拟主库和副本；
+    生产环境的副本由 MySQL 主从复制维护)
+    """
+    replicas = replica_engines(db)
+    if not replicas:
+        click.echo('未配置只读副本 (DATABASE_REPLICA_URLS)')
+        return
+    for replica in replicas:
+        db.metadata.create_all(replica)
+        with db.engine.connect() as source, replica.begin() as target:
+            for table in db.metadata.sorted_tables:
+                target.execute(table.delete())
+                result = source.execution_options(yield_per=batch_size).execute(table.select())
+                for rows in result.mappings().partitions():
+                    target.execute(table.insert(), [dict(row) for row in rows])
+        click.echo(f'已同步到副本 {replica.url.render_as_string(hide_password=True)}')
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """构建静态资源：压缩合并 CSS/JS，输出带内容哈希的文件名和 gzip/brotli 预压缩版本 (static/dist)"""
+    manifest = build_assets(app.static_folder)
+    assets.load_manifest()
+    click.echo(f'已生成 {len(manifest)} 个静态资源文件')
@@ -0,0 +1,105 @@
+import os
+import random
+import time
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql import Select
+
+# 只读副本在 SQLALCHEMY_BINDS 中的键名前缀
+REPLICA_BIND_PREFIX = 'replica_'
+# 必须在主库上执行的查询 (SELECT ... FOR UPDATE、读取刚写入的数据等) 设置的执行选项：
+# stmt.execution_options(use_primary=True)
+PRIMARY_OPTION = 'use_primary'
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def load_database_config(app):
+    """
+    数据库连接池与只读副本的配置，默认值可以被环境变量覆盖，
+    之后 HOUSE_SETTINGS 环境变量指向的配置文件 (Python 文件) 可以再覆盖任意一项
+    """
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    # MySQL 默认 8 小时断开空闲连接，回收时间需小于 wait_timeout
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 3600))
+    app.config['DB_POOL_PRE_PING'] = _env_bool('DB_POOL_PRE_PING', True)
+    # 只读副本的连接地址，多个地址用逗号分隔；为空时所有查询都走主库
+    app.config['DATABASE_REPLICA_URLS'] = [
+        url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    # 写入之后的这段时间内，同一个用户的读请求仍然走主库 (避免副本延迟导致读不到刚写入的数据)
+    app.config['DB_REPLICA_STICKY_SECONDS'] = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+
+    app.config.from_envvar('HOUSE_SETTINGS', silent=True)
+
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': app.config['DB_POOL_PRE_PING'],
+    })
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for i, url in enumerate(app.config['DATABASE_REPLICA_URLS']):
+        binds.setdefault(f'{REPLICA_BIND_PREFIX}{i}', url)
+
+
+def replica_engines(db):
+    """已配置的只读副本引擎"""
+    return [engine for key, engine in db.engines.items()
+            if key is not None and key.startswith(REPLICA_BIND_PREFIX)]
+
+
+def read_engine(db):
+    """
+    直接使用连接的只读查询 (价格走势、流式导出、图表快照重建等) 使用的引擎：
+    与 RoutingSession 的规则一致，随机选择一个只读副本，没有配置副本或当前用户刚刚写入过时使用主库
+    """
+    replicas = replica_engines(db)
+    if not replicas or _recently_wrote():
+        return db.engine
+    return random.choice(replicas)
+
+
+def _recently_wrote():
+    return has_request_context() and flask_session.get('_primary_until', 0) > time.time()
+
+
+class RoutingSession(Session):
+    """
+    读写分离的 Session：
+    普通的 SELECT 随机发往一个只读副本，INSERT/UPDATE/DELETE、flush 以及设置了 PRIMARY_OPTION 的查询发往主库；
+    一旦发生写入，本次会话之后的查询都走主库，并在用户的 session 中记录一段时间内继续读主库
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or engine is not self._db.engines.get(None):
+            return engine
+        if not self._is_read(clause):
+            self._stick_to_primary()
+            return engine
+        if self.info.get('use_primary') or _recently_wrote():
+            return engine
+        replicas = replica_engines(self._db)
+        return random.choice(replicas) if replicas else engine
+
+    @staticmethod
+    def _is_read(clause):
+        # flush 和 session.connection() 取连接时没有语句，无法判断，按写入处理
+        return isinstance(clause, Select) and not clause.get_execution_options().get(PRIMARY_OPTION)
+
+    def _stick_to_primary(self):
+        if self.info.get('use_primary'):
+            return
+        self.info['use_primary'] = True
+        if has_request_context() and replica_engines(self._db):
+            sticky = current_app.config['DB_REPLICA_STICKY_SECONDS']
+            flask_session['_primary_until'] = time.time() + sticky
@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from analytics import parse_location
+from models import House
+from location import location_filters
+
+# 导出的房源字段 (与数据导入的字段保持一致，方便导出后再导入)
+EXPORT_FIELDS = ('id', 'house_num', 'title', 'region', 'block', 'address', 'rooms', 'area', 'price',
+                 'area_value', 'price_value', 'direction', 'rent_type', 'publish_time', 'page_views')
+# 服务端游标每次从数据库取回的行数
+YIELD_PER = 1000
+# 每次向客户端输出的行数 (合并成一个 chunk，减少写 socket 的次数)
+ROWS_PER_CHUNK = 200
+
+
+def parse_range(range_str):
+    """'2000-5000' -> (2000, 5000)，格式不正确时返回 None"""
+    try:
+        low, high = map(int, range_str.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    return low, high
+
+
+def export_statement(region=None, block=None, rooms=None, price_range=None, area_range=None):
+    """按筛选条件构建导出查询 (只查询导出字段，按主键顺序)"""
+    columns = [getattr(House, field) for field in EXPORT_FIELDS]
+    stmt = select(*columns).order_by(House.id)
+    if region:
+        stmt = stmt.where(*location_filters(region, block or ''))
+    elif block:
+        stmt = stmt.where(House.block == block)
+    if rooms:
+        stmt = stmt.where(House.rooms == rooms)
+    if price_range:
+        stmt = stmt.where(House.price_value >= price_range[0], House.price_value < price_range[1])
+    if area_range:
+        stmt = stmt.where(House.area_value >= area_range[0], House.area_value < area_range[1])
+    return stmt
+
+
+def iter_rows(engine, stmt):
+    """
+    使用服务端游标逐批读取查询结果 (MySQL 下为 SSCursor)，内存占用与结果总数无关
+    连接在生成器内部打开，响应开始输出之后请求上下文已经结束也不受影响
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=YIELD_PER).execute(stmt)
+        yield from result
+
+
+def _chunks(rows, render):
+    """把逐行渲染的文本按 ROWS_PER_CHUNK 合并后输出"""
+    buffer = []
+    for row in rows:
+        buffer.append(render(row))
+        if len(buffer) >= ROWS_PER_CHUNK:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_ndjson(rows):
+    """每行一个 JSON 对象"""
+    def render(row):
+        return json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
+
+    yield from _chunks(rows, render)
+
+
+def stream_csv(rows):
+    """带表头的 CSV，开头写入 BOM 以便 Excel 正确识别中文"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def render(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+
+    yield '\ufeff' + render(EXPORT_FIELDS)
+    yield from _chunks(rows, render)
+
+
+# --- 散点图的流式版本 ---
+def scatter_statement(region_str):
+    """某个位置下所有有效的 (面积, 价格) 数据点，按房源编号顺序 (与预聚合的抽样顺序一致)"""
+    return select(House.area_value, House.price_value).where(
+        *location_filters(*parse_location(region_str)), House.area_value > 0, House.price_value > 0
+    ).order_by(House.id)
+
+
+def stream_scatter(rows):
+    """输出与 /get/scatterdata 相同结构的 {"data": [[面积, 价格], ...]}，边查询边输出"""
+    yield '{"data":['
+    first = True
+    for chunk in _chunks(rows, lambda row: ',' + json.dumps([row[0], row[1]])):
+        if first:
+            chunk = chunk[1:]
+            first = False
+        yield chunk
+    yield ']}'
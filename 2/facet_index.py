@@ -0,0 +1,250 @@
+import bisect
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import select
+
+from settings import app, db
+from models import House
+from refreshable import RefreshableIndex
+from house_changes import house_changes
+from utils import FACILITIES, FACILITY_BITS, DIRECTIONS, RENT_TYPES, decode_choice
+
+# 房源的分面字段，以及检索条件中的位置和价格/面积 (数据库列)
+FACET_COLUMNS = ('rooms', 'rent_type_code', 'direction_code', 'facilities_mask',
+                 'region_id', 'block_id', 'community_id', 'price_value', 'area_value')
+FacetDoc = namedtuple('FacetDoc', FACET_COLUMNS)
+# 价格/面积的分桶边界，与检索页的区间选项一致：选项区间正好由整桶组成，只需合并桶的位图；
+# 其他区间只需要逐个检查两端不完整的桶中的房源
+RANGE_BUCKETS = {
+    'price': ('price_value', (0, 3000, 5000, 8000, 12000, 999999)),
+    'area': ('area_value', (0, 50, 70, 90, 120, 9999)),
+}
+# 户型分面返回的桶数量
+ROOMS_FACET_LIMIT = 10
+
+
+def make_bitmap(ids):
+    """房源ID集合 -> 位图 (Python 大整数，第 i 位表示 ID 为 i 的房源)"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for house_id in ids:
+        buffer[house_id >> 3] |= 1 << (house_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def rooms_match(value, rooms):
+    """户型筛选条件，与 /api/search 的规则一致 ('4室及以上' 匹配 4~6 室)"""
+    if rooms == '4室及以上':
+        return value.startswith(('4室', '5室', '6室'))
+    return value == rooms
+
+
+class FacetIndex(RefreshableIndex):
+    """
+    房源分面的位图索引 (进程内)
+    每个 户型/租住类型/朝向/配套设施 取值对应一个位图，筛选与计数都是位图的与运算和 popcount，
+    不需要逐行遍历房源
+    """
+
+    refresh_config_key = 'SEARCH_INDEX_REFRESH_INTERVAL'
+
+    def __init__(self, app=None):
+        self._bitmaps = {}
+        # 价格/面积桶 -> 房源ID集合 (用于检查区间两端不完整的桶)
+        self._buckets = {}
+        self._docs = {}
+        self._all = 0
+        super().__init__(app)
+
+    @staticmethod
+    def _bucket_keys(doc):
+        """房源所在的价格/面积桶 (维度, 桶序号)，数值无效 (不参与区间筛选) 的房源不在任何桶中"""
+        keys = []
+        for dimension, (column, bounds) in RANGE_BUCKETS.items():
+            value = getattr(doc, column)
+            if value > 0:
+                keys.append((dimension, bisect.bisect_right(bounds, value) - 1))
+        return keys
+
+    @classmethod
+    def _keys(cls, doc):
+        """一个房源所在的全部位图键 (维度, 取值)"""
+        keys = [('rooms', doc.rooms), ('rent_type', doc.rent_type_code), ('direction', doc.direction_code),
+                ('region', doc.region_id), ('block', doc.block_id), ('address', doc.community_id)]
+        keys.extend(('facilities', keyword) for keyword, bit in FACILITY_BITS.items() if doc.facilities_mask & bit)
+        keys.extend(cls._bucket_keys(doc))
+        return keys
+
+    @staticmethod
+    def _doc(values):
+        return FacetDoc(values.get('rooms') or '', values.get('rent_type_code') or 0,
+                        values.get('direction_code') or 0, values.get('facilities_mask') or 0,
+                        values.get('region_id'), values.get('block_id'), values.get('community_id'),
+                        values.get('price_value') or 0, values.get('area_value') or 0)
+
+    # --- 索引维护 ---
+    def _load(self):
+        """从数据库读取全部房源，建立新的位图 (只读取分面用到的短字段)"""
+        ids_by_key = defaultdict(list)
+        buckets = defaultdict(set)
+        docs = {}
+        with self.app.app_context():
+            rows = db.session.execute(select(House.id, *(getattr(House, c) for c in FACET_COLUMNS)))
+            for row in rows:
+                doc = self._doc(row._mapping)
+                docs[row.id] = doc
+                for key in self._keys(doc):
+                    ids_by_key[key].append(row.id)
+                for key in self._bucket_keys(doc):
+                    buckets[key].add(row.id)
+        bitmaps = {key: make_bitmap(ids) for key, ids in ids_by_key.items()}
+        return bitmaps, dict(buckets), docs, make_bitmap(docs)
+
+    def _install(self, data):
+        self._bitmaps, self._buckets, self._docs, self._all = data
+        return len(self._docs)
+
+    def upsert(self, house_id, values):
+        self._modify(self._upsert, house_id, self._doc(values))
+
+    def remove(self, house_id):
+        self._modify(self._remove, house_id)
+
+    def _upsert(self, house_id, doc):
+        bit = 1 << house_id
+        self._remove(house_id)
+        self._docs[house_id] = doc
+        self._all |= bit
+        for key in self._keys(doc):
+            self._bitmaps[key] = self._bitmaps.get(key, 0) | bit
+        for key in self._bucket_keys(doc):
+            self._buckets.setdefault(key, set()).add(house_id)
+
+    def _remove(self, house_id):
+        doc = self._docs.pop(house_id, None)
+        if doc is None:
+            return
+        mask = ~(1 << house_id)
+        self._all &= mask
+        for key in self._keys(doc):
+            self._bitmaps[key] = self._bitmaps.get(key, 0) & mask
+        for key in self._bucket_keys(doc):
+            self._buckets.get(key, set()).discard(house_id)
+
+    # --- 查询 ---
+    def _range_bitmap(self, dimension, low, high):
+        """数值在 [low, high) 内的房源位图：整桶合并位图，两端不完整的桶逐个检查房源的数值"""
+        column, bounds = RANGE_BUCKETS[dimension]
+        bitmap = 0
+        partial = []
+        for index, lower in enumerate(bounds):
+            upper = bounds[index + 1] if index + 1 < len(bounds) else float('inf')
+            if upper <= low or lower >= high:
+                continue
+            if low <= lower and upper <= high:
+                bitmap |= self._bitmaps.get((dimension, index), 0)
+            else:
+                partial.extend(house_id for house_id in self._buckets.get((dimension, index), ())
+                               if low <= getattr(self._docs[house_id], column) < high)
+        return bitmap | make_bitmap(partial)
+
+    def _selection_bitmaps(self, rooms=None, rent_type_code=None, direction_code=None, facilities_mask=0):
+        """各维度筛选条件对应的位图，没有筛选的维度不出现在结果中"""
+        selected = {}
+        if rooms:
+            bitmap = 0
+            for (dimension, value), values_bitmap in self._bitmaps.items():
+                if dimension == 'rooms' and rooms_match(value, rooms):
+                    bitmap |= values_bitmap
+            selected['rooms'] = bitmap
+        if rent_type_code:
+            selected['rent_type'] = self._bitmaps.get(('rent_type', rent_type_code), 0)
+        if direction_code:
+            selected['direction'] = self._bitmaps.get(('direction', direction_code), 0)
+        if facilities_mask:
+            bitmap = self._all
+            for keyword, bit in FACILITY_BITS.items():
+                if facilities_mask & bit:
+                    bitmap &= self._bitmaps.get(('facilities', keyword), 0)
+            selected['facilities'] = bitmap
+        return selected
+
+    def facets(self, candidate_ids=None, location=None, price_range=None, area_range=None, **selection):
+        """
+        在候选房源 (None 表示全部房源) 中统计各分面的数量
+        location 为位置索引返回的 (层级, 编号)，price_range/area_range 为 [下限, 上限) 区间
+        户型/租住类型/朝向的计数不受本维度自身筛选的影响 (便于切换选项)，其余筛选条件都会生效
+        """
+        self._ensure_fresh()
+        with self._lock:
+            base = self._all
+            if candidate_ids is not None:
+                base &= make_bitmap(candidate_ids)
+            if location is not None:
+                base &= self._bitmaps.get(location, 0) if location[1] is not None else 0
+            if price_range is not None:
+                base &= self._range_bitmap('price', *price_range)
+            if area_range is not None:
+                base &= self._range_bitmap('area', *area_range)
+            selected = self._selection_bitmaps(**selection)
+
+            def scope(excluded=None):
+                bitmap = base
+                for dimension, dimension_bitmap in selected.items():
+                    if dimension != excluded:
+                        bitmap &= dimension_bitmap
+                return bitmap
+
+            matched = scope()
+            rooms_scope = scope('rooms')
+            rent_type_scope = scope('rent_type')
+            direction_scope = scope('direction')
+            rooms_counts = []
+            rent_type_counts = []
+            direction_counts = []
+            for (dimension, value), bitmap in self._bitmaps.items():
+                if dimension == 'rooms' and value:
+                    rooms_counts.append({'value': value, 'count': (rooms_scope & bitmap).bit_count()})
+                elif dimension == 'rent_type' and value:
+                    rent_type_counts.append({'value': decode_choice(value, RENT_TYPES),
+                                             'count': (rent_type_scope & bitmap).bit_count()})
+                elif dimension == 'direction' and value:
+                    direction_counts.append({'value': decode_choice(value, DIRECTIONS),
+                                             'count': (direction_scope & bitmap).bit_count()})
+            facilities_counts = [
+                {'value': label, 'key': keyword,
+                 'count': (matched & self._bitmaps.get(('facilities', keyword), 0)).bit_count()}
+                for keyword, label in FACILITIES
+            ]
+
+        def ranked(counts, limit=None):
+            counts = sorted((c for c in counts if c['count']), key=lambda c: c['count'], reverse=True)
+            return counts[:limit] if limit else counts
+
+        return {
+            'total': matched.bit_count(),
+            'rooms': ranked(rooms_counts, ROOMS_FACET_LIMIT),
+            'rent_type': ranked(rent_type_counts),
+            'direction': ranked(direction_counts),
+            'facilities': facilities_counts,
+        }
+
+
+# 初始化分面索引，创建facet_index对象
+facet_index = FacetIndex(app)
+
+
+# --- 增量维护：房源提交后同步更新本进程的位图 ---
+def _apply_index_changes(changes):
+    if not facet_index.loaded:
+        return
+    for change in changes:
+        if change.new is None:
+            facet_index.remove(change.id)
+        else:
+            facet_index.upsert(change.id, {c: change.new[c] for c in FACET_COLUMNS})
+
+
+house_changes.subscribe(_apply_index_changes, FACET_COLUMNS)
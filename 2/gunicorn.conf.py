@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+# 启动: gunicorn -c gunicorn.conf.py wsgi:application
+# 平滑重启: kill -HUP <主进程PID>，逐个替换 worker (预加载模式下不会重新加载代码)
+# 更新代码: kill -USR2 <主进程PID> 启动新的主进程，新 worker 就绪后再 kill -TERM 旧的主进程
+
+import multiprocessing
+import os
+
+# 项目是平铺的模块，在本目录下导入
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# worker 进程数和每个进程的线程数
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+# 在主进程中加载应用并预热，fork 出的 worker 共享预热好的内存 (写时复制)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+# 请求超时和平滑退出等待时间 (秒)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+# 每个 worker 处理一定数量的请求后重启，避免内存持续增长 (加随机抖动，防止同时重启)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+os.environ.setdefault('WARMUP_BACKGROUND', '0' if preload_app else '1')
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from wsgi import after_fork
+        after_fork()
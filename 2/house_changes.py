@@ -0,0 +1,235 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from settings import app
+from models import House
+
+logger = logging.getLogger(__name__)
+
+
+def previous_values(connection, target, fields):
+    """
+    房源修改前的字段值 (在 before_update/before_delete 中调用)
+    已加载的字段取修改历史；修改前没有加载的字段 (如过期后直接赋值，历史中没有旧值) 在 UPDATE 执行之前从数据库读取
+    """
+    state = inspect(target)
+    old = {}
+    missing = []
+    for field in fields:
+        history = state.attrs[field].history
+        if history.deleted:
+            old[field] = history.deleted[0]
+        elif not history.has_changes() and field not in state.unloaded:
+            old[field] = getattr(target, field)
+        else:
+            missing.append(field)
+    if missing:
+        table = House.__table__
+        row = connection.execute(select(*(table.c[f] for f in missing)).where(table.c.id == target.id)).one()
+        old.update(row._mapping)
+    return old
+
+
+class HouseChange:
+    """
+    一个房源在一次事务中的变化
+    - old: 事务开始前的字段值，本事务新插入的房源为 None
+    - new: 提交时的字段值，本事务删除的房源为 None
+    - changed: 本事务修改过的字段
+    """
+    __slots__ = ('id', 'old', 'new', 'changed')
+
+    def __init__(self, house_id, old):
+        self.id = house_id
+        self.old = old
+        self.new = {}
+        self.changed = set()
+
+
+class _Subscriber:
+    __slots__ = ('callback', 'fields', 'old_fields', 'background')
+
+    def __init__(self, callback, fields, old_fields, background):
+        self.callback = callback
+        self.fields = frozenset(fields)
+        self.old_fields = tuple(old_fields)
+        self.background = background
+
+    def wants(self, change):
+        return change.old is None or change.new is None or not self.fields.isdisjoint(change.changed)
+
+
+class HouseChangeCollector:
+    """
+    房源变化的收集器：只注册一组 ORM 事件，记录一次事务中房源的新增、修改和删除，
+    提交后分发给各个订阅者 (搜索/分面索引、图表快照、区域统计、价格走势、检索条件匹配等)，回滚时丢弃
+    - 每个订阅者声明关心的字段，只收到新增、删除或修改了这些字段的房源
+    - 需要旧值的订阅者声明 old_fields，只在它关心的字段被修改时读取一次旧值
+    - 更新进程内索引的订阅者在提交的线程中执行；需要写数据库的订阅者 (background=True)
+      交给后台线程执行，不占用请求的时间 (配置 HOUSE_CHANGES_ASYNC = False 时同步执行，测试和命令行使用)
+    """
+
+    def __init__(self, app=None):
+        self.asynchronous = True
+        self._subscribers = []
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker_pid = None
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('HOUSE_CHANGES_ASYNC', True)
+        self.asynchronous = app.config['HOUSE_CHANGES_ASYNC']
+        self.app = app
+        atexit.register(self.flush)
+
+    def subscribe(self, callback, fields, old_fields=(), background=False):
+        """注册订阅者，提交后以 [HouseChange] 调用 callback"""
+        self._subscribers.append(_Subscriber(callback, fields, old_fields, background))
+
+    @staticmethod
+    def transaction_info(session):
+        """与当前事务同生命周期的字典 (提交或回滚时丢弃)，用于缓存本事务中查到或新建的记录"""
+        return session.info.setdefault('house_changes_info', {})
+
+    # --- 收集 ---
+    @staticmethod
+    def _changes(target):
+        session = Session.object_session(target)
+        if session is None:
+            return None
+        return session.info.setdefault('house_changes', {})
+
+    def _fields(self, subscribers):
+        return {field for s in subscribers for field in s.fields}
+
+    def _capture_old(self, connection, target, change, subscribers):
+        fields = [f for s in subscribers for f in s.old_fields if f not in change.old]
+        if fields:
+            change.old.update(previous_values(connection, target, dict.fromkeys(fields)))
+
+    def _house_inserted(self, mapper, connection, target):
+        changes = self._changes(target)
+        if changes is None:
+            return
+        change = changes[target.id] = HouseChange(target.id, None)
+        change.new = {f: getattr(target, f) for f in self._fields(self._subscribers)}
+
+    def _house_updating(self, mapper, connection, target):
+        # 在 UPDATE 之前执行：修改前没有加载的字段还能从数据库读到旧值 (派生的 price_value 等此时已经同步)
+        changes = self._changes(target)
+        if changes is None:
+            return
+        state = inspect(target)
+        changed = {f for f in self._fields(self._subscribers) if state.attrs[f].history.has_changes()}
+        if not changed:
+            return
+        change = changes.get(target.id)
+        if change is None:
+            change = changes[target.id] = HouseChange(target.id, {})
+        change.changed |= changed
+        triggered = [s for s in self._subscribers if not s.fields.isdisjoint(changed)]
+        if change.old is not None:
+            self._capture_old(connection, target, change, triggered)
+        change.new.update({f: getattr(target, f) for f in self._fields(triggered)})
+
+    def _house_deleting(self, mapper, connection, target):
+        changes = self._changes(target)
+        if changes is None:
+            return
+        change = changes.get(target.id)
+        if change is None:
+            change = changes[target.id] = HouseChange(target.id, {})
+        if change.old is None:
+            # 本事务新插入又删除的房源，对订阅者没有影响
+            del changes[target.id]
+            return
+        self._capture_old(connection, target, change, self._subscribers)
+        change.new = None
+
+    # --- 分发 ---
+    def _committed(self, session):
+        session.info.pop('house_changes_info', None)
+        changes = session.info.pop('house_changes', None)
+        if not changes:
+            return
+        changes = list(changes.values())
+        for subscriber in self._subscribers:
+            wanted = [change for change in changes if subscriber.wants(change)]
+            if not wanted:
+                continue
+            if subscriber.background and self.asynchronous:
+                self._ensure_worker()
+                self._queue.put((subscriber, wanted))
+            else:
+                self._dispatch(subscriber, wanted)
+
+    @staticmethod
+    def _rolled_back(session):
+        session.info.pop('house_changes_info', None)
+        session.info.pop('house_changes', None)
+
+    def _dispatch(self, subscriber, changes):
+        try:
+            if subscriber.background:
+                with self.app.app_context():
+                    subscriber.callback(changes)
+            else:
+                subscriber.callback(changes)
+        except Exception:
+            # 数据已经提交，订阅者失败只记录日志 (对应的索引或统计在下一次全量重建时修正)
+            logger.exception('[房源变化] %s 执行失败', subscriber.callback.__qualname__)
+
+    # --- 后台执行 ---
+    def flush(self):
+        """在当前线程执行所有排队的后台任务 (进程退出时调用)"""
+        while True:
+            try:
+                subscriber, changes = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._dispatch(subscriber, changes)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """等待排队的后台任务全部执行完成"""
+        self._queue.join()
+
+    def _ensure_worker(self):
+        """每个进程启动一个后台线程 (兼容 gunicorn 的 fork 模式)"""
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='house-changes', daemon=True)
+            thread.start()
+
+    def _run(self):
+        while True:
+            subscriber, changes = self._queue.get()
+            try:
+                self._dispatch(subscriber, changes)
+            finally:
+                self._queue.task_done()
+
+
+# 初始化房源变化收集器，创建house_changes对象
+house_changes = HouseChangeCollector(app)
+
+event.listen(House, 'after_insert', house_changes._house_inserted)
+event.listen(House, 'before_update', house_changes._house_updating)
+event.listen(House, 'before_delete', house_changes._house_deleting)
+event.listen(Session, 'after_commit', house_changes._committed)
+event.listen(Session, 'after_rollback', house_changes._rolled_back)
@@ -1,39 +1,146 @@
-from flask import Blueprint, render_template, session, redirect, url_for, request
-from models import House, User
-from settings import db
-from sqlalchemy import or_
+import hashlib
+import json
+from functools import lru_cache
+
+from flask import Blueprint, render_template, session, redirect, url_for, request, make_response, current_app
+from werkzeug.http import is_resource_modified
+from models import House, User, UserCollection, UserViewHistory
+from sqlalchemy.exc import IntegrityError
+from settings import db, cache
+from utils import house_to_dict
+from view_counter import view_counter
+from search_index import search_index
+from pagination import KeysetPagination
+from recommender import similar_houses, recommend_for_user
+from read_model import card_query
+import saved_search
+from auth import current_user
 
 # 1. 创建一个名为 'pages' 的蓝图
 pages = Blueprint('pages', __name__)
 
 
+# --- 辅助函数 ---
+def get_hot_houses(limit):
+    """浏览量最高的房源 (缓存为字典列表，模板中可按属性访问)"""
+    def load():
+        hot_houses = card_query().order_by(House.page_views.desc()).limit(limit).all()
+        return [house_to_dict(h) for h in hot_houses]
+    return cache.get_or_set('hot_houses', limit, load)
+
+
+def get_new_houses(limit):
+    """最新发布的房源"""
+    def load():
+        new_houses = card_query().order_by(House.publish_time.desc()).limit(limit).all()
+        return [house_to_dict(h) for h in new_houses]
+    return cache.get_or_set('new_houses', limit, load)
+
+
+def invalidate_hot_houses(page_views_by_id):
+    """
+    浏览量写回数据库后调用，浏览量变化只会影响热门房源榜单：
+    有房源已在缓存的榜单中，或浏览量超过了榜单末尾时，才让对应的缓存失效
+    """
+    for limit in (8, 10):
+        hot_houses = cache.peek('hot_houses', limit)
+        if hot_houses is None:
+            continue
+        hot_ids = {h['id'] for h in hot_houses}
+        lowest = (hot_houses[-1]['page_views'] or 0) if hot_houses else 0
+        if (len(hot_houses) < limit
+                or any(house_id in hot_ids or page_views >= lowest
+                       for house_id, page_views in page_views_by_id.items())):
+            cache.invalidate('hot_houses', limit)
+
+
+view_counter.add_flush_listener(invalidate_hot_houses)
+
+
+@lru_cache(maxsize=None)
+def template_version(name):
+    """模板内容的摘要 (进程内只计算一次)，模板修改并重新部署后 ETag 随之变化"""
+    source, _, _ = current_app.jinja_env.loader.get_source(current_app.jinja_env, name)
+    return hashlib.sha1(source.encode()).hexdigest()[:12]
+
+
+def house_version(house):
+    """房源的版本号：最后修改时间，旧数据没有修改时间时使用发布时间"""
+    return house.updated_at or house.publish_time or 0
+
+
+def houses_digest(houses):
+    """一组房源的摘要 (房源ID、版本号和浏览量)，用作列表片段缓存的键"""
+    raw = ','.join(f'{h.id}:{house_version(h)}:{h.page_views}' for h in houses)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def recommendations_digest(houses):
+    """推荐房源的摘要 (房源ID和版本号，顺序有关)"""
+    raw = ','.join(f'{h.id}:{house_version(h)}' for h in houses)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def content_digest(value):
+    """可序列化为 JSON 的数据 (如缓存中的房源字典列表) 的摘要"""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def render_conditional(template, etag_parts, **context):
+    """
+    带 ETag 的页面渲染：客户端 (或 CDN) 缓存的版本仍然有效时直接返回 304，不再渲染模板
+    etag_parts 中需要包含所有影响页面内容的数据 (包括登录用户)
+    不发送 Last-Modified：页面中的列表、推荐等内容没有可靠的修改时间 (如房源被删除或移出当前页)，
+    只按时间判断会把已经变化的页面当作未修改
+    """
+    etag = hashlib.sha1(repr((template_version(template),) + tuple(etag_parts)).encode()).hexdigest()
+    if is_resource_modified(request.environ, etag=etag):
+        response = make_response(render_template(template, **context))
+    else:
+        response = make_response('', 304)
+    response.set_etag(etag)
+    # 每次使用缓存前都需要重新验证；页面头部包含登录用户信息时只允许浏览器缓存
+    response.cache_control.no_cache = True
+    if context.get('user') is not None:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response
+
+
 # --- 所有渲染页面的路由都移到这里 ---
 
 @pages.route('/')
 def index():
     """首页"""
-    hot_houses = House.query.order_by(House.page_views.desc()).limit(8).all()
-    new_houses = House.query.order_by(House.publish_time.desc()).limit(6).all()
-    user_name = session.get('user_name')
-    user = User.query.filter_by(name=user_name).first() if user_name else None
-    return render_template('index.html', hot_houses=hot_houses, new_houses=new_houses, user=user)
+    hot_houses = get_hot_houses(8)
+    new_houses = get_new_houses(6)
+    user = current_user()
+    return render_template('index.html', hot_houses=hot_houses, new_houses=new_houses, user=user,
+                           hot_houses_digest=content_digest(hot_houses), new_houses_digest=content_digest(new_houses))
 
 
 @pages.route('/list/<string:category>/<int:page>')
 def house_list(category, page):
     """房源列表页"""
     per_page = 10
-    query = House.query
     if category == 'pattern':
-        query = query.order_by(House.publish_time.desc())
+        sort_column = House.publish_time
     elif category == 'hot_house':
-        query = query.order_by(House.page_views.desc())
+        sort_column = House.page_views
+    else:
+        sort_column = House.id
 
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # 游标分页：按 (排序字段, id) 定位，深翻页不再依赖 OFFSET 和 COUNT(*)；只查询列表卡片需要的列
+    pagination = KeysetPagination(card_query(), sort_column, House.id, per_page, page=page,
+                                  cursor=request.args.get('cursor'), count_key=f'list:{category}')
     houses = pagination.items
-    user_name = session.get('user_name')
-    user = User.query.filter_by(name=user_name).first() if user_name else None
-    return render_template('list.html', houses=houses, pagination=pagination, user=user)
+    user = current_user()
+    digest = houses_digest(houses)
+    return render_conditional(
+        'list.html',
+        (category, pagination.page, request.args.get('cursor'), pagination.pages, digest, user and user.name),
+        houses=houses, pagination=pagination, user=user, houses_digest=digest)
 
 
 @pages.route('/query')
@@ -53,39 +160,43 @@ def search_result(page):
     per_page = 10
     addr = session.get('search_addr', '')
     rooms = session.get('search_rooms', '')
-    query = House.query
+    query = card_query()
     if addr:
-        query = query.filter(or_(
-            House.region.like(f"%{addr}%"),
-            House.block.like(f"%{addr}%"),
-            House.address.like(f"%{addr}%")
-        ))
+        query = query.filter(search_index.keyword_filter(addr, ('region', 'block', 'address')))
     if rooms:
-        query = query.filter(House.rooms.like(f"%{rooms}%"))
-    pagination = query.order_by(House.publish_time.desc()).paginate(page=page, per_page=per_page, error_out=False)
+        query = query.filter(search_index.keyword_filter(rooms, ('rooms',)))
+    pagination = KeysetPagination(query, House.publish_time, House.id, per_page, page=page,
+                                  cursor=request.args.get('cursor'), count_key=f'search:{addr}:{rooms}')
     houses = pagination.items
-    user_name = session.get('user_name')
-    user = User.query.filter_by(name=user_name).first() if user_name else None
-    return render_template('list.html', houses=houses, pagination=pagination, user=user)
+    user = current_user()
+    return render_template('list.html', houses=houses, pagination=pagination, user=user,
+                           houses_digest=houses_digest(houses))
 
 
 @pages.route('/house/<int:house_id>')
 def house_detail(house_id):
     """房源详情页"""
     house = House.query.get_or_404(house_id)
-    house.page_views = (house.page_views or 0) + 1
+    # 浏览量先记入缓冲区，由计数器定期批量写回数据库
+    view_counter.record(house.id)
 
-    user_name = session.get('user_name')
-    user = User.query.filter_by(name=user_name).first() if user_name else None
+    user = current_user()
     if user:
-        seen_ids = user.seen_id.split(',') if user.seen_id else []
-        if str(house_id) not in seen_ids:
-            seen_ids.append(str(house_id))
-            user.seen_id = ','.join(seen_ids)
-    db.session.commit()
-
-    recommendations = House.query.filter(House.address == house.address, House.id != house.id).limit(6).all()
-    return render_template('detail_page.html', house=house, recommendations=recommendations, user=user)
+        # 只有第一次浏览该房源时才写数据库 (唯一索引保证 O(1) 判断)
+        seen = UserViewHistory.query.filter_by(user_id=user.id, house_id=house_id).first()
+        if not seen:
+            db.session.add(UserViewHistory(user_id=user.id, house_id=house_id))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+
+    # 推荐房源 (离线任务更新) 的版本同时作为 ETag 和推荐区块片段缓存的键，推荐变化后页面随之更新
+    recommendations = similar_houses(house)
+    recommendations_version = recommendations_digest(recommendations)
+    return render_conditional(
+        'detail_page.html', (house.id, house_version(house), recommendations_version, user and user.name),
+        house=house, recommendations=recommendations, recommendations_version=recommendations_version, user=user)
 
 
 @pages.route('/user/<string:username>')
@@ -95,23 +206,36 @@ def user_page(username):
         return redirect(url_for('pages.index'))
 
     user = User.query.filter_by(name=username).first_or_404()
-
-    collected_houses = []
-    if user.collect_id:
-        collect_ids = [int(i) for i in user.collect_id.split(',') if i]
-        collected_houses = House.query.filter(House.id.in_(collect_ids)).all()
-
-    seen_houses = []
-    if user.seen_id:
-        seen_ids = [int(i) for i in user.seen_id.split(',') if i]
-        seen_houses = House.query.filter(House.id.in_(seen_ids)).all()
-
-    return render_template('user_page.html', user=user, collected_houses=collected_houses, seen_houses=seen_houses)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 50
+
+    # 收藏和浏览记录各用一次联表分页查询，按时间倒序；多取一条判断是否还有下一页
+    collected_houses = card_query().join(
+        UserCollection, UserCollection.house_id == House.id
+    ).filter(
+        UserCollection.user_id == user.id
+    ).order_by(UserCollection.created_at.desc()).offset((page - 1) * per_page).limit(per_page + 1).all()
+
+    seen_houses = card_query().join(
+        UserViewHistory, UserViewHistory.house_id == House.id
+    ).filter(
+        UserViewHistory.user_id == user.id
+    ).order_by(UserViewHistory.viewed_at.desc()).offset((page - 1) * per_page).limit(per_page + 1).all()
+    has_next = len(collected_houses) > per_page or len(seen_houses) > per_page
+    collected_houses, seen_houses = collected_houses[:per_page], seen_houses[:per_page]
+
+    recommended_houses = recommend_for_user(user.id)
+
+    # 保存的检索条件在上次访问之后匹配到的房源 (房源写入时已经匹配好)，展示后标记为已读
+    new_matches = saved_search.new_matches(user.id)
+    response = render_template('user_page.html', user=user, collected_houses=collected_houses,
+                               seen_houses=seen_houses, recommended_houses=recommended_houses,
+                               new_matches=new_matches, page=page, has_next=has_next)
+    if new_matches:
+        saved_search.mark_seen(user.id, [house['id'] for house in new_matches])
+    return response
 
 @pages.route('/search')
 def search_page():
     """渲染房源检索页面"""
-    user = None
-    if 'user_name' in session:
-        user = User.query.filter(User.name == session.get('user_name')).first()
-    return render_template('search.html', user=user)
\ No newline at end of file
+    return render_template('search.html', user=current_user())
\ No newline at end of file
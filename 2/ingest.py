@@ -0,0 +1,219 @@
+import csv
+import json
+import re
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects import mysql, sqlite
+
+from models import House
+from location import ensure_location
+from trends import TREND_TZ
+from utils import clean_price, parse_area, parse_facilities, encode_choice, DIRECTIONS, RENT_TYPES
+
+# 可以从数据文件导入的房源字段
+TEXT_FIELDS = ('title', 'rooms', 'area', 'price', 'direction', 'rent_type', 'region', 'block', 'address',
+               'traffic', 'facilities', 'highlights', 'matching', 'travel', 'landlord', 'phone_num', 'house_num')
+# 更新已有房源时不覆盖的字段 (浏览量由网站自己维护)
+PRESERVED_FIELDS = ('page_views',)
+# 户型中的中文数字
+CHINESE_DIGITS = {'一': '1', '二': '2', '两': '2', '三': '3', '四': '4', '五': '5', '六': '6', '七': '7', '八': '8', '九': '9'}
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d')
+# 数据文件中不带时区的日期按北京时间解析 (与价格走势的时间桶一致)，不受服务器时区影响
+SOURCE_TZ = TREND_TZ
+
+
+class IngestStats:
+    """导入过程的统计信息"""
+
+    def __init__(self):
+        self.read = 0
+        self.duplicates = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = Counter()
+        # 写入的房源所在的区 (包括更新前所在的区)，导入完成后刷新这些区的统计
+        self.regions = set()
+        self.started_at = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def summary(self):
+        rate = self.read / self.elapsed if self.elapsed else 0
+        lines = [
+            f'读取 {self.read} 条，新增 {self.inserted} 条，更新 {self.updated} 条，'
+            f'重复 {self.duplicates} 条，拒绝 {sum(self.rejected.values())} 条',
+            f'耗时 {self.elapsed:.1f} 秒，{rate:.0f} 条/秒',
+        ]
+        for reason, count in self.rejected.most_common():
+            lines.append(f'  拒绝原因 {reason}: {count} 条')
+        return '\n'.join(lines)
+
+
+# --- 第一步：流式读取 ---
+def read_records(path, fmt=None):
+    """逐行读取 CSV 或 JSONL 文件，每次产出一个字典，不会把整个文件读入内存"""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.json', '.ndjson')) else 'csv')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    # 每行必须是一个 JSON 对象，数组、字符串等按格式错误拒绝
+                    yield record if isinstance(record, dict) else {'_invalid': line}
+
+
+# --- 第二步：校验与规范化 ---
+def normalize_rooms(rooms):
+    """'两室一厅' -> '2室1厅'，并去掉空白"""
+    rooms = re.sub(r'\s+', '', rooms)
+    return ''.join(CHINESE_DIGITS.get(ch, ch) for ch in rooms)
+
+
+def parse_publish_time(value):
+    """发布时间统一为时间戳，支持时间戳和常见的日期格式，无法解析时返回 None"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    for fmt in DATE_FORMATS:
+        try:
+            return int(datetime.strptime(value, fmt).replace(tzinfo=SOURCE_TZ).timestamp())
+        except ValueError:
+            continue
+    return None
+
+
+def normalize(records, stats):
+    """校验每条记录并把数值字段解析一次，不合格的记录计入拒绝统计"""
+    for record in records:
+        stats.read += 1
+        if '_invalid' in record:
+            stats.rejected['格式错误'] += 1
+            continue
+        row = {field: str(record[field]).strip() if record.get(field) is not None else None
+               for field in TEXT_FIELDS}
+        if not row['house_num']:
+            stats.rejected['缺少房源编号'] += 1
+            continue
+        if not row['region']:
+            stats.rejected['缺少所在区'] += 1
+            continue
+        row['price_value'] = clean_price(row['price'])
+        if not row['price_value']:
+            stats.rejected['价格无效'] += 1
+            continue
+        row['area_value'] = parse_area(row['area'])
+        if not row['area_value']:
+            stats.rejected['面积无效'] += 1
+            continue
+        if row['rooms']:
+            row['rooms'] = normalize_rooms(row['rooms'])
+        row['facilities_mask'] = parse_facilities(row['facilities'])
+        row['direction_code'] = encode_choice(row['direction'], DIRECTIONS)
+        row['rent_type_code'] = encode_choice(row['rent_type'], RENT_TYPES)
+        row['publish_time'] = parse_publish_time(record.get('publish_time'))
+        if record.get('publish_time') not in (None, '') and row['publish_time'] is None:
+            stats.rejected['发布时间无效'] += 1
+            continue
+        yield row
+
+
+# --- 第三步：按房源编号去重 ---
+def dedupe(rows, stats):
+    """同一次导入中重复出现的房源编号只保留第一条"""
+    seen = set()
+    for row in rows:
+        if row['house_num'] in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(row['house_num'])
+        yield row
+
+
+# --- 第四步：分批 ---
+def chunked(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- 第五步：批量写入 ---
+def upsert_statement(dialect_name, table, update_columns):
+    """按房源编号 (唯一索引) 插入或更新的语句：MySQL 使用 ON DUPLICATE KEY UPDATE，SQLite 使用 ON CONFLICT"""
+    if dialect_name == 'mysql':
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in update_columns})
+    if dialect_name == 'sqlite':
+        stmt = sqlite.insert(table)
+        return stmt.on_conflict_do_update(index_elements=[table.c.house_num],
+                                          set_={name: stmt.excluded[name] for name in update_columns})
+    raise NotImplementedError(f'不支持的数据库: {dialect_name}')
+
+
+def existing_houses(conn, house_nums):
+    """已存在的房源编号 -> 所在区 (用于统计新增/更新的数量，以及刷新房源原来所在的区)"""
+    table = House.__table__
+    return dict(conn.execute(select(table.c.house_num, table.c.region).where(table.c.house_num.in_(house_nums))).all())
+
+
+def upsert_batch(conn, batch, stats):
+    """
+    一批房源按房源编号写入：一条多行的 upsert 语句，不存在的插入，已存在的更新 (保留 PRESERVED_FIELDS)
+    写入本身不依赖事先读取的结果，其他导入或网站在读取之后写入同一个编号时也不会违反唯一索引
+    """
+    table = House.__table__
+    existing = existing_houses(conn, [row['house_num'] for row in batch])
+    # 更新后换了区的房源，原来的区也需要刷新统计
+    stats.regions.update(region for region in existing.values() if region)
+    now = int(time.time())
+    locations = {}
+    for row in batch:
+        stats.regions.add(row['region'])
+        row['updated_at'] = now
+        row['region_id'], row['block_id'], row['community_id'] = ensure_location(
+            conn, row['region'], row['block'], row['address'], locations)
+        row.update({name: 0 for name in PRESERVED_FIELDS})
+    update_columns = [name for name in batch[0] if name != 'house_num' and name not in PRESERVED_FIELDS]
+    conn.execute(upsert_statement(conn.dialect.name, table, update_columns), batch)
+    # 读取之后被其他进程插入的编号计为新增 (只影响统计数字)
+    updated = sum(1 for row in batch if row['house_num'] in existing)
+    stats.inserted += len(batch) - updated
+    stats.updated += updated
+
+
+def ingest(engine, paths, fmt=None, batch_size=1000, on_batch=None):
+    """
+    导入一个或多个数据文件：读取 -> 规范化 -> 去重 -> 分批写入
+    每一批在单独的事务中提交，返回 IngestStats
+    """
+    stats = IngestStats()
+
+    def records():
+        for path in paths:
+            yield from read_records(path, fmt)
+
+    for batch in chunked(dedupe(normalize(records(), stats), stats), batch_size):
+        with engine.begin() as conn:
+            upsert_batch(conn, batch, stats)
+        if on_batch is not None:
+            on_batch(stats)
+    return stats
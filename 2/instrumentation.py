@@ -0,0 +1,308 @@
+import hmac
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, abort, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# 请求耗时直方图的分桶 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# 日志记录中的标准属性，其余属性作为结构化字段输出
+_STANDARD_LOG_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class StructuredFormatter(logging.Formatter):
+    """把日志输出为单行 JSON，logger.info(..., extra={...}) 中的字段一并输出"""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_LOG_ATTRS:
+                payload[key] = value
+        if has_request_context():
+            payload.setdefault('endpoint', request.endpoint)
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(app):
+    """
+    按 STRUCTURED_LOGGING 配置根日志输出单行 JSON
+    由运行入口 (wsgi.py、app.py 的开发服务器) 调用，导入模块时不修改全局的日志配置；重复调用不会重复添加
+    """
+    if not app.config.get('STRUCTURED_LOGGING'):
+        return
+    root = logging.getLogger()
+    if any(isinstance(h.formatter, StructuredFormatter) for h in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter())
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+class Histogram:
+    """Prometheus 风格的累积直方图"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class SamplingProfiler:
+    """
+    简单的采样分析器：在后台线程中定时抓取被分析请求所在线程的调用栈，
+    按折叠栈 (flamegraph 可直接使用的格式) 汇总
+    """
+
+    def __init__(self, interval=0.005, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+
+    def start(self, thread_id):
+        stop = threading.Event()
+        thread = threading.Thread(target=self._sample, args=(thread_id, stop), daemon=True)
+        thread.start()
+        return stop
+
+    def _sample(self, thread_id, stop):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                code = frame.f_code
+                names.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}')
+                frame = frame.f_back
+            if names:
+                with self._lock:
+                    self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self, limit=200):
+        with self._lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common(limit))
+
+
+class Instrumentation:
+    """
+    请求级别的性能指标：
+    每个接口的耗时直方图、SQL 查询次数与耗时、疑似 N+1 查询、ORM 查询返回的行数 (按比例采样)、模板渲染耗时，
+    通过 /metrics 以 Prometheus 文本格式输出；可选的采样分析器通过 /metrics/profile 查看
+    这两个接口只允许 METRICS_ALLOWED_IPS 中的地址访问，或者携带 METRICS_TOKEN (Authorization: Bearer <token>)
+    """
+
+    def __init__(self, app=None, cache=None):
+        self.cache = cache
+        self.n_plus_one_threshold = 5
+        self.profiler = None
+        self.profile_sample_rate = 0.0
+        self.row_sample_rate = 0.0
+        self.allowed_ips = frozenset()
+        self.token = None
+        self._lock = threading.Lock()
+        self._latency = defaultdict(Histogram)
+        self._requests = Counter()
+        self._queries = Counter()
+        self._query_seconds = defaultdict(float)
+        self._rows = Counter()
+        self._row_sampled = Counter()
+        self._n_plus_one = Counter()
+        self._templates = defaultdict(lambda: Histogram())
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('PROFILER_ENABLED', False)
+        app.config.setdefault('PROFILER_SAMPLE_RATE', 0.01)
+        app.config.setdefault('ROW_COUNT_SAMPLE_RATE', 0.01)
+        app.config.setdefault('STRUCTURED_LOGGING', True)
+        app.config.setdefault('METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+        app.config.setdefault('METRICS_TOKEN', None)
+        self.n_plus_one_threshold = app.config['N_PLUS_ONE_THRESHOLD']
+        self.row_sample_rate = app.config['ROW_COUNT_SAMPLE_RATE']
+        if app.config['PROFILER_ENABLED']:
+            self.profiler = SamplingProfiler()
+            self.profile_sample_rate = app.config['PROFILER_SAMPLE_RATE']
+        self.allowed_ips = frozenset(app.config['METRICS_ALLOWED_IPS'])
+        self.token = app.config['METRICS_TOKEN']
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Session, 'do_orm_execute', self._orm_execute)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        app.add_url_rule('/metrics/profile', 'metrics_profile', self.profile_view)
+
+    # --- Flask 请求钩子 ---
+    def _before_request(self):
+        g._metrics = {'start': time.perf_counter(), 'queries': 0, 'query_seconds': 0.0,
+                      'rows': 0, 'count_rows': random.random() < self.row_sample_rate,
+                      'statements': Counter(), 'profile': None}
+        if self.profiler is not None and random.random() < self.profile_sample_rate:
+            g._metrics['profile'] = self.profiler.start(threading.get_ident())
+
+    def _after_request(self, response):
+        metrics = g.get('_metrics')
+        if metrics is not None:
+            metrics['status'] = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        metrics = g.pop('_metrics', None)
+        if metrics is None:
+            return
+        if metrics['profile'] is not None:
+            metrics['profile'].set()
+        endpoint = request.endpoint or 'unknown'
+        elapsed = time.perf_counter() - metrics['start']
+        repeated = {stmt: n for stmt, n in metrics['statements'].items() if n >= self.n_plus_one_threshold}
+        with self._lock:
+            self._latency[endpoint].observe(elapsed)
+            self._requests[(endpoint, metrics.get('status', 500))] += 1
+            self._queries[endpoint] += metrics['queries']
+            self._query_seconds[endpoint] += metrics['query_seconds']
+            if metrics['count_rows']:
+                self._row_sampled[endpoint] += 1
+                self._rows[endpoint] += metrics['rows']
+            if repeated:
+                self._n_plus_one[endpoint] += 1
+        if repeated:
+            stmt, count = max(repeated.items(), key=lambda item: item[1])
+            logger.warning('疑似 N+1 查询', extra={'endpoint': endpoint, 'repeat': count, 'statement': stmt[:200]})
+
+    # --- 模板渲染耗时 ---
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('_template_starts', []).append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        starts = g.get('_template_starts') if has_request_context() else None
+        if starts:
+            elapsed = time.perf_counter() - starts.pop()
+            with self._lock:
+                self._templates[template.name or 'unknown'].observe(elapsed)
+
+    # --- SQLAlchemy 事件 ---
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and '_metrics' in g:
+            conn.info.setdefault('_query_starts', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_query_starts')
+        if not starts or not has_request_context() or '_metrics' not in g:
+            return
+        metrics = g._metrics
+        metrics['queries'] += 1
+        metrics['query_seconds'] += time.perf_counter() - starts.pop()
+        metrics['statements'][statement] += 1
+
+    def _orm_execute(self, orm_execute_state):
+        """
+        统计 ORM 查询返回的行数：在结果层面计数，实体、列和 Bundle (如 card_query 的 HouseCard) 都计算在内
+        计数需要把结果完整读取后重新包装，只对按 ROW_COUNT_SAMPLE_RATE 采样的请求进行；分批读取 (yield_per) 的查询不统计
+        """
+        metrics = g.get('_metrics') if has_request_context() else None
+        if not orm_execute_state.is_select or metrics is None or not metrics['count_rows']:
+            return None
+        options = orm_execute_state.execution_options
+        if options.get('yield_per') or options.get('stream_results'):
+            return None
+        frozen = orm_execute_state.invoke_statement().freeze()
+        metrics['rows'] += len(frozen.data)
+        return frozen()
+
+    # --- 输出 ---
+    def render_metrics(self):
+        lines = []
+        with self._lock:
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for endpoint, hist in sorted(self._latency.items()):
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {hist.total}')
+                lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {hist.sum:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {hist.total}')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+            lines.append('# TYPE db_queries_total counter')
+            for endpoint, count in sorted(self._queries.items()):
+                lines.append(f'db_queries_total{{endpoint="{endpoint}"}} {count}')
+            lines.append('# TYPE db_query_duration_seconds_total counter')
+            for endpoint, seconds in sorted(self._query_seconds.items()):
+                lines.append(f'db_query_duration_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+            # 行数只在采样的请求中统计，每个请求的平均行数 = 行数 / 采样请求数
+            lines.append('# TYPE db_rows_materialized_total counter')
+            for endpoint, count in sorted(self._rows.items()):
+                lines.append(f'db_rows_materialized_total{{endpoint="{endpoint}"}} {count}')
+            lines.append('# TYPE db_rows_sampled_requests_total counter')
+            for endpoint, count in sorted(self._row_sampled.items()):
+                lines.append(f'db_rows_sampled_requests_total{{endpoint="{endpoint}"}} {count}')
+            lines.append('# TYPE db_n_plus_one_requests_total counter')
+            for endpoint, count in sorted(self._n_plus_one.items()):
+                lines.append(f'db_n_plus_one_requests_total{{endpoint="{endpoint}"}} {count}')
+            lines.append('# TYPE template_render_seconds summary')
+            for name, hist in sorted(self._templates.items()):
+                lines.append(f'template_render_seconds_sum{{template="{name}"}} {hist.sum:.6f}')
+                lines.append(f'template_render_seconds_count{{template="{name}"}} {hist.total}')
+        if self.cache is not None:
+            stats = self.cache.stats()
+            lines.append('# TYPE cache_requests_total counter')
+            for namespace, counts in stats['namespaces'].items():
+                lines.append(f'cache_requests_total{{namespace="{namespace}",result="hit"}} {counts["hits"]}')
+                lines.append(f'cache_requests_total{{namespace="{namespace}",result="miss"}} {counts["misses"]}')
+                lines.append(f'cache_requests_total{{namespace="{namespace}",result="coalesced"}} {counts["coalesced"]}')
+        return '\n'.join(lines) + '\n'
+
+    def check_access(self):
+        """
+        监控接口只对内部开放：本机 (或配置的地址) 访问，或者携带正确的令牌；否则按不存在处理
+        /api/cache/stats 等其他内部接口也使用这个检查
+        """
+        if self.token:
+            scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+            if scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), self.token.encode()):
+                return
+        if request.remote_addr in self.allowed_ips:
+            return
+        abort(404)
+
+    def metrics_view(self):
+        self.check_access()
+        return Response(self.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    def profile_view(self):
+        self.check_access()
+        if self.profiler is None:
+            return Response('profiler disabled (PROFILER_ENABLED=False)\n', status=404, mimetype='text/plain')
+        return Response(self.profiler.collapsed() + '\n', mimetype='text/plain')
@@ -0,0 +1,282 @@
+from collections import namedtuple
+
+from sqlalchemy import event, false, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from settings import app, db
+from models import House, Region, Block, Community
+from analytics import normalize_region, parse_location
+from refreshable import RefreshableIndex
+from house_changes import house_changes
+
+# 决定房源位置的字段
+LOCATION_FIELDS = ('region', 'block', 'address')
+# 位置联想最多返回的数量
+SUGGEST_LIMIT = 10
+
+# 房源的位置编号 (区, 街道, 小区)，上一级为空时下一级也为空
+LocationIds = namedtuple('LocationIds', ('region_id', 'block_id', 'community_id'))
+EMPTY_IDS = LocationIds(None, None, None)
+
+
+def location_names(region, block, address):
+    """房源的位置字段 -> 归一化的 (区, 街道, 小区)"""
+    return normalize_region(region), (block or '').strip(), (address or '').strip()
+
+
+# --- 位置表的写入 ---
+def _ensure_row(conn, model, name, parent_id, created):
+    """查找或插入一条位置记录，返回编号；created 缓存本事务中已经查到或新建的记录"""
+    table = model.__table__
+    parent_column = {Block: table.c.get('region_id'), Community: table.c.get('block_id')}.get(model)
+    key = (table.name, parent_id, name)
+    if key in created:
+        return created[key]
+    where = [table.c.name == name]
+    values = {'name': name}
+    if parent_column is not None:
+        where.append(parent_column == parent_id)
+        values[parent_column.name] = parent_id
+    row_id = conn.execute(select(table.c.id).where(*where)).scalar()
+    if row_id is None:
+        try:
+            with conn.begin_nested():
+                row_id = conn.execute(table.insert().values(**values)).inserted_primary_key[0]
+        except IntegrityError:
+            # 其他进程同时插入了同一个位置
+            row_id = conn.execute(select(table.c.id).where(*where)).scalar_one()
+    created[key] = row_id
+    return row_id
+
+
+def ensure_location(conn, region, block, address, created=None):
+    """
+    房源位置对应的 (区, 街道, 小区) 编号，位置表中没有的记录就地插入
+    已经加载到内存索引中的位置不再查询数据库
+    """
+    names = location_names(region, block, address)
+    if not names[0]:
+        return EMPTY_IDS
+    known = location_index.lookup(*names)
+    if known is not None:
+        return known
+    created = {} if created is None else created
+    region_id = _ensure_row(conn, Region, names[0], None, created)
+    block_id = _ensure_row(conn, Block, names[1], region_id, created) if names[1] else None
+    community_id = _ensure_row(conn, Community, names[2], block_id, created) if block_id and names[2] else None
+    return LocationIds(region_id, block_id, community_id)
+
+
+class _Node:
+    """位置树的节点 (区/街道/小区)"""
+    __slots__ = ('id', 'name', 'level', 'parent', 'children')
+
+    def __init__(self, node_id, name, level, parent=None):
+        self.id = node_id
+        self.name = name
+        self.level = level
+        self.parent = parent
+        self.children = {}
+
+    def path(self):
+        names = []
+        node = self
+        while node is not None and node.level is not None:
+            names.append(node.name)
+            node = node.parent
+        return '-'.join(reversed(names))
+
+    def ids(self):
+        ids = {}
+        node = self
+        while node is not None and node.level is not None:
+            ids[node.level] = node.id
+            node = node.parent
+        return LocationIds(ids.get('region'), ids.get('block'), ids.get('address'))
+
+
+class LocationIndex(RefreshableIndex):
+    """
+    位置维度的内存索引 (进程内)
+    按 区 -> 街道 -> 小区 组织的位置树，用于把 '区-街道-小区' 解析为编号、提供逐级下钻的菜单；
+    另外对全部位置名称建立字符前缀树 (trie)，用于输入联想
+    """
+
+    refresh_config_key = 'LOCATION_INDEX_REFRESH_INTERVAL'
+
+    def __init__(self, app=None):
+        self.complete = False
+        self._root = _Node(None, '', None)
+        self._trie = {}
+        super().__init__(app)
+
+    # --- 索引维护 ---
+    def _load(self):
+        """从位置表全量加载；还有房源没有回填位置编号时 complete 为 False (位置筛选退回文本匹配)"""
+        root = _Node(None, '', None)
+        trie = {}
+        with self.app.app_context():
+            regions = {row.id: _Node(row.id, row.name, 'region', root)
+                       for row in db.session.execute(select(Region.id, Region.name))}
+            blocks = {}
+            for row in db.session.execute(select(Block.id, Block.region_id, Block.name)):
+                parent = regions.get(row.region_id)
+                if parent is not None:
+                    blocks[row.id] = parent.children[row.name] = _Node(row.id, row.name, 'block', parent)
+            communities = []
+            for row in db.session.execute(select(Community.id, Community.block_id, Community.name)):
+                parent = blocks.get(row.block_id)
+                if parent is not None:
+                    node = parent.children[row.name] = _Node(row.id, row.name, 'address', parent)
+                    communities.append(node)
+            missing = db.session.execute(
+                select(House.id).where(House.region_id.is_(None), House.region.isnot(None), House.region != '')
+                .limit(1)).first()
+        for node in regions.values():
+            root.children[node.name] = node
+        for node in (*regions.values(), *blocks.values(), *communities):
+            self._trie_insert(trie, node)
+        return root, trie, bool(regions) and missing is None, (len(regions), len(blocks), len(communities))
+
+    def _install(self, data):
+        self._root, self._trie, self.complete, counts = data
+        return counts
+
+    @staticmethod
+    def _trie_insert(trie, node):
+        current = trie
+        for char in node.name.lower():
+            current = current.setdefault(char, {})
+        current.setdefault(None, []).append(node)
+
+    def _find(self, names):
+        node = self._root
+        for name in names:
+            if not name:
+                break
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    # --- 查询 ---
+    def lookup(self, region, block='', address=''):
+        """已加载的位置编号 (不触发重建，供写入房源时使用)，索引中没有时返回 None"""
+        with self._lock:
+            node = self._find((region, block, address))
+            return None if node is None or node is self._root else node.ids()
+
+    def resolve(self, region_str):
+        """'区-街道-小区' -> LocationIds，位置不存在时返回 None"""
+        self._ensure_fresh()
+        with self._lock:
+            node = self._find(parse_location(region_str))
+            return None if node is None or node is self._root else node.ids()
+
+    def match(self, region, block='', address=''):
+        """
+        位置对应的 (层级, 编号)，层级为 'region'/'block'/'address'，位置不存在时编号为 None
+        位置表尚未建立或还有房源没有回填编号时返回 None，由调用方退回文本匹配
+        """
+        self._ensure_fresh()
+        if not self.complete:
+            return None
+        with self._lock:
+            node = self._find((normalize_region(region), block, address))
+            if node is None and self._stale:
+                # 位置表有新增记录、索引正在后台重建，暂时退回文本匹配
+                return None
+            if node is None or node is self._root:
+                return 'region', None
+            return node.level, node.id
+
+    def filters(self, region, block='', address=''):
+        """位置的筛选条件：房源的区/街道/小区编号等值查询 (都有索引)，无法使用编号时返回 None"""
+        location = self.match(region, block, address)
+        if location is None:
+            return None
+        level, node_id = location
+        if node_id is None:
+            return [false()]
+        column = {'region': House.region_id, 'block': House.block_id, 'address': House.community_id}[level]
+        return [column == node_id]
+
+    def children(self, region_str=''):
+        """下钻菜单：下一级位置 [{'id', 'name'}]，region_str 为空时返回全部区，位置不存在时返回 None"""
+        self._ensure_fresh()
+        with self._lock:
+            node = self._find(parse_location(region_str)) if region_str else self._root
+            if node is None:
+                return None
+            return [{'id': child.id, 'name': child.name} for child in node.children.values()]
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """名称以 prefix 开头的位置 (区、街道、小区)，名称越短越靠前"""
+        self._ensure_fresh()
+        with self._lock:
+            current = self._trie
+            for char in prefix.lower():
+                current = current.get(char)
+                if current is None:
+                    return []
+            matches = []
+            level = [current]
+            while level and len(matches) < limit:
+                next_level = []
+                for trie_node in level:
+                    matches.extend(trie_node.get(None, ()))
+                    next_level.extend(child for char, child in trie_node.items() if char is not None)
+                level = next_level
+            return [
+                {'id': node.id, 'level': node.level, 'name': node.name, 'path': node.path()}
+                for node in matches[:limit]
+            ]
+
+
+# 初始化位置索引，创建location_index对象
+location_index = LocationIndex(app)
+
+
+def location_filters(region, block='', address=''):
+    """位置筛选：优先使用位置编号列，位置表尚未建立完整时退回文本匹配"""
+    filters = location_index.filters(region, block, address)
+    if filters is not None:
+        return filters
+    region = normalize_region(region)
+    filters = [House.region.in_([region, region + '区'])]
+    if block:
+        filters.append(House.block == block)
+        if address:
+            filters.append(House.address == address)
+    return filters
+
+
+# --- 房源写入时同步位置编号 ---
+# insert=True：在变更收集器记录新值之前执行，订阅者收到的是更新后的位置编号
+@event.listens_for(House, 'before_insert', insert=True)
+@event.listens_for(House, 'before_update', insert=True)
+def _assign_location_ids(mapper, connection, target):
+    state = inspect(target)
+    if target.region_id is not None and not any(state.attrs[f].history.has_changes() for f in LOCATION_FIELDS):
+        return
+    session = Session.object_session(target)
+    created = house_changes.transaction_info(session).setdefault('location_rows', {}) if session is not None else {}
+    ids = ensure_location(connection, target.region, target.block, target.address, created)
+    target.region_id, target.block_id, target.community_id = ids
+
+
+def _refresh_location_index(changes):
+    # 提交的房源用到了索引中还没有的位置 (新插入或由其他进程插入)，重新加载索引
+    if not location_index.loaded:
+        return
+    for change in changes:
+        if change.new is None:
+            continue
+        names = location_names(*(change.new[f] for f in LOCATION_FIELDS))
+        if names[0] and location_index.lookup(*names) is None:
+            location_index.invalidate()
+            return
+
+
+house_changes.subscribe(_refresh_location_index, LOCATION_FIELDS)
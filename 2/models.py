@@ -1,10 +1,25 @@
+import time
+
 from settings import db
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql
+from utils import clean_price, parse_area, parse_facilities, encode_choice, DIRECTIONS, RENT_TYPES, FACILITY_BITS
+
+# 长文本类型 (MySQL下使用LONGTEXT，避免TEXT的64KB上限)
+LongText = db.Text().with_variant(mysql.LONGTEXT(), 'mysql')
 
 
 # house_info表的模型类
 class House(db.Model):
     # 指定表名
     __tablename__ = 'house_info'
+    __table_args__ = (
+        # 列表页游标分页使用的联合索引
+        db.Index('ix_house_publish_time_id', 'publish_time', 'id'),
+        db.Index('ix_house_page_views_id', 'page_views', 'id'),
+        # 导入数据时按房源编号 upsert (已有重复编号的数据库需要先清理重复记录，再执行 flask sync-schema)
+        db.Index('uq_house_house_num', 'house_num', unique=True),
+    )
     # 主键
     id = db.Column(db.Integer, primary_key=True)
     # 房源标题
@@ -43,18 +58,61 @@ class House(db.Model):
     landlord = db.Column(db.String(100))
     # 房东电话
     phone_num = db.Column(db.String(100))
-    # 房源编号
+    # 房源编号 (导入数据时按编号去重)
     house_num = db.Column(db.String(100))
+    # 价格数值 (由price解析而来，用于数据库端的范围筛选)
+    price_value = db.Column(db.Float, index=True)
+    # 面积数值 (由area解析而来，用于数据库端的范围筛选)
+    area_value = db.Column(db.Float, index=True)
+    # 配套设施位掩码 (由facilities解析而来，位序号见 utils.FACILITIES)
+    facilities_mask = db.Column(db.Integer, default=0)
+    # 朝向编码 (utils.DIRECTIONS 中的序号 + 1，0 表示未知)
+    direction_code = db.Column(db.SmallInteger, default=0)
+    # 租住类型编码 (utils.RENT_TYPES 中的序号 + 1，0 表示未知)
+    rent_type_code = db.Column(db.SmallInteger, default=0, index=True)
+    # 最后修改时间 (时间戳)，用于页面片段缓存的键以及 ETag/Last-Modified
+    updated_at = db.Column(db.Integer)
+    # 所在区/街道/小区的编号 (由 region/block/address 归一化而来，位置筛选使用整数等值查询)
+    region_id = db.Column(db.Integer, db.ForeignKey('house_location_region.id'), index=True)
+    block_id = db.Column(db.Integer, db.ForeignKey('house_location_block.id'), index=True)
+    community_id = db.Column(db.Integer, db.ForeignKey('house_location_community.id'), index=True)
+
+    def sync_numeric_fields(self):
+        """根据文本字段重新计算派生列：价格/面积数值、设施位掩码、朝向和租住类型编码"""
+        self.price_value = clean_price(self.price)
+        self.area_value = parse_area(self.area)
+        self.facilities_mask = parse_facilities(self.facilities)
+        self.direction_code = encode_choice(self.direction, DIRECTIONS)
+        self.rent_type_code = encode_choice(self.rent_type, RENT_TYPES)
+
+    def has_facility(self, keyword):
+        """是否有某项配套设施 (尚未回填位掩码的旧数据退回子串判断)"""
+        if self.facilities_mask is None:
+            return keyword in (self.facilities or '')
+        return bool(self.facilities_mask & FACILITY_BITS[keyword])
 
     # 重写__repr__方法，方便查看对象的输出内容
     def __repr__(self):
         return 'House: %s, %s' % (self.address, self.id)
 
+
+# 房源写入数据库前，同步刷新派生列和修改时间
+# 修改时间同时是页面 ETag 和片段缓存的版本号，同一秒内的多次修改也要递增
+@event.listens_for(House, 'before_insert')
+@event.listens_for(House, 'before_update')
+def sync_house_numeric_fields(mapper, connection, target):
+    target.sync_numeric_fields()
+    target.updated_at = max(int(time.time()), (target.updated_at or 0) + 1)
+
 # house_recommend表的模型类
-# 用来存储用户的浏览记录
+# 预先计算的房源推荐：user_id 为空的行表示 house_id 与 similar_id 两个房源相似
 class Recommend(db.Model):
     # 指定表名
     __tablename__ = 'house_recommend'
+    __table_args__ = (
+        # 详情页按相似度取前K个相似房源
+        db.Index('ix_house_recommend_house_similarity', 'house_id', 'similarity'),
+    )
     # 主键
     id = db.Column(db.Integer, primary_key=True)
     # 用户ID
@@ -67,8 +125,12 @@ class Recommend(db.Model):
     address = db.Column(db.String(100))
     # 房源所在街道
     block = db.Column(db.String(100))
-    # 浏览次数
+    # 共同浏览/收藏的加权次数
     score = db.Column(db.Integer)
+    # 相似房源ID
+    similar_id = db.Column(db.Integer)
+    # 相似度 (余弦相似度)
+    similarity = db.Column(db.Float)
 
 
 # user_info表的模型类
@@ -86,11 +148,236 @@ class User(db.Model):
     email = db.Column(db.String(100))
     # 用户住址
     addr = db.Column(db.String(100))
-    # 用户收藏的房源编号
+    # 用户收藏的房源编号 (旧字段，已迁移到 user_collection 表)
     collect_id = db.Column(db.String(250))
-    # 用户浏览记录
+    # 用户浏览记录 (旧字段，已迁移到 user_view_history 表)
     seen_id = db.Column(db.String(250))
 
     # 重写__repr__方法，方便查看对象的输出内容
     def __repr__(self):
-        return 'User: %s, %s' % (self.name, self.id)
\ No newline at end of file
+        return 'User: %s, %s' % (self.name, self.id)
+
+# user_collection表的模型类
+# 用户收藏的房源，每条记录对应一次收藏
+class UserCollection(db.Model):
+    # 指定表名
+    __tablename__ = 'user_collection'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'house_id', name='uq_user_collection'),
+        db.Index('ix_user_collection_user_time', 'user_id', 'created_at'),
+    )
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 用户ID
+    user_id = db.Column(db.Integer, nullable=False)
+    # 房源ID
+    house_id = db.Column(db.Integer, nullable=False, index=True)
+    # 收藏时间 (时间戳)
+    created_at = db.Column(db.Integer, default=lambda: int(time.time()))
+
+    def __repr__(self):
+        return 'UserCollection: %s, %s' % (self.user_id, self.house_id)
+
+
+# user_view_history表的模型类
+# 用户浏览过的房源，每个房源只记录一次
+class UserViewHistory(db.Model):
+    # 指定表名
+    __tablename__ = 'user_view_history'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'house_id', name='uq_user_view_history'),
+        db.Index('ix_user_view_history_user_time', 'user_id', 'viewed_at'),
+    )
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 用户ID
+    user_id = db.Column(db.Integer, nullable=False)
+    # 房源ID
+    house_id = db.Column(db.Integer, nullable=False, index=True)
+    # 浏览时间 (时间戳)
+    viewed_at = db.Column(db.Integer, default=lambda: int(time.time()))
+
+    def __repr__(self):
+        return 'UserViewHistory: %s, %s' % (self.user_id, self.house_id)
+
+
+# user_saved_search表的模型类
+# 用户保存的房源检索条件 (与 /api/search 的参数相同)，新发布或更新的房源满足条件时记入 user_saved_search_match
+class SavedSearch(db.Model):
+    # 指定表名
+    __tablename__ = 'user_saved_search'
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 用户ID
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    # 名称
+    name = db.Column(db.String(100))
+    # 检索参数 (规范化的查询字符串，用于重新打开检索页)
+    params = db.Column(db.String(500), nullable=False)
+    # 以下为解析后的条件，为空表示不限
+    # 关键词 (匹配标题、小区、街道)
+    keyword = db.Column(db.String(100))
+    # 区域 ('区-街道-小区' 或区名关键词)
+    region = db.Column(db.String(100))
+    # 户型
+    rooms = db.Column(db.String(100))
+    # 租住类型编码、朝向编码 (与 House 的编码列相同)
+    rent_type_code = db.Column(db.SmallInteger)
+    direction_code = db.Column(db.SmallInteger)
+    # 需要具备的配套设施位掩码
+    facilities_mask = db.Column(db.Integer, default=0)
+    # 价格区间 [min_price, max_price)
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    # 面积区间 [min_area, max_area)
+    min_area = db.Column(db.Float)
+    max_area = db.Column(db.Float)
+    # 创建时间 (时间戳)
+    created_at = db.Column(db.Integer, default=lambda: int(time.time()))
+
+    def __repr__(self):
+        return 'SavedSearch: %s, %s' % (self.user_id, self.params)
+
+
+# user_saved_search_match表的模型类
+# 保存的检索条件匹配到的房源，每个条件每个房源只记录一次；is_new 表示用户还没有在个人主页看到
+class SavedSearchMatch(db.Model):
+    # 指定表名
+    __tablename__ = 'user_saved_search_match'
+    __table_args__ = (
+        db.UniqueConstraint('search_id', 'house_id', name='uq_saved_search_match'),
+        db.Index('ix_saved_search_match_user_new', 'user_id', 'is_new', 'matched_at'),
+    )
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 检索条件ID
+    search_id = db.Column(db.Integer, nullable=False)
+    # 用户ID (冗余保存，个人主页按用户查询)
+    user_id = db.Column(db.Integer, nullable=False)
+    # 房源ID
+    house_id = db.Column(db.Integer, nullable=False)
+    # 匹配时间 (时间戳)
+    matched_at = db.Column(db.Integer, default=lambda: int(time.time()))
+    # 是否为新匹配 (用户上次访问个人主页之后才匹配到)
+    is_new = db.Column(db.Boolean, nullable=False, default=True)
+
+    def __repr__(self):
+        return 'SavedSearchMatch: %s, %s' % (self.search_id, self.house_id)
+
+
+# house_region_stat表的模型类
+# 按 (区, 街道, 小区, 户型) 预先聚合的房源统计数据，供图表接口直接读取
+# block/address/rooms 为空字符串表示对该层级的汇总
+class RegionStat(db.Model):
+    # 指定表名
+    __tablename__ = 'house_region_stat'
+    __table_args__ = (
+        db.UniqueConstraint('region', 'block', 'address', 'rooms', name='uq_region_stat_key'),
+    )
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 所在区 (已去掉"区"字)
+    region = db.Column(db.String(100), nullable=False, default='')
+    # 所在街道
+    block = db.Column(db.String(100), nullable=False, default='')
+    # 所在小区
+    address = db.Column(db.String(100), nullable=False, default='')
+    # 户型
+    rooms = db.Column(db.String(100), nullable=False, default='')
+    # 房源数量
+    house_count = db.Column(db.Integer, default=0)
+    # 有效价格的房源数量
+    price_count = db.Column(db.Integer, default=0)
+    # 价格总和
+    price_sum = db.Column(db.Float, default=0)
+    # 平均价格
+    price_avg = db.Column(db.Float, default=0)
+    # 按发布时间排序的价格序列 (JSON)
+    price_series = db.Column(LongText)
+    # 抽样的 [面积, 价格] 数据点 (JSON)
+    points = db.Column(LongText)
+    # 房源最多的小区及其平均价格 (JSON)
+    top_addresses = db.Column(LongText)
+
+    def __repr__(self):
+        return 'RegionStat: %s-%s-%s %s' % (self.region, self.block, self.address, self.rooms)
+
+
+# house_price_trend表的模型类
+# 按 (区, 户型, 时间粒度, 时间桶) 聚合的价格分布，供价格走势接口读取
+# rooms 为空字符串表示该区全部户型；价格分布保存为对数分桶的直方图，可以直接相加，用于估算中位数和 P90
+class PriceTrend(db.Model):
+    # 指定表名
+    __tablename__ = 'house_price_trend'
+    __table_args__ = (
+        db.UniqueConstraint('region', 'rooms', 'granularity', 'bucket', name='uq_price_trend_key'),
+    )
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 所在区 (已去掉"区"字)
+    region = db.Column(db.String(100), nullable=False, default='')
+    # 户型
+    rooms = db.Column(db.String(100), nullable=False, default='')
+    # 时间粒度: day / week / month
+    granularity = db.Column(db.String(10), nullable=False)
+    # 时间桶的起始时间 (时间戳，北京时间的零点)
+    bucket = db.Column(db.Integer, nullable=False)
+    # 有效价格的房源数量
+    house_count = db.Column(db.Integer, default=0)
+    # 价格总和
+    price_sum = db.Column(db.Float, default=0)
+    # 价格直方图 {分桶序号: 房源数量} (JSON)
+    histogram = db.Column(db.Text)
+
+    def __repr__(self):
+        return 'PriceTrend: %s %s %s %s' % (self.region, self.rooms, self.granularity, self.bucket)
+
+
+# 位置维度表：区 -> 街道 -> 小区，由房源的 region/block/address 归一化而来 (名称在上一级中唯一)
+# house_location_region表的模型类
+class Region(db.Model):
+    # 指定表名
+    __tablename__ = 'house_location_region'
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 区名 (已去掉"区"字)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+    def __repr__(self):
+        return 'Region: %s, %s' % (self.name, self.id)
+
+
+# house_location_block表的模型类
+class Block(db.Model):
+    # 指定表名
+    __tablename__ = 'house_location_block'
+    __table_args__ = (
+        db.UniqueConstraint('region_id', 'name', name='uq_location_block_name'),
+    )
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 所在区
+    region_id = db.Column(db.Integer, db.ForeignKey('house_location_region.id'), nullable=False)
+    # 街道名
+    name = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self):
+        return 'Block: %s, %s' % (self.name, self.id)
+
+
+# house_location_community表的模型类
+class Community(db.Model):
+    # 指定表名
+    __tablename__ = 'house_location_community'
+    __table_args__ = (
+        db.UniqueConstraint('block_id', 'name', name='uq_location_community_name'),
+    )
+    # 主键
+    id = db.Column(db.Integer, primary_key=True)
+    # 所在街道
+    block_id = db.Column(db.Integer, db.ForeignKey('house_location_block.id'), nullable=False)
+    # 小区名
+    name = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self):
+        return 'Community: %s, %s' % (self.name, self.id)
@@ -0,0 +1,105 @@
+import base64
+import binascii
+import json
+from math import ceil
+
+from sqlalchemy import and_, or_
+
+from settings import cache
+
+
+# --- 游标的编码与解码 ---
+def encode_cursor(direction, page, sort_value, row_id):
+    """游标记录翻页方向、目标页码以及边界行的 (排序值, id)"""
+    raw = json.dumps([direction, page, sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """解析游标，格式不正确时返回 None (按第一页处理)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, page, sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if direction not in ('next', 'prev') or not isinstance(row_id, int) or not isinstance(page, int):
+        return None
+    return direction, page, sort_value, row_id
+
+
+def _after(sort_column, id_column, sort_value, row_id):
+    """按 (sort_column DESC, id DESC) 排序时，位于边界行之后的条件 (NULL 排在最后)"""
+    if sort_value is None:
+        return and_(sort_column.is_(None), id_column < row_id)
+    return or_(
+        sort_column < sort_value,
+        sort_column.is_(None),
+        and_(sort_column == sort_value, id_column < row_id),
+    )
+
+
+def _before(sort_column, id_column, sort_value, row_id):
+    """位于边界行之前的条件"""
+    if sort_value is None:
+        return or_(sort_column.isnot(None), and_(sort_column.is_(None), id_column > row_id))
+    return or_(
+        sort_column > sort_value,
+        and_(sort_column == sort_value, id_column > row_id),
+    )
+
+
+class KeysetPagination:
+    """
+    基于游标 (keyset) 的分页对象，按 (sort_column DESC, id DESC) 排序
+    属性与 Flask-SQLAlchemy 的分页对象保持一致 (items/page/pages/total/has_next/has_prev)，
+    另外提供 next_cursor/prev_cursor 供模板生成翻页链接
+    """
+
+    def __init__(self, query, sort_column, id_column, per_page, page=1, cursor=None, count_key=None):
+        self.per_page = per_page
+        self.page = max(page, 1)
+        decoded = decode_cursor(cursor) if cursor else None
+
+        if decoded is None:
+            # 没有游标时 (第一页或直接跳页) 使用 OFFSET，之后的上一页/下一页使用游标
+            rows = query.order_by(sort_column.desc(), id_column.desc()).offset(
+                (self.page - 1) * per_page).limit(per_page + 1).all()
+            self.has_prev = self.page > 1
+            self.has_next = len(rows) > per_page
+            self.items = rows[:per_page]
+        else:
+            direction, self.page, sort_value, row_id = decoded
+            if direction == 'next':
+                rows = query.filter(_after(sort_column, id_column, sort_value, row_id)).order_by(
+                    sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+                self.has_prev = True
+                self.has_next = len(rows) > per_page
+                self.items = rows[:per_page]
+            else:
+                # 向前翻页时反向排序取数据，再倒转回来
+                rows = query.filter(_before(sort_column, id_column, sort_value, row_id)).order_by(
+                    sort_column.asc(), id_column.asc()).limit(per_page + 1).all()
+                self.has_next = True
+                self.has_prev = len(rows) > per_page
+                self.items = list(reversed(rows[:per_page]))
+            # 页码只用于展示，不能小于1
+            self.page = max(self.page, 1)
+            if not self.has_prev:
+                self.page = 1
+
+        sort_key = sort_column.key
+        self.next_cursor = None
+        self.prev_cursor = None
+        if self.items and self.has_next:
+            last = self.items[-1]
+            self.next_cursor = encode_cursor('next', self.page + 1, getattr(last, sort_key), last.id)
+        if self.items and self.has_prev:
+            first = self.items[0]
+            self.prev_cursor = encode_cursor('prev', self.page - 1, getattr(first, sort_key), first.id)
+
+        # 总数只是近似值：缓存一段时间，避免每次请求都执行 COUNT(*)
+        if count_key is None:
+            self.total = None
+        else:
+            self.total = cache.get_or_set('counts', count_key, lambda: query.order_by(None).count())
+        self.pages = max(ceil(self.total / per_page), self.page) if self.total else self.page
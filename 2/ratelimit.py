@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request, session
+
+
+class TokenBucket:
+    """令牌桶：按固定速率补充令牌，最多积攒 burst 个，每个请求消耗一个"""
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, burst):
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def take(self, rate, burst):
+        """取一个令牌，成功时返回 0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+
+class RateLimiter:
+    """
+    按客户端限流 (进程内)：每个 (接口范围, 客户端) 一个令牌桶，
+    登录用户按用户ID区分，未登录用户按 IP 区分 (经过反向代理时由 TRUSTED_PROXY_COUNT 配置取真实地址)；
+    客户端数量超过上限时淘汰最久未访问的令牌桶
+    """
+
+    def __init__(self, app=None):
+        self.limits = {}
+        self.max_clients = 10000
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMITS', {})
+        app.config.setdefault('RATE_LIMIT_MAX_CLIENTS', 10000)
+        self.limits = dict(app.config['RATE_LIMITS'])
+        self.max_clients = app.config['RATE_LIMIT_MAX_CLIENTS']
+
+    @staticmethod
+    def client_key():
+        user_id = session.get('user_id')
+        return f'user:{user_id}' if user_id is not None else f'ip:{request.remote_addr}'
+
+    def check(self, scope, client):
+        """返回 0 表示放行，否则返回建议的重试等待秒数"""
+        if scope not in self.limits:
+            return 0
+        rate, burst = self.limits[scope]
+        key = (scope, client)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(burst)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take(rate, burst)
+
+    def limit(self, scope):
+        """接口装饰器：超过频率限制时返回 429 和 Retry-After"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                retry_after = self.check(scope, self.client_key())
+                if retry_after:
+                    response = jsonify(code=0, msg='请求过于频繁，请稍后再试')
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(max(int(retry_after + 0.999), 1))
+                    return response
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,39 @@
+from collections import namedtuple
+
+from sqlalchemy.orm import Bundle
+
+from settings import db
+from models import House
+
+# 列表卡片、搜索结果和 JSON 接口用到的房源字段
+# 不包含 facilities/highlights/matching/travel 等长文本，这些字段只有详情页 (加载完整的 House) 才需要
+CARD_FIELDS = (
+    'id', 'title', 'rooms', 'area', 'price', 'direction', 'rent_type',
+    'region', 'block', 'address', 'traffic', 'publish_time', 'page_views', 'updated_at',
+)
+
+# 只读的房源摘要：namedtuple 没有实例字典，也不进入 session 的 identity map
+HouseCard = namedtuple('HouseCard', CARD_FIELDS)
+
+
+class _CardBundle(Bundle):
+    """把查询出的一行列值直接构造为 HouseCard"""
+
+    def create_row_processor(self, query, procs, labels):
+        make = HouseCard._make
+
+        def proc(row):
+            return make([p(row) for p in procs])
+        return proc
+
+
+# 查询中作为单个实体使用：query(house_card) 的结果直接是 HouseCard，而不是只有一列的 Row
+house_card = _CardBundle('house_card', *(getattr(House, f) for f in CARD_FIELDS), single_entity=True)
+
+
+def card_query():
+    """
+    房源摘要的查询：只查询 CARD_FIELDS 中的列，用法与 House.query 相同 (filter/join/order_by/paginate)
+    列表、搜索和推荐等只读场景使用，不需要修改房源或读取长文本时代替 House.query
+    """
+    return db.session.query(house_card)
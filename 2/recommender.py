@@ -0,0 +1,254 @@
+import math
+from collections import defaultdict
+from itertools import groupby
+
+from sqlalchemy import func, literal, select, union_all
+
+from settings import db
+from models import House, Recommend, UserCollection, UserViewHistory
+from read_model import card_query
+
+# 每个房源保留的相似房源数量
+TOP_K = 20
+# 每个用户只取最近交互过的房源，避免少数重度用户产生平方级的房源对
+MAX_ITEMS_PER_USER = 100
+# 浏览记一次，收藏权重更高
+VIEW_WEIGHT = 1
+COLLECT_WEIGHT = 2
+# 每批写入的记录数
+WRITE_BATCH_SIZE = 5000
+# 按ID筛选时每条查询的 IN (...) 列表最多包含的ID数量
+QUERY_BATCH_SIZE = 1000
+
+
+def _chunks(values, size):
+    """把ID列表切成每批 size 个"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# --- 读取用户交互 ---
+def _interactions(user_filter=None, house_filter=None):
+    """浏览记录和收藏合并后的 (user_id, house_id, 权重, 时间) 查询"""
+    views = select(
+        UserViewHistory.user_id, UserViewHistory.house_id,
+        literal(VIEW_WEIGHT).label('weight'), UserViewHistory.viewed_at.label('ts'))
+    collects = select(
+        UserCollection.user_id, UserCollection.house_id,
+        literal(COLLECT_WEIGHT).label('weight'), UserCollection.created_at.label('ts'))
+    if user_filter is not None:
+        views = views.where(UserViewHistory.user_id.in_(user_filter))
+        collects = collects.where(UserCollection.user_id.in_(user_filter))
+    if house_filter is not None:
+        views = views.where(UserViewHistory.house_id.in_(house_filter))
+        collects = collects.where(UserCollection.house_id.in_(house_filter))
+    return union_all(views, collects).subquery()
+
+
+def _user_vector(rows):
+    """把一个用户的交互记录合并为 {房源ID: 权重}，只保留最近的房源"""
+    weights = defaultdict(int)
+    latest = {}
+    for row in rows:
+        weights[row.house_id] += row.weight
+        latest[row.house_id] = max(latest.get(row.house_id) or 0, row.ts or 0)
+    if len(weights) > MAX_ITEMS_PER_USER:
+        keep = sorted(latest, key=latest.get, reverse=True)[:MAX_ITEMS_PER_USER]
+        return {house_id: weights[house_id] for house_id in keep}
+    return dict(weights)
+
+
+def _iter_user_vectors(conn, user_filter=None, house_filter=None):
+    """按用户顺序流式读取交互，逐个用户产出 (user_id, {房源ID: 权重})"""
+    interactions = _interactions(user_filter, house_filter)
+    result = conn.execution_options(stream_results=True, yield_per=10000).execute(
+        select(interactions).order_by(interactions.c.user_id))
+    for user_id, rows in groupby(result, key=lambda row: row.user_id):
+        yield user_id, _user_vector(rows)
+
+
+def _interacting_users(conn, house_ids):
+    """与指定房源有过浏览或收藏的用户 (按用户ID排序)，房源ID分批查询"""
+    user_ids = set()
+    for chunk in _chunks(house_ids, QUERY_BATCH_SIZE):
+        interactions = _interactions(house_filter=chunk)
+        user_ids.update(user_id for (user_id,) in conn.execute(select(interactions.c.user_id).distinct()))
+    return sorted(user_ids)
+
+
+def _iter_vectors_of(conn, user_ids):
+    """指定用户的完整交互向量，用户ID分批查询 (同一个用户的记录总在同一批中)"""
+    for chunk in _chunks(user_ids, QUERY_BATCH_SIZE):
+        yield from _iter_user_vectors(conn, user_filter=chunk)
+
+
+# --- 相似度计算 ---
+def _top_neighbours(co_counts, norms, source_norm, top_k):
+    """余弦相似度：共现权重 / sqrt(两个房源各自的权重平方和)"""
+    scored = []
+    for house_id, co in co_counts.items():
+        denominator = math.sqrt(source_norm * norms[house_id])
+        if denominator:
+            scored.append((co / denominator, co, house_id))
+    scored.sort(reverse=True)
+    return scored[:top_k]
+
+
+def _write_neighbours(conn, neighbours_by_source):
+    """替换这些房源的相似房源记录 (user_id 为空的行)"""
+    table = Recommend.__table__
+    for chunk in _chunks(neighbours_by_source, WRITE_BATCH_SIZE):
+        conn.execute(table.delete().where(table.c.user_id.is_(None), table.c.house_id.in_(chunk)))
+    records = []
+    for source, neighbours in neighbours_by_source.items():
+        for similarity, co, house_id in neighbours:
+            records.append({'user_id': None, 'house_id': source, 'similar_id': house_id,
+                            'score': int(round(co)), 'similarity': round(similarity, 6)})
+            if len(records) >= WRITE_BATCH_SIZE:
+                conn.execute(table.insert(), records)
+                records = []
+    if records:
+        conn.execute(table.insert(), records)
+
+
+def rebuild_all(conn, shards=1, top_k=TOP_K):
+    """
+    全量重建房源之间的相似度
+    shards > 1 时按房源ID分片多次扫描交互数据，每次只在内存中保留一个分片的共现计数
+    """
+    norms = defaultdict(int)
+    for _, vector in _iter_user_vectors(conn):
+        for house_id, weight in vector.items():
+            norms[house_id] += weight * weight
+
+    conn.execute(Recommend.__table__.delete().where(Recommend.__table__.c.user_id.is_(None)))
+    source_count = 0
+    for shard in range(shards):
+        co_counts = defaultdict(lambda: defaultdict(int))
+        for _, vector in _iter_user_vectors(conn):
+            items = list(vector.items())
+            for source, source_weight in items:
+                if source % shards != shard:
+                    continue
+                row = co_counts[source]
+                for house_id, weight in items:
+                    if house_id != source:
+                        row[house_id] += source_weight * weight
+        _write_neighbours(conn, {
+            source: _top_neighbours(row, norms, norms[source], top_k)
+            for source, row in co_counts.items()
+        })
+        source_count += len(co_counts)
+    return source_count
+
+
+def refresh_houses(conn, house_ids, top_k=TOP_K):
+    """
+    增量更新：重新计算指定房源的相似房源 (用于新产生浏览/收藏的房源)，
+    并把新的相似度合并进它们的相似房源各自的列表，返回更新的房源数量
+    """
+    house_ids = set(house_ids)
+    if not house_ids:
+        return 0
+    co_counts = defaultdict(lambda: defaultdict(int))
+    for _, vector in _iter_vectors_of(conn, _interacting_users(conn, house_ids)):
+        for source in house_ids & vector.keys():
+            row = co_counts[source]
+            for house_id, weight in vector.items():
+                if house_id != source:
+                    row[house_id] += vector[source] * weight
+
+    candidates = set(house_ids)
+    for row in co_counts.values():
+        candidates.update(row)
+    norms = _house_norms(conn, candidates)
+
+    neighbours_by_source = {
+        source: _top_neighbours(co_counts.get(source, {}), norms, norms[source], top_k)
+        for source in house_ids
+    }
+    neighbours_by_source.update(_merge_reverse(conn, co_counts, norms, house_ids, top_k))
+    _write_neighbours(conn, neighbours_by_source)
+    return len(neighbours_by_source)
+
+
+def _house_norms(conn, house_ids):
+    """
+    指定房源的权重平方和：与全量重建一样基于每个用户截断后的完整向量计算
+    (先按房源过滤交互记录再截断，会把这些房源算进本该被截掉的用户向量里)
+    """
+    norms = defaultdict(int)
+    for _, vector in _iter_vectors_of(conn, _interacting_users(conn, house_ids)):
+        for house_id in house_ids & vector.keys():
+            norms[house_id] += vector[house_id] * vector[house_id]
+    return norms
+
+
+def _merge_reverse(conn, co_counts, norms, house_ids, top_k):
+    """
+    相似度是对称的：指定房源的相似度变化后，与它们共现的房源 (以及列表中原来含有它们的房源) 的列表也要更新
+    这些列表中与其他房源的相似度沿用已有的记录，只替换指定房源的部分，全量重建时再整体修正
+    """
+    table = Recommend.__table__
+    affected = {house_id for row in co_counts.values() for house_id in row}
+    for chunk in _chunks(house_ids, QUERY_BATCH_SIZE):
+        affected.update(house_id for (house_id,) in conn.execute(
+            select(table.c.house_id).where(table.c.user_id.is_(None), table.c.similar_id.in_(chunk)).distinct()))
+    affected -= house_ids
+    if not affected:
+        return {}
+
+    entries = defaultdict(list)
+    for chunk in _chunks(affected, QUERY_BATCH_SIZE):
+        for row in conn.execute(select(table.c.house_id, table.c.similar_id, table.c.score, table.c.similarity)
+                                .where(table.c.user_id.is_(None), table.c.house_id.in_(chunk))):
+            if row.similar_id not in house_ids:
+                entries[row.house_id].append((row.similarity, row.score, row.similar_id))
+    merged = {}
+    for house_id in affected:
+        scored = entries[house_id]
+        for source in house_ids:
+            co = co_counts.get(source, {}).get(house_id)
+            denominator = math.sqrt(norms[house_id] * norms[source]) if co else 0
+            if denominator:
+                scored.append((co / denominator, co, source))
+        scored.sort(reverse=True)
+        merged[house_id] = scored[:top_k]
+    return merged
+
+
+def recently_active_houses(conn, since):
+    """某个时间点之后产生过浏览或收藏的房源ID"""
+    interactions = _interactions()
+    return [house_id for (house_id,) in conn.execute(
+        select(interactions.c.house_id).where(interactions.c.ts >= since).distinct())]
+
+
+# --- 读取推荐结果 ---
+def similar_houses(house, limit=6):
+    """详情页推荐：一次索引查询取出相似度最高的房源，不足时用同小区房源补齐"""
+    houses = card_query().join(Recommend, Recommend.similar_id == House.id).filter(
+        Recommend.house_id == house.id, Recommend.user_id.is_(None)
+    ).order_by(Recommend.similarity.desc()).limit(limit).all()
+    if len(houses) < limit:
+        exclude = [house.id] + [h.id for h in houses]
+        houses += card_query().filter(
+            House.address == house.address, House.id.notin_(exclude)
+        ).limit(limit - len(houses)).all()
+    return houses
+
+
+def recommend_for_user(user_id, limit=6):
+    """用户主页推荐：汇总用户浏览/收藏过的房源的相似房源，排除已经看过的"""
+    seen = select(UserViewHistory.house_id).where(UserViewHistory.user_id == user_id).union(
+        select(UserCollection.house_id).where(UserCollection.user_id == user_id))
+    ranked = db.session.query(
+        Recommend.similar_id, func.sum(Recommend.similarity).label('total')
+    ).filter(
+        Recommend.user_id.is_(None),
+        Recommend.house_id.in_(seen),
+        Recommend.similar_id.notin_(seen),
+    ).group_by(Recommend.similar_id).subquery()
+    return card_query().join(ranked, ranked.c.similar_id == House.id).order_by(
+        ranked.c.total.desc()).limit(limit).all()
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshableIndex:
+    """
+    进程内索引的公共部分：定期从数据库全量重建，本进程提交的修改增量合并
+    - 第一次使用时同步构建，同一时间只有一个线程构建，其他线程等待它的结果
+    - 之后过期 (超过刷新间隔或被 invalidate) 时由后台线程重建，请求线程继续使用旧的索引，不会阻塞；
+      重建期间提交的增量修改在新索引生效后重放，不会丢失
+    子类实现 _load() (读取数据库，返回新的索引数据，不持有锁) 和 _install(data) (在锁内替换索引数据)，
+    增量修改通过 _modify() 执行
+    """
+
+    # 刷新间隔的配置项 (秒)
+    refresh_config_key = None
+    default_refresh_interval = 300
+    # 本进程中的全部索引 (fork 之后逐个重置)
+    _instances = weakref.WeakSet()
+
+    def __init__(self, app=None):
+        self.refresh_interval = self.default_refresh_interval
+        self.app = None
+        self._built_at = None
+        self._stale = False
+        self._refreshing = False
+        self._replay = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        RefreshableIndex._instances.add(self)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(self.refresh_config_key, self.default_refresh_interval)
+        self.refresh_interval = app.config[self.refresh_config_key]
+        self.app = app
+
+    @property
+    def loaded(self):
+        """是否已经构建过 (没有构建过的索引不需要合并增量修改)"""
+        return self._built_at is not None
+
+    # --- 子类实现 ---
+    def _load(self):
+        raise NotImplementedError
+
+    def _install(self, data):
+        raise NotImplementedError
+
+    # --- 重建 ---
+    def rebuild(self):
+        """同步全量重建，返回 _install 的结果 (启动预热和命令行使用)"""
+        with self._build_lock:
+            return self._rebuild_locked()
+
+    def _rebuild_locked(self):
+        with self._lock:
+            self._replay = []
+        try:
+            data = self._load()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            result = self._install(data)
+            replay, self._replay = self._replay, None
+            for method, args in replay:
+                method(*args)
+            self._built_at = time.monotonic()
+            self._stale = False
+        return result
+
+    def reset_after_fork(self):
+        """
+        fork 出的子进程中调用：父进程的后台重建线程不会复制到子进程，
+        fork 时被其他线程持有的锁在子进程中永远不会释放，这里重新创建锁和重建状态；
+        fork 时正在进行的重建标记为过期，下一次查询时由子进程自己重建
+        """
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        if self._refreshing or self._replay is not None:
+            self._stale = True
+        self._refreshing = False
+        self._replay = None
+
+    def invalidate(self):
+        """标记过期，下一次查询时在后台重建 (用于绕过 ORM 的批量写入)"""
+        with self._lock:
+            self._stale = True
+
+    def _ensure_fresh(self):
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._rebuild_locked()
+            return
+        if self._stale or time.monotonic() - self._built_at >= self.refresh_interval:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_rebuild, name=f'{type(self).__name__}-refresh',
+                         daemon=True).start()
+
+    def _background_rebuild(self):
+        try:
+            self.rebuild()
+        except Exception:
+            # 重建失败时继续使用旧的索引，下一次查询时再重试
+            logger.exception('[%s] 后台重建失败', type(self).__name__)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    # --- 增量修改 ---
+    def _modify(self, method, *args):
+        """在锁内执行一次增量修改；重建进行中时同时记录下来，新索引生效后重放"""
+        with self._lock:
+            method(*args)
+            if self._replay is not None:
+                self._replay.append((method, args))
+
+
+def reset_after_fork():
+    """重置本进程中全部索引的锁和后台重建状态 (worker 进程 fork 之后调用)"""
+    for index in list(RefreshableIndex._instances):
+        index.reset_after_fork()
@@ -0,0 +1,328 @@
+import bisect
+import time
+from collections import defaultdict
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from settings import app, db, cache
+from models import House, SavedSearch, SavedSearchMatch
+from analytics import parse_location
+from location import location_index, location_names
+from facet_index import rooms_match
+from read_model import house_card
+from refreshable import RefreshableIndex
+from house_changes import house_changes
+from utils import house_to_dict
+
+# 匹配检索条件需要的房源字段 (数据库列)
+MATCH_COLUMNS = ('id', 'title', 'region', 'block', 'address', 'rooms', 'rent_type_code', 'direction_code',
+                 'facilities_mask', 'price_value', 'area_value')
+# 检索条件的字段
+SEARCH_COLUMNS = ('id', 'user_id', 'keyword', 'region', 'rooms', 'rent_type_code', 'direction_code',
+                  'facilities_mask', 'min_price', 'max_price', 'min_area', 'max_area')
+# 关键词匹配的字段，与 /api/search 一致
+KEYWORD_FIELDS = ('title', 'address', 'block')
+# '4室及以上' 作为户型条件时单独成桶
+ROOMS_GROUPS = ('4室及以上',)
+# 每个用户最多保存的检索条件数量
+MAX_SAVED_SEARCHES = 20
+# 个人主页最多展示的新匹配房源数量
+NEW_MATCHES_LIMIT = 20
+# 批量匹配时每次读取的房源数量
+MATCH_BATCH_SIZE = 1000
+
+
+class _Predicate:
+    """一个保存的检索条件 (匹配时使用的形式)，由 SEARCH_COLUMNS 的值构造"""
+    __slots__ = ('id', 'user_id', 'keyword', 'location', 'region_text', 'rooms', 'rent_type_code',
+                 'direction_code', 'facilities_mask', 'min_price', 'max_price', 'min_area', 'max_area')
+
+    def __init__(self, values):
+        self.id = values['id']
+        self.user_id = values['user_id']
+        self.keyword = (values['keyword'] or '').lower() or None
+        self.location = None
+        self.region_text = None
+        region = values['region']
+        if region:
+            # 已知的位置按 区/街道/小区 名称等值匹配，否则按区名关键词匹配 (与 /api/search 的规则一致)
+            if location_index.resolve(region) is not None:
+                self.location = tuple(name for name in parse_location(region) if name)
+            else:
+                self.region_text = region.lower()
+        self.rooms = values['rooms'] or None
+        self.rent_type_code = values['rent_type_code']
+        self.direction_code = values['direction_code']
+        self.facilities_mask = values['facilities_mask'] or 0
+        self.min_price = values['min_price']
+        self.max_price = values['max_price']
+        self.min_area = values['min_area']
+        self.max_area = values['max_area']
+
+    @property
+    def bucket(self):
+        """所在的桶: (区名, 户型)，None 表示不限"""
+        return (self.location[0] if self.location else None), self.rooms
+
+    def matches(self, house):
+        """除区名、户型和价格以外的条件 (这三项已由索引的桶和价格区间筛选过)"""
+        if self.location and location_names(house.region, house.block, house.address)[:len(self.location)] \
+                != self.location:
+            return False
+        if self.region_text and self.region_text not in (house.region or '').lower():
+            return False
+        if self.keyword and not any(self.keyword in (getattr(house, f) or '').lower() for f in KEYWORD_FIELDS):
+            return False
+        if self.rent_type_code is not None and house.rent_type_code != self.rent_type_code:
+            return False
+        if self.direction_code is not None and house.direction_code != self.direction_code:
+            return False
+        if self.facilities_mask and (house.facilities_mask or 0) & self.facilities_mask != self.facilities_mask:
+            return False
+        if self.min_area is not None:
+            area = house.area_value or 0
+            if not (area > 0 and self.min_area <= area < self.max_area):
+                return False
+        return True
+
+
+class _PriceIntervals:
+    """
+    一个桶中的检索条件，按价格区间组织：
+    有价格条件的按区间下限排序，二分查找得到下限不超过房源价格的条件，再检查上限；没有价格条件的单独存放
+    """
+    __slots__ = ('lows', 'entries', 'unbounded')
+
+    def __init__(self):
+        self.lows = []
+        self.entries = []
+        self.unbounded = []
+
+    def add(self, predicate):
+        if predicate.min_price is None:
+            self.unbounded.append(predicate)
+            return
+        position = bisect.bisect_right(self.lows, predicate.min_price)
+        self.lows.insert(position, predicate.min_price)
+        self.entries.insert(position, predicate)
+
+    def remove(self, search_id):
+        keep = [(low, p) for low, p in zip(self.lows, self.entries) if p.id != search_id]
+        self.lows = [low for low, _ in keep]
+        self.entries = [p for _, p in keep]
+        self.unbounded = [p for p in self.unbounded if p.id != search_id]
+
+    def __len__(self):
+        return len(self.entries) + len(self.unbounded)
+
+    def candidates(self, price):
+        yield from self.unbounded
+        # 价格为空或 0 的房源不满足任何价格条件
+        if not price or price <= 0:
+            return
+        for predicate in self.entries[:bisect.bisect_right(self.lows, price)]:
+            if price < predicate.max_price:
+                yield predicate
+
+
+class SavedSearchIndex(RefreshableIndex):
+    """
+    保存的检索条件的内存索引 (进程内)，用于把新发布或更新的房源与全部检索条件匹配：
+    条件按 (区名, 户型) 分桶，桶内按价格区间排序，一个房源只需要检查最多 6 个桶中价格区间覆盖它的条件，
+    不需要对每个检索条件重新查询数据库
+    """
+
+    refresh_config_key = 'SAVED_SEARCH_REFRESH_INTERVAL'
+    default_refresh_interval = 60
+
+    def __init__(self, app=None):
+        self._buckets = defaultdict(_PriceIntervals)
+        self._bucket_of = {}
+        super().__init__(app)
+
+    # --- 索引维护 ---
+    def _load(self):
+        """从 user_saved_search 全量加载"""
+        table = SavedSearch.__table__
+        with self.app.app_context():
+            rows = db.session.execute(select(*(table.c[name] for name in SEARCH_COLUMNS))).mappings().all()
+        return [_Predicate(row) for row in rows]
+
+    def _install(self, predicates):
+        buckets = defaultdict(_PriceIntervals)
+        for predicate in predicates:
+            buckets[predicate.bucket].add(predicate)
+        self._buckets = buckets
+        self._bucket_of = {p.id: p.bucket for p in predicates}
+        return len(predicates)
+
+    def upsert(self, values):
+        self._modify(self._upsert, _Predicate(values))
+
+    def remove(self, search_id):
+        self._modify(self._remove, search_id)
+
+    def _upsert(self, predicate):
+        self._remove(predicate.id)
+        self._buckets[predicate.bucket].add(predicate)
+        self._bucket_of[predicate.id] = predicate.bucket
+
+    def _remove(self, search_id):
+        bucket = self._bucket_of.pop(search_id, None)
+        if bucket is not None:
+            self._buckets[bucket].remove(search_id)
+            if not self._buckets[bucket]:
+                del self._buckets[bucket]
+
+    def __len__(self):
+        return len(self._bucket_of)
+
+    # --- 匹配 ---
+    def match(self, houses):
+        """房源 (含 MATCH_COLUMNS 字段的行) -> 满足条件的 [(检索条件ID, 用户ID, 房源ID)]"""
+        self._ensure_fresh()
+        pairs = []
+        with self._lock:
+            if not self._buckets:
+                return pairs
+            for house in houses:
+                rooms = house.rooms or ''
+                rooms_keys = dict.fromkeys([None, rooms] + [g for g in ROOMS_GROUPS if rooms_match(rooms, g)])
+                region = location_names(house.region, house.block, house.address)[0]
+                for region_key in (None, region):
+                    for rooms_key in rooms_keys:
+                        intervals = self._buckets.get((region_key, rooms_key))
+                        if intervals is None:
+                            continue
+                        for predicate in intervals.candidates(house.price_value):
+                            if predicate.matches(house):
+                                pairs.append((predicate.id, predicate.user_id, house.id))
+        return pairs
+
+
+# 初始化检索条件索引，创建saved_searches对象
+saved_searches = SavedSearchIndex(app)
+
+
+# --- 写入匹配结果 ---
+def _house_rows(conn, house_ids):
+    table = House.__table__
+    columns = [table.c[name] for name in MATCH_COLUMNS]
+    return conn.execute(select(*columns).where(table.c.id.in_(house_ids))).all()
+
+
+def record_matches(conn, houses):
+    """
+    把房源与全部检索条件匹配，写入还没有记录过的匹配结果，返回新增的数量
+    写入后使这些用户的新匹配缓存失效：进程内缓存 (CACHE_BACKEND = 'memory') 只有当前进程失效，
+    其他进程在 saved_search_matches 的缓存时间到期后才能看到，需要立即生效时使用 redis 后端
+    """
+    pairs = saved_searches.match(houses)
+    if not pairs:
+        return 0
+    table = SavedSearchMatch.__table__
+    existing = set(conn.execute(
+        select(table.c.search_id, table.c.house_id).where(table.c.house_id.in_({p[2] for p in pairs}))
+    ).all())
+    now = int(time.time())
+    records = [
+        {'search_id': search_id, 'user_id': user_id, 'house_id': house_id, 'matched_at': now, 'is_new': True}
+        for search_id, user_id, house_id in pairs if (search_id, house_id) not in existing
+    ]
+    if records:
+        conn.execute(table.insert(), records)
+    for user_id in {record['user_id'] for record in records}:
+        cache.invalidate('saved_search_matches', user_id)
+    return len(records)
+
+
+def match_updated_since(conn, since):
+    """匹配某个时间点之后写入或更新的房源 (批量导入绕过了 ORM 事件，导入完成后调用)，按房源ID分批读取"""
+    saved_searches._ensure_fresh()
+    if not len(saved_searches):
+        return 0
+    table = House.__table__
+    columns = [table.c[name] for name in MATCH_COLUMNS]
+    count = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(select(*columns).where(table.c.updated_at >= since, table.c.id > last_id)
+                            .order_by(table.c.id).limit(MATCH_BATCH_SIZE)).all()
+        if not rows:
+            return count
+        count += record_matches(conn, rows)
+        last_id = rows[-1].id
+
+
+# --- 个人主页的新匹配房源 ---
+def new_matches(user_id, limit=NEW_MATCHES_LIMIT):
+    """
+    用户上次访问之后匹配到的房源 (房源字典，另有 search 字段为检索条件的名称)
+    匹配结果在房源写入时已经算好，这里只读取；结果缓存，没有新匹配时访问个人主页不查询数据库
+    (多进程部署且使用进程内缓存时，其他进程写入的匹配最多延迟一个缓存时间才出现，见 record_matches)
+    """
+    def load():
+        rows = db.session.query(house_card, SavedSearch.name).join(
+            SavedSearchMatch, SavedSearchMatch.house_id == House.id
+        ).join(
+            SavedSearch, SavedSearch.id == SavedSearchMatch.search_id
+        ).filter(
+            SavedSearchMatch.user_id == user_id, SavedSearchMatch.is_new.is_(True)
+        ).order_by(SavedSearchMatch.matched_at.desc()).limit(limit).all()
+        houses = {}
+        for card, name in rows:
+            houses.setdefault(card.id, dict(house_to_dict(card), search=name))
+        return list(houses.values())
+    return cache.get_or_set('saved_search_matches', user_id, load)
+
+
+def mark_seen(user_id, house_ids):
+    """把已经展示给用户的匹配标记为已读 (只标记这些房源，期间新匹配到的房源下次仍然展示)"""
+    db.session.execute(update(SavedSearchMatch).where(
+        SavedSearchMatch.user_id == user_id,
+        SavedSearchMatch.house_id.in_(house_ids),
+        SavedSearchMatch.is_new.is_(True),
+    ).values(is_new=False))
+    db.session.commit()
+    cache.invalidate('saved_search_matches', user_id)
+
+
+# --- 增量维护：房源提交后与检索条件匹配，检索条件增删后同步索引 ---
+def _match_changed_houses(changes):
+    house_ids = [change.id for change in changes if change.new is not None]
+    if house_ids:
+        with db.engine.begin() as conn:
+            record_matches(conn, _house_rows(conn, house_ids))
+
+
+# 匹配需要写数据库，提交后在后台执行
+house_changes.subscribe(_match_changed_houses, MATCH_COLUMNS[1:], background=True)
+
+
+@event.listens_for(SavedSearch, 'after_insert')
+@event.listens_for(SavedSearch, 'after_update')
+def _search_saved(mapper, connection, target):
+    values = {name: getattr(target, name) for name in SEARCH_COLUMNS}
+    Session.object_session(target).info.setdefault('saved_search_changes', {})[target.id] = values
+
+
+@event.listens_for(SavedSearch, 'after_delete')
+def _search_deleted(mapper, connection, target):
+    Session.object_session(target).info.setdefault('saved_search_changes', {})[target.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_saved_search_changes(session):
+    changes = session.info.pop('saved_search_changes', None)
+    if changes and saved_searches.loaded:
+        for search_id, values in changes.items():
+            if values is None:
+                saved_searches.remove(search_id)
+            else:
+                saved_searches.upsert(values)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_saved_search_changes(session):
+    session.info.pop('saved_search_changes', None)
@@ -0,0 +1,181 @@
+from collections import defaultdict
+
+from sqlalchemy import or_, select
+
+from settings import app, db
+from models import House
+from refreshable import RefreshableIndex
+from house_changes import house_changes
+
+# 建立索引的房源字段及其排序权重
+FIELD_WEIGHTS = {
+    'region': 4,
+    'block': 4,
+    'address': 3,
+    'title': 1,
+    'rooms': 2,
+}
+FIELDS = tuple(FIELD_WEIGHTS)
+
+
+def make_grams(text):
+    """把文本切分为单字和相邻两字 (bigram) 的集合，适用于不分词的中文"""
+    text = text.lower()
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def doc_grams(doc):
+    """一个房源所有字段的 n-gram (各字段分别切分，不跨字段)"""
+    return set().union(*(make_grams(value) for value in doc))
+
+
+def query_grams(keyword):
+    """查询词需要匹配的 n-gram：单字查单字，多字查所有 bigram"""
+    keyword = keyword.lower()
+    if len(keyword) == 1:
+        return {keyword}
+    return {keyword[i:i + 2] for i in range(len(keyword) - 1)}
+
+
+def score_fields(values, keyword, fields):
+    """
+    相关度：完全相同 > 前缀匹配 > 包含，并按字段权重累加
+    values 为 (字段, 小写的字段值) 序列，只统计 fields 中的字段
+    """
+    score = 0
+    for field, value in values:
+        if field not in fields:
+            continue
+        if value == keyword:
+            score += 3 * FIELD_WEIGHTS[field]
+        elif value.startswith(keyword):
+            score += 2 * FIELD_WEIGHTS[field]
+        elif keyword in value:
+            score += FIELD_WEIGHTS[field]
+    return score
+
+
+class SearchIndex(RefreshableIndex):
+    """
+    房源标题/地址字段的 n-gram 倒排索引 (进程内)
+    通过倒排表求交集得到候选房源，再对候选做子串校验，结果与 LIKE '%kw%' 一致
+    """
+
+    refresh_config_key = 'SEARCH_INDEX_REFRESH_INTERVAL'
+
+    def __init__(self, app=None):
+        self.max_candidates = 2000
+        self._postings = defaultdict(set)
+        self._docs = {}
+        super().__init__(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_INDEX_MAX_CANDIDATES', 2000)
+        self.max_candidates = app.config['SEARCH_INDEX_MAX_CANDIDATES']
+        super().init_app(app)
+
+    # --- 索引维护 ---
+    def _load(self):
+        """从数据库读取全部房源，建立新的倒排表 (只读取需要的短字段)"""
+        postings = defaultdict(set)
+        docs = {}
+        with self.app.app_context():
+            rows = db.session.execute(select(House.id, *(getattr(House, f) for f in FIELDS)))
+            for row in rows:
+                doc = tuple((value or '').lower() for value in row[1:])
+                docs[row.id] = doc
+                for gram in doc_grams(doc):
+                    postings[gram].add(row.id)
+        return postings, docs
+
+    def _install(self, data):
+        self._postings, self._docs = data
+        return len(self._docs)
+
+    def upsert(self, house_id, values):
+        """新增或更新一个房源的索引，values 为 {字段: 值}"""
+        self._modify(self._upsert, house_id, tuple((values.get(f) or '').lower() for f in FIELDS))
+
+    def remove(self, house_id):
+        self._modify(self._remove, house_id)
+
+    def _upsert(self, house_id, doc):
+        self._remove(house_id)
+        self._docs[house_id] = doc
+        for gram in doc_grams(doc):
+            self._postings[gram].add(house_id)
+
+    def _remove(self, house_id):
+        doc = self._docs.pop(house_id, None)
+        if doc is None:
+            return
+        for gram in doc_grams(doc):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(house_id)
+                if not posting:
+                    del self._postings[gram]
+
+    # --- 查询 ---
+    def _candidates(self, keyword):
+        postings = [self._postings.get(gram) for gram in query_grams(keyword)]
+        if not all(postings):
+            return set()
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def search(self, keyword, fields=FIELDS, limit=None):
+        """
+        在指定字段中查找包含关键词的房源，返回按相关度排序的房源ID列表
+        完全相同 > 前缀匹配 > 包含，并按字段权重累加
+        """
+        keyword = (keyword or '').strip().lower()
+        if not keyword:
+            return []
+        self._ensure_fresh()
+        scored = []
+        with self._lock:
+            for house_id in self._candidates(keyword):
+                doc = self._docs[house_id]
+                score = score_fields(zip(FIELDS, doc), keyword, fields)
+                if score:
+                    scored.append((-score, house_id))
+        scored.sort()
+        ids = [house_id for _, house_id in scored]
+        return ids[:limit] if limit else ids
+
+    def keyword_filter(self, keyword, fields):
+        """
+        构建关键词的查询条件：候选数量不多时使用 id IN (...)，
+        关键词过于宽泛 (候选过多) 时索引起不到过滤作用，退回 LIKE 查询
+        """
+        ids = self.search(keyword, fields)
+        if len(ids) <= self.max_candidates:
+            return House.id.in_(ids)
+        search_term = f'%{keyword}%'
+        return or_(*(getattr(House, f).like(search_term) for f in fields))
+
+
+# 初始化搜索索引，创建search_index对象
+search_index = SearchIndex(app)
+
+
+# --- 增量维护：房源提交后同步更新本进程的索引 ---
+def _apply_index_changes(changes):
+    if not search_index.loaded:
+        return
+    for change in changes:
+        if change.new is None:
+            search_index.remove(change.id)
+        else:
+            search_index.upsert(change.id, {f: change.new[f] for f in FIELDS})
+
+
+house_changes.subscribe(_apply_index_changes, FIELDS)
@@ -0,0 +1,290 @@
+import logging
+
+from sqlalchemy import select
+
+from settings import app, db
+from models import House
+from refreshable import RefreshableIndex
+from database import read_engine
+from house_changes import house_changes
+from analytics import POINT_SAMPLE_SIZE, TOP_ADDRESS_LIMIT, normalize_region, parse_location
+from utils import clean_price, parse_area
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 快照中的房源字段：数值列直接保存为数组，文本列编码为整数
+SNAPSHOT_COLUMNS = ('region', 'block', 'address', 'rooms', 'price', 'area', 'price_value', 'area_value',
+                    'publish_time')
+CATEGORICAL_COLUMNS = ('region', 'block', 'address', 'rooms')
+# 图表计算用到的列 (按位置筛选之后只保留这些列)
+CHART_COLUMNS = ('id', 'rooms', 'address', 'price', 'area', 'publish_time')
+# 全量重建时每次从数据库读取的行数
+BUILD_CHUNK_SIZE = 50000
+
+
+class _Vocabulary:
+    """文本取值 <-> 整数编码 (编码按首次出现的顺序分配，只增不减)"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def _row_values(row):
+    """一行房源 -> (区, 街道, 小区, 户型, 价格, 面积, 发布时间)，数值列为空的旧数据从文本中解析"""
+    price = row['price_value'] if row['price_value'] is not None else clean_price(row['price'])
+    area = row['area_value'] if row['area_value'] is not None else parse_area(row['area'])
+    publish_time = row['publish_time'] if row['publish_time'] is not None else -1
+    return (normalize_region(row['region']), row['block'] or '', row['address'] or '', row['rooms'] or '',
+            price or 0.0, area or 0.0, publish_time)
+
+
+class ColumnarSnapshot(RefreshableIndex):
+    """
+    house_info 的列式内存快照 (NumPy 数组，按房源ID排序)
+    图表接口在快照上用向量化运算完成筛选、分组计数、求平均和排序，不再逐行遍历；
+    本进程的修改在提交后增量合并，其他进程写入的数据通过定期全量重建同步
+    """
+
+    refresh_config_key = 'CHART_SNAPSHOT_REFRESH_INTERVAL'
+
+    def __init__(self, app=None):
+        self.available = False
+        self._columns = None
+        self._vocab = None
+        self._pending = {}
+        super().__init__(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHART_SNAPSHOT_ENABLED', True)
+        self.available = app.config['CHART_SNAPSHOT_ENABLED']
+        if self.available and np is None:
+            logger.warning('未安装 numpy，图表接口改为读取预聚合的统计表 (pip install numpy)')
+            self.available = False
+        super().init_app(app)
+
+    # --- 快照维护 ---
+    def _load(self):
+        """从数据库全量加载快照 (分批流式读取，只取图表用到的列)"""
+        vocab = {name: _Vocabulary() for name in CATEGORICAL_COLUMNS}
+        for name in CATEGORICAL_COLUMNS:
+            vocab[name].encode('')  # 编码 0 表示空值
+        chunks = []
+        with self.app.app_context(), read_engine(db).connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=BUILD_CHUNK_SIZE).execute(
+                select(House.id, *(getattr(House, c) for c in SNAPSHOT_COLUMNS)).order_by(House.id))
+            for rows in result.mappings().partitions():
+                chunks.append(self._encode_rows(rows, vocab))
+        columns = self._concat(chunks) if chunks else self._concat([self._encode_rows([], vocab)])
+        return columns, vocab
+
+    def _install(self, data):
+        self._columns, self._vocab = data
+        self._pending = {}
+        return len(self._columns['id'])
+
+    @staticmethod
+    def _encode_rows(rows, vocab):
+        ids, codes, numbers = [], {name: [] for name in CATEGORICAL_COLUMNS}, []
+        for row in rows:
+            region, block, address, rooms, price, area, publish_time = _row_values(row)
+            ids.append(row['id'])
+            codes['region'].append(vocab['region'].encode(region))
+            codes['block'].append(vocab['block'].encode(block))
+            codes['address'].append(vocab['address'].encode(address))
+            codes['rooms'].append(vocab['rooms'].encode(rooms))
+            numbers.append((price, area, publish_time))
+        numbers = np.array(numbers, dtype=np.float64).reshape(-1, 3)
+        columns = {
+            'id': np.array(ids, dtype=np.int64),
+            'price': numbers[:, 0],
+            'area': numbers[:, 1],
+            'publish_time': numbers[:, 2].astype(np.int64),
+            'alive': np.ones(len(ids), dtype=bool),
+        }
+        for name in CATEGORICAL_COLUMNS:
+            columns[name] = np.array(codes[name], dtype=np.int32)
+        return columns
+
+    @staticmethod
+    def _concat(chunks):
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+    def record_changes(self, changes):
+        """记录本进程提交的房源变化 {房源ID: 字段字典 (删除时为 None)}，下一次查询前合并"""
+        if self.loaded:
+            self._modify(self._record, changes)
+
+    def _record(self, changes):
+        self._pending.update(changes)
+
+    def _apply_pending(self):
+        """把累积的变化合并进快照：已有房源原地更新，新房源追加到末尾 (ID 递增，保持有序)"""
+        pending, self._pending = self._pending, {}
+        columns = self._columns
+        positions = np.searchsorted(columns['id'], list(pending))
+        appended = []
+        for (house_id, values), pos in zip(pending.items(), positions):
+            exists = pos < len(columns['id']) and columns['id'][pos] == house_id
+            if values is None:
+                if exists:
+                    columns['alive'][pos] = False
+                continue
+            if not exists:
+                appended.append(dict(values, id=house_id))
+                continue
+            region, block, address, rooms, price, area, publish_time = _row_values(values)
+            for name, value in zip(CATEGORICAL_COLUMNS, (region, block, address, rooms)):
+                columns[name][pos] = self._vocab[name].encode(value)
+            columns['price'][pos] = price
+            columns['area'][pos] = area
+            columns['publish_time'][pos] = publish_time
+            columns['alive'][pos] = True
+        if appended:
+            appended.sort(key=lambda values: values['id'])
+            self._columns = columns = self._concat([columns, self._encode_rows(appended, self._vocab)])
+            # 其他进程插入的房源可能导致 ID 不再有序，此时整体重排
+            if np.any(np.diff(columns['id']) <= 0):
+                order = np.argsort(columns['id'], kind='stable')
+                self._columns = {name: column[order] for name, column in columns.items()}
+
+    def _ensure_fresh(self):
+        super()._ensure_fresh()
+        if self._pending:
+            with self._lock:
+                self._apply_pending()
+
+    # --- 查询 ---
+    def _location_mask(self, region_str):
+        """'区-街道-小区' 对应的布尔掩码，快照中没有该位置时返回 None"""
+        columns = self._columns
+        mask = columns['alive'].copy()
+        for name, value in zip(('region', 'block', 'address'), parse_location(region_str)):
+            if name != 'region' and not value:
+                continue
+            code = self._vocab[name].codes.get(value)
+            if code is None:
+                return None
+            mask &= columns[name] == code
+        return mask
+
+    def _select(self, region_str):
+        """某个位置下的房源，只取图表用到的列 (按房源ID排序)，快照中没有该位置时返回 None"""
+        mask = self._location_mask(region_str)
+        if mask is None:
+            return None
+        selected = np.flatnonzero(mask)
+        return {name: self._columns[name][selected] for name in CHART_COLUMNS}
+
+    @staticmethod
+    def _top_codes(counts, limit):
+        """按数量从大到小取前 limit 个编码 (跳过空值编码 0 和数量为 0 的编码)"""
+        counts = counts.copy()
+        counts[0] = 0
+        order = np.argsort(-counts, kind='stable')[:limit]
+        return [code for code in order if counts[code] > 0]
+
+    def _scatter_points(self, view):
+        valid = np.flatnonzero((view['area'] > 0) & (view['price'] > 0))[:POINT_SAMPLE_SIZE]
+        return np.column_stack((view['area'][valid], view['price'][valid])).tolist()
+
+    def _rooms_counts(self, view, limit):
+        values = self._vocab['rooms'].values
+        counts = np.bincount(view['rooms'], minlength=len(values))
+        return [(values[code], int(counts[code])) for code in self._top_codes(counts, limit)]
+
+    def _top_addresses(self, view):
+        values = self._vocab['address'].values
+        codes = view['address']
+        prices = view['price']
+        priced = prices > 0
+        counts = np.bincount(codes, minlength=len(values))
+        price_counts = np.bincount(codes[priced], minlength=len(values))
+        price_sums = np.bincount(codes[priced], weights=prices[priced], minlength=len(values))
+        return [
+            (values[code], int(counts[code]),
+             round(float(price_sums[code] / price_counts[code]), 2) if price_counts[code] else 0)
+            for code in self._top_codes(counts, TOP_ADDRESS_LIMIT)
+        ]
+
+    def _price_series(self, view, rooms_list):
+        series = {}
+        for rooms in rooms_list:
+            code = self._vocab['rooms'].codes.get(rooms)
+            if view is None or code is None:
+                series[rooms] = []
+                continue
+            selected = np.flatnonzero((view['rooms'] == code) & (view['price'] > 0))
+            order = np.lexsort((view['id'][selected], view['publish_time'][selected]))
+            series[rooms] = view['price'][selected[order]].tolist()
+        return series
+
+    def scatter_points(self, region_str):
+        """面积和价格都有效的前 POINT_SAMPLE_SIZE 个房源 (按房源ID顺序)"""
+        self._ensure_fresh()
+        with self._lock:
+            view = self._select(region_str)
+            return [] if view is None else self._scatter_points(view)
+
+    def rooms_counts(self, region_str, limit):
+        """房源数量最多的户型 [(户型, 数量)]"""
+        self._ensure_fresh()
+        with self._lock:
+            view = self._select(region_str)
+            return [] if view is None else self._rooms_counts(view, limit)
+
+    def top_addresses(self, region_str):
+        """房源数量最多的小区 [(小区, 数量, 平均价格)]，平均价格只统计价格有效的房源"""
+        self._ensure_fresh()
+        with self._lock:
+            view = self._select(region_str)
+            return [] if view is None else self._top_addresses(view)
+
+    def price_series(self, region_str, rooms_list):
+        """各户型的价格序列 {户型: [价格, ...]}，按发布时间排序"""
+        self._ensure_fresh()
+        with self._lock:
+            return self._price_series(self._select(region_str), rooms_list)
+
+    def dashboard(self, region_str, rooms_limit, rooms_list):
+        """一个位置的全部图表数据：位置只筛选一次，各图表在同一份筛选结果上计算"""
+        self._ensure_fresh()
+        with self._lock:
+            view = self._select(region_str)
+            if view is None:
+                return {'scatter': [], 'rooms': [], 'top_addresses': [],
+                        'price_series': {rooms: [] for rooms in rooms_list}}
+            return {
+                'scatter': self._scatter_points(view),
+                'rooms': self._rooms_counts(view, rooms_limit),
+                'top_addresses': self._top_addresses(view),
+                'price_series': self._price_series(view, rooms_list),
+            }
+
+
+# 初始化列式快照，创建chart_snapshot对象
+chart_snapshot = ColumnarSnapshot(app)
+
+
+# --- 增量维护：房源提交后把变化合并进本进程的快照 ---
+def _apply_snapshot_changes(changes):
+    if chart_snapshot.available:
+        chart_snapshot.record_changes({
+            change.id: None if change.new is None else {c: change.new[c] for c in SNAPSHOT_COLUMNS}
+            for change in changes
+        })
+
+
+house_changes.subscribe(_apply_snapshot_changes, SNAPSHOT_COLUMNS)
@@ -0,0 +1,8 @@
+# 测试使用的配置 (通过 HOUSE_SETTINGS 加载，见 conftest.py)
+
+# 房源提交后的统计和匹配在提交的线程中同步执行，测试可以直接检查结果
+HOUSE_CHANGES_ASYNC = False
+# 降低密码哈希的迭代次数，加快登录相关的测试
+PASSWORD_HASH_ITERATIONS = 1000
+# SQLite 不需要连接池参数
+SQLALCHEMY_ENGINE_OPTIONS = {}
@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+import pytest
+
+# 在导入应用之前切换到临时的 SQLite 数据库和测试配置
+_DB_DIR = tempfile.mkdtemp(prefix='house-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_DB_DIR, 'house.db')
+os.environ['HOUSE_SETTINGS'] = os.path.join(os.path.dirname(__file__), 'config.py')
+os.environ['DATABASE_REPLICA_URLS'] = ''
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['WARMUP_ENABLED'] = '0'
+
+import app as app_module  # noqa: E402,F401  (注册全部蓝图和房源变化的订阅者)
+from settings import app as flask_app, db as database, cache  # noqa: E402
+from models import House, User  # noqa: E402
+from search_index import search_index  # noqa: E402
+from facet_index import facet_index  # noqa: E402
+from location import location_index  # noqa: E402
+from saved_search import saved_searches  # noqa: E402
+
+# 测试房源：(区, 街道, 小区, 户型, 面积, 价格, 朝向, 租住类型, 配套设施, 发布时间, 浏览量)
+# 发布时间和浏览量有重复值和空值，用于检查游标分页的排序
+HOUSES = [
+    ('朝阳区', '望京', '望京西园', '1室1厅', '35平米', '3500元/月', '南', '整租', '冰箱-洗衣机-空调', 1700000000, 120),
+    ('朝阳区', '望京', '望京西园', '2室1厅', '72平米', '6200元/月', '南北', '整租', '冰箱-洗衣机-电视-暖气', 1700000000, 80),
+    ('朝阳区', '望京', '花家地', '2室1厅', '68平米', '5800元/月', '东', '合租', '床-网络', 1700086400, None),
+    ('朝阳区', '三里屯', '幸福村', '3室1厅', '110平米', '9800元/月', '南', '整租', '冰箱-洗衣机-空调-电梯', 1700600000, 300),
+    ('朝阳区', '三里屯', '幸福村', '1室1厅', '28平米', '2600元/月', '西', '合租', '床-空调', None, 15),
+    ('海淀区', '中关村', '科育小区', '2室1厅', '60平米', '7000元/月', '南', '整租', '冰箱-洗衣机-空调-网络', 1701200000, 120),
+    ('海淀区', '中关村', '科育小区', '4室2厅', '140平米', '15000元/月', '南北', '整租', '冰箱-洗衣机-电视-空调-暖气-电梯', 1701200000, 120),
+    ('海淀区', '五道口', '华清嘉园', '1室1厅', '40平米', '4800元/月', '北', '合租', '床-网络-空调', 1702000000, None),
+    ('海淀区', '五道口', '华清嘉园', '3室1厅', '95平米', '8800元/月', '东南', '整租', '冰箱-洗衣机-热水器', 1702600000, 45),
+    ('海淀区', '五道口', '东升园', '5室2厅', '160平米', '18000元/月', '南', '整租', '冰箱-燃气-电梯', None, None),
+    ('丰台区', '方庄', '芳古园', '2室1厅', '55平米', '4200元/月', '南', '整租', '冰箱-洗衣机-燃气', 1703000000, 60),
+    ('丰台区', '方庄', '芳古园', '1室0厅', '25平米', '2200元/月', '东', '合租', '床', 1703000000, 60),
+    ('丰台区', '方庄', '芳星园', '3室1厅', '88平米', '0元/月', '西南', '整租', '冰箱-电视', 1703500000, 10),
+    ('丰台区', '方庄', '芳星园', '2室1厅', '', '5200元/月', '未知', '', '', 1704000000, 200),
+]
+
+
+def make_house(number, region, block, address, rooms, area, price, direction, rent_type, facilities,
+               publish_time, page_views):
+    return House(title=f'{block}{address}{rooms}', region=region, block=block, address=address, rooms=rooms,
+                 area=area, price=price, direction=direction, rent_type=rent_type, facilities=facilities,
+                 publish_time=publish_time, page_views=page_views, traffic='近地铁', highlights='', matching='',
+                 travel='', landlord='王', phone_num='1', house_num=f'HN{number}')
+
+
+def rebuild_indexes():
+    """重建进程内索引：数据库重新创建后，上一个测试留下的索引 (如位置编号) 已经失效"""
+    for index in (location_index, search_index, facet_index, saved_searches):
+        index.rebuild()
+
+
+@pytest.fixture()
+def app():
+    """每个测试使用一个空的数据库"""
+    with flask_app.app_context():
+        database.drop_all()
+        database.create_all()
+        cache.backend.clear()
+        rebuild_indexes()
+        yield flask_app
+        database.session.remove()
+
+
+@pytest.fixture()
+def houses(app):
+    """写入测试房源和用户 alice (明文密码 'pw'，模拟升级前的旧数据)"""
+    database.session.add_all(make_house(i, *values) for i, values in enumerate(HOUSES))
+    database.session.add(User(name='alice', password='pw', email='alice@example.com'))
+    database.session.commit()
+    # 新的位置会让位置索引在后台重建，这里同步重建，避免测试结果依赖后台线程
+    rebuild_indexes()
+    return House.query.order_by(House.id).all()
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
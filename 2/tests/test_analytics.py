@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import analytics
+from settings import db
+from models import House, RegionStat
+from house_changes import house_changes
+from snapshot import chart_snapshot
+from tests.conftest import make_house
+
+LIST_FIELDS = ('price_series', 'points', 'top_addresses')
+
+
+@pytest.fixture()
+def region_stats_maintained(houses, monkeypatch):
+    """把统计表作为图表数据来源：从全量构建开始，之后由订阅者增量维护"""
+    monkeypatch.setattr(house_changes, '_subscribers', list(house_changes._subscribers))
+    analytics.subscribe_region_stats()
+    with db.engine.begin() as conn:
+        analytics.rebuild_all(conn)
+
+
+def stat_rows():
+    db.session.expire_all()
+    return {(r.region, r.block, r.address, r.rooms): r for r in RegionStat.query}
+
+
+def rebuilt_rows():
+    with db.engine.begin() as conn:
+        analytics.rebuild_all(conn)
+    return stat_rows()
+
+
+def snapshot(rows):
+    return {key: (r.house_count, r.price_count, r.price_sum, r.price_avg,
+                  *(json.loads(getattr(r, f)) if getattr(r, f) else None for f in LIST_FIELDS))
+            for key, r in rows.items()}
+
+
+def test_incremental_updates_match_rebuild(region_stats_maintained, houses):
+    db.session.add(make_house(100, '朝阳区', '望京', '花家地', '1室1厅', '30平米', '3100元/月', '南', '合租', '床',
+                              1700090000, 0))
+    db.session.add(make_house(101, '丰台区', '方庄', '新小区', '2室1厅', '50平米', '4100元/月', '南', '整租', '',
+                              1700090000, 0))
+    db.session.commit()
+
+    by_id = {h.id: h for h in House.query}
+    by_id[houses[0].id].price = '3900元/月'
+    by_id[houses[1].id].rooms = '3室1厅'
+    by_id[houses[2].id].address = '望京西园'
+    by_id[houses[3].id].region = '海淀区'
+    by_id[houses[4].id].area = '33平米'
+    by_id[houses[10].id].publish_time = 1690000000
+    db.session.commit()
+
+    # 删除小区的最后一套房源时，这个小区的统计行也被删除
+    for house in House.query.filter_by(address='幸福村'):
+        db.session.delete(house)
+    db.session.commit()
+
+    incremental = snapshot(stat_rows())
+    assert not any(key[2] == '幸福村' for key in incremental)
+    rebuilt = snapshot(rebuilt_rows())
+    assert incremental.keys() == rebuilt.keys()
+    for key, values in rebuilt.items():
+        assert incremental[key][:2] == values[:2], key
+        assert incremental[key][2:4] == pytest.approx(values[2:4]), key
+        assert incremental[key][4:] == values[4:], key
+
+
+def test_not_maintained_when_snapshot_serves_charts(houses):
+    """安装了 NumPy 时图表由列式快照计算，统计表不随房源变化更新"""
+    pytest.importorskip('numpy')
+    assert chart_snapshot.available
+    db.session.add(make_house(100, '朝阳区', '望京', '花家地', '1室1厅', '30平米', '3100元/月', '南', '合租', '床',
+                              1700090000, 0))
+    db.session.commit()
+    assert not RegionStat.query.count()
+
+
+@pytest.mark.parametrize('region', ['朝阳区', '海淀-五道口', '丰台区-方庄-芳古园'])
+def test_region_stats_match_snapshot(houses, region):
+    pytest.importorskip('numpy')
+    with db.engine.begin() as conn:
+        analytics.rebuild_all(conn)
+    chart_snapshot.rebuild()
+    rooms = ['2室1厅', '3室1厅']
+    from_table = analytics.region_stats.dashboard(region, 5, rooms)
+    from_snapshot = chart_snapshot.dashboard(region, 5, rooms)
+    assert sorted(map(tuple, from_table['rooms'])) == sorted(map(tuple, from_snapshot['rooms']))
+    assert from_table['price_series'] == from_snapshot['price_series']
+    assert sorted(map(tuple, from_table['top_addresses'])) == sorted(map(tuple, from_snapshot['top_addresses']))
@@ -0,0 +1,74 @@
+from auth import check_password, hash_password, is_hashed, needs_rehash
+from settings import db
+from models import User
+
+
+def stored_password():
+    db.session.expire_all()
+    return User.query.filter_by(name='alice').one().password
+
+
+def login(client, password):
+    client.post('/api/login', data={'username': 'alice', 'password': password})
+    with client.session_transaction() as session:
+        return session.get('user_name')
+
+
+def test_hash_and_check(app):
+    stored = hash_password('secret')
+    assert is_hashed(stored) and len(stored) <= 100
+    assert stored.split('$')[1] == str(app.config['PASSWORD_HASH_ITERATIONS'])
+    assert check_password(stored, 'secret')
+    assert not check_password(stored, 'Secret')
+    assert not check_password(stored, None)
+    assert not check_password('pbkdf2_sha256$broken', 'secret')
+    assert hash_password('secret') != stored
+
+
+def test_wrong_password_keeps_plaintext(houses, client):
+    assert login(client, 'wrong') is None
+    assert stored_password() == 'pw'
+
+
+def test_plaintext_password_upgraded_on_login(houses, client):
+    assert login(client, 'pw') == 'alice'
+    stored = stored_password()
+    assert is_hashed(stored) and not needs_rehash(stored)
+    assert check_password(stored, 'pw')
+
+    # 已经是当前配置的哈希时，再次登录不会改写
+    client.get('/api/logout')
+    assert login(client, 'pw') == 'alice'
+    assert stored_password() == stored
+
+
+def test_weak_hash_upgraded_when_iterations_change(houses, client, monkeypatch):
+    login(client, 'pw')
+    weak = stored_password()
+    client.get('/api/logout')
+
+    monkeypatch.setitem(client.application.config, 'PASSWORD_HASH_ITERATIONS',
+                        client.application.config['PASSWORD_HASH_ITERATIONS'] * 2)
+    assert needs_rehash(weak)
+    assert login(client, 'pw') == 'alice'
+    upgraded = stored_password()
+    assert upgraded != weak and not needs_rehash(upgraded)
+    assert check_password(upgraded, 'pw')
+
+
+def test_user_page_does_not_render_password(houses, client):
+    """个人主页不输出保存的密码 (无论是升级前的明文还是哈希)"""
+    db.session.add(User(name='bob', password='plain-secret-123', email='bob@example.com'))
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['user_id'] = User.query.filter_by(name='bob').one().id
+        session['user_name'] = 'bob'
+    page = client.get('/user/bob')
+    assert page.status_code == 200
+    assert 'plain-secret-123' not in page.get_data(as_text=True)
+
+    client.get('/api/logout')
+    assert login(client, 'pw') == 'alice'
+    page = client.get('/user/alice')
+    assert page.status_code == 200
+    assert stored_password() not in page.get_data(as_text=True)
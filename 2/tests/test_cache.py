@@ -0,0 +1,56 @@
+from flask import render_template_string
+
+from settings import db, cache, instrumentation
+from models import House
+from index_page import get_hot_houses, get_new_houses
+
+EXTERNAL = {'REMOTE_ADDR': '203.0.113.7'}
+
+
+def test_hot_lists_cached_until_house_changes(houses):
+    hot = get_hot_houses(8)
+    get_new_houses(8)
+    # 缓存命中时不再查询数据库：直接修改表中的数据，缓存的结果不变
+    db.session.execute(House.__table__.update().values(page_views=0))
+    db.session.commit()
+    assert get_hot_houses(8) == hot
+
+    house = db.session.get(House, houses[0].id)
+    house.price = '3600元/月'
+    db.session.commit()
+    assert cache.peek('hot_houses', 8) is None
+    assert cache.peek('new_houses', 8) is None
+
+
+def test_chart_cache_invalidated_for_changed_region_only(houses, client):
+    client.get('/api/get/piedata/朝阳区')
+    client.get('/api/get/piedata/海淀区')
+    assert cache.peek('charts', '朝阳|||pie') is not None
+
+    house = db.session.get(House, houses[0].id)
+    house.rooms = '2室1厅'
+    db.session.commit()
+    assert cache.peek('charts', '朝阳|||pie') is None
+    assert cache.peek('charts', '海淀|||pie') is not None
+    data = client.get('/api/get/piedata/朝阳区').json['data']
+    assert data == client.get('/api/get/piedata/朝阳').json['data']
+
+
+def test_cache_stats_internal_only(app, client, monkeypatch):
+    assert client.get('/api/cache/stats').status_code == 200
+    assert client.get('/api/cache/stats', environ_base=EXTERNAL).status_code == 404
+
+    monkeypatch.setattr(instrumentation, 'token', 'secret-token')
+    headers = {'Authorization': 'Bearer secret-token'}
+    assert client.get('/api/cache/stats', environ_base=EXTERNAL, headers=headers).status_code == 200
+    headers = {'Authorization': 'Bearer wrong'}
+    assert client.get('/api/cache/stats', environ_base=EXTERNAL, headers=headers).status_code == 404
+
+
+def test_fragment_cache_keyed_by_arguments(app):
+    template = "{% cache 'test', version %}<b>{{ value }}</b>{% endcache %}"
+    with app.test_request_context():
+        assert render_template_string(template, version=1, value='a') == '<b>a</b>'
+        # 键不变时直接使用缓存的片段，不再渲染块内的内容
+        assert render_template_string(template, version=1, value='b') == '<b>a</b>'
+        assert render_template_string(template, version=2, value='b') == '<b>b</b>'
@@ -0,0 +1,45 @@
+import pytest
+
+import analytics
+import app as app_module
+from settings import db
+from snapshot import chart_snapshot
+
+REGIONS = ['朝阳区', '海淀区-五道口', '丰台-方庄-芳古园', '不存在的区']
+CHARTS = {'scatter': 'scatterdata', 'pie': 'piedata', 'column': 'columndata', 'broken_line': 'brokenlinedata'}
+
+
+@pytest.fixture(params=['snapshot', 'region_stats'])
+def chart_source(request, houses, monkeypatch):
+    """两种图表数据来源：列式快照 (需要 numpy) 和预聚合的统计表"""
+    if request.param == 'snapshot':
+        pytest.importorskip('numpy')
+        chart_snapshot.rebuild()
+    else:
+        monkeypatch.setattr(chart_snapshot, 'available', False)
+        with db.engine.begin() as conn:
+            analytics.rebuild_all(conn)
+    return request.param
+
+
+@pytest.mark.parametrize('region', REGIONS)
+def test_dashboard_matches_single_chart_endpoints(chart_source, client, region):
+    dashboard = client.get(f'/api/get/dashboard/{region}').json['data']
+    for chart, endpoint in CHARTS.items():
+        assert dashboard[chart] == client.get(f'/api/get/{endpoint}/{region}').json['data'], chart
+
+
+def test_dashboard_for_several_regions(chart_source, client):
+    response = client.get('/api/get/dashboard', query_string=[('region', '朝阳'), ('region', '海淀区-五道口'),
+                                                              ('region', '朝阳')])
+    data = response.json['data']
+    assert set(data) == {'朝阳', '海淀区-五道口'}
+    assert data['海淀区-五道口'] == client.get('/api/get/dashboard/海淀区-五道口').json['data']
+    response = client.get('/api/get/dashboard', query_string={'regions': '朝阳, 丰台'})
+    assert set(response.json['data']) == {'朝阳', '丰台'}
+
+
+def test_dashboard_region_list_is_validated(app, client, monkeypatch):
+    assert client.get('/api/get/dashboard').status_code == 400
+    monkeypatch.setattr(app_module, 'MAX_DASHBOARD_REGIONS', 2)
+    assert client.get('/api/get/dashboard', query_string={'regions': '朝阳,海淀,丰台'}).status_code == 400
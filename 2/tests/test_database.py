@@ -0,0 +1,68 @@
+from flask import Flask, session as flask_session
+from flask_sqlalchemy import SQLAlchemy
+import pytest
+from sqlalchemy import select
+
+from database import RoutingSession, read_engine
+
+
+@pytest.fixture()
+def routing(tmp_path):
+    """主库和一个只读副本 (两个本地 SQLite 文件)，两边写入不同的数据以区分查询落在哪个库"""
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path}/primary.db'
+    app.config['SQLALCHEMY_BINDS'] = {'replica_0': f'sqlite:///{tmp_path}/replica.db'}
+    app.config['DB_REPLICA_STICKY_SECONDS'] = 5
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+    class Item(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(20))
+
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        with db.engine.begin() as conn:
+            conn.execute(Item.__table__.insert(), {'id': 1, 'name': 'primary'})
+        with db.engines['replica_0'].begin() as conn:
+            conn.execute(Item.__table__.insert(), {'id': 1, 'name': 'replica'})
+    return app, db, Item
+
+
+def names(db, stmt):
+    return db.session.scalars(stmt).all()
+
+
+def test_reads_go_to_replica(routing):
+    app, db, Item = routing
+    with app.app_context():
+        assert names(db, select(Item.name)) == ['replica']
+        assert db.session.get(Item, 1).name == 'replica'
+        assert read_engine(db) is db.engines['replica_0']
+
+
+def test_primary_option_and_locking_reads_use_primary(routing):
+    app, db, Item = routing
+    with app.app_context():
+        stmt = select(Item.name).with_for_update().execution_options(use_primary=True)
+        assert names(db, stmt) == ['primary']
+        # 之后本次会话的读取也走主库
+        assert names(db, select(Item.name)) == ['primary']
+
+
+def test_writes_stick_to_primary(routing):
+    app, db, Item = routing
+    with app.test_request_context():
+        db.session.add(Item(id=2, name='new'))
+        db.session.flush()
+        assert names(db, select(Item.name).order_by(Item.id)) == ['primary', 'new']
+        db.session.commit()
+        db.session.remove()
+        # 新的会话：用户刚写入过，读请求在 DB_REPLICA_STICKY_SECONDS 内仍然走主库
+        assert flask_session['_primary_until'] > 0
+        assert names(db, select(Item.name).order_by(Item.id)) == ['primary', 'new']
+        assert read_engine(db) is db.engine
+    with app.test_request_context():
+        # 其他用户 (没有写入记录) 读副本
+        assert names(db, select(Item.name)) == ['replica']
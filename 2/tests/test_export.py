@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+from collections import OrderedDict
+
+import pytest
+
+from settings import limiter
+
+
+@pytest.fixture()
+def logged_in(houses, client, monkeypatch):
+    # 限流器是进程内的全局对象，每个测试从空的令牌桶开始
+    monkeypatch.setattr(limiter, '_buckets', OrderedDict())
+    client.post('/api/login', data={'username': 'alice', 'password': 'pw'})
+    return client
+
+
+def test_export_requires_login(houses, client):
+    assert client.get('/api/export/houses').json['code'] == 0
+    assert client.get('/api/stream/scatterdata/朝阳区').json['code'] == 0
+
+
+def test_export_ndjson_and_csv(logged_in):
+    response = logged_in.get('/api/export/houses', query_string={'region': '海淀区', 'price': '5000-10000'})
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['house_num'] for row in rows] == ['HN5', 'HN8']
+    response = logged_in.get('/api/export/houses', query_string={'format': 'csv', 'region': '丰台区'})
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True).lstrip('\ufeff'))))
+    assert [row['house_num'] for row in rows] == ['HN10', 'HN11', 'HN12', 'HN13']
+
+
+def test_export_rows_are_capped(logged_in, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'EXPORT_MAX_ROWS', 3)
+    response = logged_in.get('/api/export/houses', query_string={'limit': 100})
+    assert len(response.get_data(as_text=True).splitlines()) == 3
+    response = logged_in.get('/api/stream/scatterdata/朝阳区')
+    assert response.json['data'] == [[35.0, 3500.0], [72.0, 6200.0], [68.0, 5800.0]]
+
+
+def test_scatter_stream_matches_location(logged_in):
+    response = logged_in.get('/api/stream/scatterdata/丰台区-方庄')
+    # 面积或价格无效的房源不是数据点
+    assert response.json['data'] == [[55.0, 4200.0], [25.0, 2200.0]]
+
+
+def test_export_is_rate_limited(logged_in, app):
+    burst = app.config['RATE_LIMITS']['export'][1]
+    statuses = [logged_in.get('/api/stream/scatterdata/朝阳区').status_code for _ in range(burst)]
+    assert statuses == [200] * burst
+    response = logged_in.get('/api/export/houses')
+    assert response.status_code == 429 and int(response.headers['Retry-After']) >= 1
@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy import func, select
+
+import app as app_module
+from settings import db
+from models import House
+from utils import FACILITIES, FACILITY_BITS, DIRECTIONS, RENT_TYPES, decode_choice
+
+SELECTIONS = [
+    {},
+    {'rooms': '2室1厅'},
+    {'rooms': '4室及以上', 'direction': '南北'},
+    {'rent_type': '整租', 'facilities': '冰箱,空调'},
+    {'region': '朝阳区', 'rooms': '1室1厅'},
+    {'region': '海淀区-五道口', 'price': '3000-9000'},
+    {'keyword': '望京', 'rent_type': '合租'},
+    {'area': '50-100', 'facilities': 'Wi-Fi'},
+    {'region': '不存在的区'},
+    {'region': '朝阳', 'price': '3000-5000', 'area': '50-70'},
+    {'price': '12000-999999', 'area': '120-9999'},
+    {'price': '2500-4200', 'area': '0-65'},
+    {'region': '不存在的区-某街道', 'keyword': '花园'},
+]
+
+
+def sql_count(args, selection, excluded=None, extra=()):
+    """按 /api/search 的筛选条件在数据库中计数，excluded 维度的筛选不生效"""
+    selection = dict(selection)
+    if excluded:
+        selection[excluded] = None
+    filters = app_module.search_range_filters(args) + app_module.search_facet_filters(selection)
+    return db.session.scalar(select(func.count(House.id)).where(*filters, *extra))
+
+
+def sql_facets(args):
+    selection = app_module.search_facet_selection(args)
+    rooms_values = db.session.scalars(select(House.rooms).distinct()).all()
+
+    def counts(dimension, column, values, label=lambda v: v):
+        result = {label(v): sql_count(args, selection, dimension, [column == v]) for v in values if v}
+        return {k: v for k, v in result.items() if v}
+
+    return {
+        'total': sql_count(args, selection),
+        'rooms': counts('rooms', House.rooms, rooms_values),
+        'rent_type': counts('rent_type_code', House.rent_type_code, range(1, len(RENT_TYPES) + 1),
+                            lambda code: decode_choice(code, RENT_TYPES)),
+        'direction': counts('direction_code', House.direction_code, range(1, len(DIRECTIONS) + 1),
+                            lambda code: decode_choice(code, DIRECTIONS)),
+        'facilities': {label: sql_count(args, selection, extra=[House.facilities_mask.op('&')(bit) == bit])
+                       for (keyword, label), bit in zip(FACILITIES, FACILITY_BITS.values())},
+    }
+
+
+def as_dicts(data):
+    return {
+        'total': data['total'],
+        'rooms': {c['value']: c['count'] for c in data['rooms']},
+        'rent_type': {c['value']: c['count'] for c in data['rent_type']},
+        'direction': {c['value']: c['count'] for c in data['direction']},
+        'facilities': {c['value']: c['count'] for c in data['facilities']},
+    }
+
+
+@pytest.mark.parametrize('args', SELECTIONS)
+def test_facet_counts_match_sql(houses, client, args):
+    response = client.get('/api/search/facets', query_string=args)
+    assert response.json['code'] == 1
+    with app_module.app.test_request_context(query_string=args):
+        assert as_dicts(response.json['data']) == sql_facets(args)
+
+
+def test_facet_counts_after_incremental_update(houses, client):
+    """提交的修改增量合并到位图后，计数仍与数据库一致"""
+    house = db.session.get(House, houses[0].id)
+    house.rooms = '2室1厅'
+    house.facilities = '冰箱-网络'
+    db.session.delete(db.session.get(House, houses[5].id))
+    db.session.commit()
+    args = {'rooms': '2室1厅', 'facilities': '冰箱'}
+    response = client.get('/api/search/facets', query_string=args)
+    with app_module.app.test_request_context(query_string=args):
+        assert as_dicts(response.json['data']) == sql_facets(args)
+
+
+def test_facet_ranges_after_incremental_update(houses, client):
+    """价格/面积和位置变化后，房源移动到新的桶和位置位图中"""
+    house = db.session.get(House, houses[0].id)
+    house.price = '4100元/月'
+    house.area = '66平米'
+    house.region = '海淀'
+    house.block = '五道口'
+    db.session.commit()
+    for args in ({'price': '3000-5000'}, {'price': '4000-4500', 'area': '60-70'}, {'region': '海淀区-五道口'}):
+        response = client.get('/api/search/facets', query_string=args)
+        with app_module.app.test_request_context(query_string=args):
+            assert as_dicts(response.json['data']) == sql_facets(args)
+
+
+def test_unknown_facet_value(houses, client):
+    assert client.get('/api/search/facets', query_string={'facilities': '游泳池'}).json['code'] == 0
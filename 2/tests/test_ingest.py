@@ -0,0 +1,75 @@
+import json
+import time
+
+from sqlalchemy import select
+
+import ingest
+from models import House
+from settings import db
+from tests.conftest import make_house
+
+
+def write_jsonl(path, records):
+    path.write_text('\n'.join(json.dumps(r, ensure_ascii=False) for r in records), encoding='utf-8')
+    return str(path)
+
+
+def listing(house_num, price='3000元/月', **values):
+    record = {'house_num': house_num, 'region': '朝阳', 'block': '望京', 'address': '望京花园',
+              'rooms': '两室一厅', 'area': '80平米', 'price': price, 'publish_time': '2024-01-02'}
+    record.update(values)
+    return record
+
+
+def houses_by_num():
+    return {h.house_num: h for h in db.session.scalars(select(House))}
+
+
+def test_ingest_inserts_and_counts_rejections(app, tmp_path):
+    path = write_jsonl(tmp_path / 'a.jsonl', [
+        listing('N1'), listing('N2', price='面议'), listing('', rooms='1室'),
+    ])
+    stats = ingest.ingest(db.engine, [path])
+    assert (stats.read, stats.inserted, stats.updated) == (3, 1, 0)
+    assert stats.rejected == {'价格无效': 1, '缺少房源编号': 1}
+    house = houses_by_num()['N1']
+    assert (house.rooms, house.price_value, house.page_views) == ('2室1厅', 3000, 0)
+    assert house.region_id is not None
+
+
+def test_ingest_dedupes_and_updates_existing_houses(app, tmp_path):
+    existing = make_house(1, '朝阳', '望京', '望京花园', '1室1厅', '50平米', '2000元/月',
+                          '南', '整租', '', 1704067200, 42)
+    existing.house_num = 'N1'
+    db.session.add(existing)
+    db.session.commit()
+    path = write_jsonl(tmp_path / 'a.jsonl', [listing('N1', price='2500元/月'), listing('N1', price='2800元/月')])
+    stats = ingest.ingest(db.engine, [path])
+    assert (stats.duplicates, stats.inserted, stats.updated) == (1, 0, 1)
+    db.session.expire_all()
+    houses = houses_by_num()
+    assert len(houses) == 1
+    # 重复的编号只保留第一条，浏览量保留
+    assert (houses['N1'].price_value, houses['N1'].page_views) == (2500, 42)
+
+
+def test_ingest_upserts_rows_written_after_the_read(app, tmp_path, monkeypatch):
+    path = write_jsonl(tmp_path / 'a.jsonl', [listing('N1')])
+    ingest.ingest(db.engine, [path])
+    # 模拟读取已有编号之后其他进程插入了同一个编号
+    monkeypatch.setattr(ingest, 'existing_houses', lambda conn, house_nums: {})
+    path = write_jsonl(tmp_path / 'b.jsonl', [listing('N1', price='3500元/月')])
+    stats = ingest.ingest(db.engine, [path])
+    assert stats.rejected == {}
+    db.session.expire_all()
+    houses = houses_by_num()
+    assert len(houses) == 1 and houses['N1'].price_value == 3500
+
+
+def test_publish_time_is_parsed_in_beijing_time(monkeypatch):
+    for tz in ('UTC', 'America/New_York'):
+        monkeypatch.setenv('TZ', tz)
+        time.tzset()
+        assert ingest.parse_publish_time('2024-01-02') == 1704124800
+    monkeypatch.undo()
+    time.tzset()
@@ -0,0 +1,51 @@
+from sqlalchemy.engine import Result
+
+from settings import instrumentation
+
+
+def metric(name, endpoint):
+    prefix = f'{name}{{endpoint="{endpoint}"}} '
+    for line in instrumentation.render_metrics().splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0
+
+
+def search(client):
+    response = client.get('/api/search', query_string={'region': '丰台区'})
+    assert response.status_code == 200
+
+
+def test_rows_counted_for_sampled_requests(houses, client, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'row_sample_rate', 1.0)
+    rows = metric('db_rows_materialized_total', 'api.search_houses')
+    sampled = metric('db_rows_sampled_requests_total', 'api.search_houses')
+    search(client)
+    assert metric('db_rows_sampled_requests_total', 'api.search_houses') == sampled + 1
+    # 丰台区的 4 个房源 (以及分页的计数查询)
+    assert metric('db_rows_materialized_total', 'api.search_houses') >= rows + 4
+
+
+def test_unsampled_requests_keep_results_unbuffered(houses, client, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'row_sample_rate', 0.0)
+
+    def freeze(self):
+        raise AssertionError('未采样的请求不应重新包装查询结果')
+
+    monkeypatch.setattr(Result, 'freeze', freeze)
+    rows = metric('db_rows_materialized_total', 'api.search_houses')
+    sampled = metric('db_rows_sampled_requests_total', 'api.search_houses')
+    queries = metric('db_queries_total', 'api.search_houses')
+    search(client)
+    assert metric('db_rows_materialized_total', 'api.search_houses') == rows
+    assert metric('db_rows_sampled_requests_total', 'api.search_houses') == sampled
+    assert metric('db_queries_total', 'api.search_houses') > queries
+
+
+def test_metrics_only_for_internal_callers(app, client, monkeypatch):
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.8'}).status_code == 404
+    assert client.get('/metrics').status_code == 200
+    monkeypatch.setattr(instrumentation, 'token', 'secret')
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.8'},
+                          headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200 and 'db_queries_total' in response.get_data(as_text=True)
@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import select
+
+from location import location_filters, location_index
+from models import Block, Community, House, Region
+from settings import db
+from tests.conftest import make_house
+
+LOCATIONS = ['朝阳区', '朝阳', '海淀区-五道口', '海淀-五道口-华清嘉园', '丰台区-方庄-芳星园', '丰台区-望京', '不存在的区']
+
+
+def text_match_ids(region_str):
+    """按文本字段匹配的房源 (位置表建立之前的规则)"""
+    region, block, address = (region_str.split('-') + ['', ''])[:3]
+    region = region.replace('区', '')
+    return {h.id for h in House.query if (h.region or '').replace('区', '') == region
+            and (not block or h.block == block) and (not address or h.address == address)}
+
+
+def filtered_ids(region_str):
+    region, block, address = (region_str.split('-') + ['', ''])[:3]
+    return set(db.session.scalars(select(House.id).where(*location_filters(region, block, address))))
+
+
+def test_houses_get_location_ids(houses):
+    for house in houses:
+        region = db.session.get(Region, house.region_id)
+        block = db.session.get(Block, house.block_id)
+        community = db.session.get(Community, house.community_id)
+        assert (region.name, block.name, community.name) == (house.region.replace('区', ''), house.block,
+                                                             house.address)
+        assert block.region_id == region.id and community.block_id == block.id
+    assert db.session.query(Region).count() == 3
+
+
+@pytest.mark.parametrize('region_str', LOCATIONS)
+def test_id_filters_match_text_filters(houses, region_str):
+    assert location_index.complete
+    assert filtered_ids(region_str) == text_match_ids(region_str)
+
+
+def test_falls_back_to_text_until_backfilled(houses, app):
+    db.session.execute(House.__table__.update().where(House.id == houses[0].id).values(region_id=None))
+    db.session.commit()
+    location_index.rebuild()
+    assert not location_index.complete
+    assert location_index.filters('朝阳') is None
+    assert filtered_ids('朝阳区-望京') == text_match_ids('朝阳区-望京')
+
+    result = app.test_cli_runner().invoke(args=['build-locations'])
+    assert result.exit_code == 0, result.output
+    assert location_index.complete
+    assert db.session.get(House, houses[0].id).region_id is not None
+
+
+def test_new_location_available_after_commit(houses):
+    db.session.add(make_house(100, '东城区', '东直门', '东环广场', '1室1厅', '40平米', '5000元/月', '南', '整租', '',
+                              1700090000, 0))
+    db.session.commit()
+    location_index.rebuild()
+    assert [c['name'] for c in location_index.children('东城')] == ['东直门']
+    assert filtered_ids('东城区-东直门') == text_match_ids('东城区-东直门') != set()
+
+
+def test_drill_down_and_suggest_endpoints(houses, client):
+    regions = client.get('/api/get/locations').json['data']
+    assert sorted(r['name'] for r in regions) == ['丰台', '朝阳', '海淀']
+    blocks = client.get('/api/get/locations', query_string={'parent': '海淀区'}).json['data']
+    assert sorted(b['name'] for b in blocks) == ['中关村', '五道口']
+    assert client.get('/api/get/locations', query_string={'parent': '海淀-西二旗'}).status_code == 404
+
+    suggestions = client.get('/api/get/locations/suggest', query_string={'q': '芳'}).json['data']
+    assert {(s['level'], s['path']) for s in suggestions} == {('address', '丰台-方庄-芳古园'),
+                                                              ('address', '丰台-方庄-芳星园')}
+    assert client.get('/api/get/locations/suggest', query_string={'q': ''}).json['code'] == 0
@@ -0,0 +1,40 @@
+import pytest
+
+from models import House
+from settings import db
+
+
+def login(client):
+    client.post('/api/login', data={'username': 'alice', 'password': 'pw'})
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+# 页面地址，以及页面上展示的一个房源 (最新发布、浏览量最高)
+@pytest.mark.parametrize('url, index', [('/house/{id}', 0), ('/list/pattern/1', 13), ('/list/hot_house/1', 3)])
+def test_unchanged_pages_return_304(houses, client, url, index):
+    url = url.format(id=houses[index].id)
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and response.cache_control.public
+    response = revalidate(client, url, etag)
+    assert response.status_code == 304 and response.get_data() == b''
+
+    # 房源修改后 ETag 变化，重新渲染
+    house = db.session.get(House, houses[index].id)
+    house.price = '3900元/月'
+    db.session.commit()
+    response = revalidate(client, url, etag)
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert '3900' in response.get_data(as_text=True)
+
+
+def test_etag_depends_on_logged_in_user(houses, client):
+    url = f'/house/{houses[1].id}'
+    etag = client.get(url).headers['ETag']
+    login(client)
+    response = revalidate(client, url, etag)
+    assert response.status_code == 200 and response.cache_control.private
+    assert 'alice' in response.get_data(as_text=True)
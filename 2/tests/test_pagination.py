@@ -0,0 +1,61 @@
+import pytest
+
+from models import House
+from pagination import KeysetPagination, decode_cursor, encode_cursor
+
+
+def expected_order(houses, field):
+    """(field DESC, id DESC)，NULL 排在最后"""
+    return [h.id for h in sorted(houses, key=lambda h: (getattr(h, field) is None, -(getattr(h, field) or 0), -h.id))]
+
+
+def test_cursor_round_trip():
+    for args in (('next', 2, 1700000000, 15), ('prev', 1, None, 3), ('next', 5, '朝阳区', 7)):
+        assert decode_cursor(encode_cursor(*args)) == args
+
+
+@pytest.mark.parametrize('token', ['', 'not-a-cursor', '!!!!', encode_cursor('up', 1, 0, 1)[:-1],
+                                   encode_cursor('up', 1, 0, 1), encode_cursor('next', 1, 0, '1'),
+                                   encode_cursor('next', '2', 0, 1)])
+def test_invalid_cursor(token):
+    assert decode_cursor(token) is None
+
+
+@pytest.mark.parametrize('field', ['publish_time', 'page_views'])
+def test_walk_pages_with_cursors(houses, field):
+    """按游标向后翻页再向前翻页，得到的顺序与 SQL 排序一致 (NULL 在最后)，且没有重复或遗漏"""
+    sort_column = getattr(House, field)
+    expected = expected_order(houses, field)
+    per_page = 3
+
+    pages = []
+    pagination = KeysetPagination(House.query, sort_column, House.id, per_page)
+    while True:
+        pages.append([h.id for h in pagination.items])
+        assert pagination.page == len(pages)
+        if not pagination.has_next:
+            break
+        pagination = KeysetPagination(House.query, sort_column, House.id, per_page, cursor=pagination.next_cursor)
+    assert [house_id for page in pages for house_id in page] == expected
+
+    backwards = [[h.id for h in pagination.items]]
+    while pagination.has_prev:
+        pagination = KeysetPagination(House.query, sort_column, House.id, per_page, cursor=pagination.prev_cursor)
+        backwards.append([h.id for h in pagination.items])
+    assert pagination.page == 1
+    assert list(reversed(backwards)) == pages
+
+
+def test_offset_page_matches_cursor_page(houses):
+    """直接跳页 (没有游标) 与逐页翻到同一页的结果相同"""
+    first = KeysetPagination(House.query, House.page_views, House.id, 4)
+    second = KeysetPagination(House.query, House.page_views, House.id, 4, cursor=first.next_cursor)
+    jumped = KeysetPagination(House.query, House.page_views, House.id, 4, page=2)
+    assert [h.id for h in jumped.items] == [h.id for h in second.items]
+    assert jumped.has_prev and jumped.has_next
+
+
+def test_invalid_cursor_falls_back_to_first_page(houses):
+    pagination = KeysetPagination(House.query, House.publish_time, House.id, 5, cursor='garbage')
+    assert pagination.page == 1
+    assert [h.id for h in pagination.items] == expected_order(houses, 'publish_time')[:5]
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+import autocomplete
+import ratelimit
+from ratelimit import RateLimiter
+from search_index import search_index
+from settings import cache, limiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, 'monotonic', clock)
+    return clock
+
+
+def test_token_bucket_refills_at_rate(clock):
+    limiter = RateLimiter()
+    limiter.limits = {'test': (2, 3)}
+    assert [limiter.check('test', 'a') for _ in range(3)] == [0, 0, 0]
+    assert limiter.check('test', 'a') == pytest.approx(0.5)
+    # 其他客户端有自己的令牌桶，未配置的接口不限流
+    assert limiter.check('test', 'b') == 0
+    assert limiter.check('other', 'a') == 0
+    clock.now += 0.5
+    assert limiter.check('test', 'a') == 0
+    assert limiter.check('test', 'a') > 0
+
+
+def test_least_recently_seen_clients_evicted(clock):
+    limiter = RateLimiter()
+    limiter.limits = {'test': (1, 1)}
+    limiter.max_clients = 2
+    limiter.check('test', 'a')
+    limiter.check('test', 'b')
+    limiter.check('test', 'c')
+    assert [client for _, client in limiter._buckets] == ['b', 'c']
+    # 被淘汰的客户端重新获得完整的突发额度
+    assert limiter.check('test', 'a') == 0
+
+
+def test_autocomplete_endpoint_returns_429(houses, client, monkeypatch):
+    monkeypatch.setattr(limiter, '_buckets', OrderedDict())
+    burst = client.application.config['RATE_LIMITS']['autocomplete'][1]
+    for _ in range(burst):
+        assert client.post('/api/search/keyword/', data={'kw': '望京'}).json['code'] == 1
+    response = client.post('/api/search/keyword/', data={'kw': '望京'})
+    assert response.status_code == 429 and int(response.headers['Retry-After']) >= 1
+    # 按 IP 区分客户端
+    response = client.post('/api/search/keyword/', data={'kw': '望京'}, environ_base={'REMOTE_ADDR': '10.0.0.9'})
+    assert response.status_code == 200
+
+
+def test_concurrent_identical_lookups_share_one_query(app, houses, monkeypatch):
+    calls = []
+    search = search_index.search
+
+    def slow_search(keyword, fields, limit=None):
+        calls.append(keyword)
+        time.sleep(0.1)
+        return search(keyword, fields, limit)
+
+    monkeypatch.setattr(search_index, 'search', slow_search)
+    results = []
+
+    def lookup():
+        with app.app_context():
+            results.append(autocomplete.lookup('望京'))
+
+    threads = [threading.Thread(target=lookup) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ['望京']
+    assert len(results) == 5 and all(result == results[0] for result in results) and results[0]
+
+
+def test_longer_keyword_refined_from_cached_prefix(houses, monkeypatch):
+    expected = autocomplete.lookup('望京西')
+    cache.backend.clear()
+    autocomplete.lookup('望')
+    calls = []
+    search = search_index.search
+    monkeypatch.setattr(search_index, 'search', lambda *args, **kwargs: calls.append(args) or search(*args, **kwargs))
+    assert autocomplete.lookup('望京西') == expected
+    assert calls == []
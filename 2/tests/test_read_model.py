@@ -0,0 +1,37 @@
+from models import House
+from read_model import CARD_FIELDS, HouseCard, card_query
+from settings import db
+from utils import house_to_dict
+
+HEAVY_FIELDS = ('facilities', 'highlights', 'matching', 'travel')
+
+
+def test_cards_hold_only_card_fields(houses):
+    db.session.expunge_all()
+    cards = card_query().order_by(House.id).all()
+    assert all(type(card) is HouseCard for card in cards)
+    # 不进入 session 的 identity map
+    assert len(db.session.identity_map) == 0
+    for card, house in zip(cards, houses):
+        assert card == tuple(getattr(house, f) for f in CARD_FIELDS)
+        assert house_to_dict(card) == house_to_dict(house)
+
+
+def test_heavy_text_columns_not_selected(app):
+    sql = str(card_query().statement)
+    assert not any(f'house_info.{field}' in sql for field in HEAVY_FIELDS)
+    assert all(f'house_info.{field}' in sql for field in CARD_FIELDS)
+
+
+def test_cards_work_with_filters_joins_and_pagination(houses):
+    pagination = card_query().filter(House.region == '朝阳区').order_by(House.id).paginate(page=2, per_page=3)
+    assert pagination.total == 5
+    assert [card.id for card in pagination.items] == [houses[3].id, houses[4].id]
+    assert all(isinstance(card, HouseCard) for card in pagination.items)
+
+
+def test_json_endpoints_use_cards(houses, client):
+    data = client.get('/api/search/recommendations').json['data']
+    hot = sorted(houses, key=lambda h: h.page_views or 0, reverse=True)[:10]
+    assert sorted(d['id'] for d in data) == sorted(h.id for h in hot)
+    assert set(data[0]) == {'id', 'title', 'region', 'block', 'address', 'rooms', 'area', 'price', 'page_views'}
@@ -0,0 +1,83 @@
+import re
+
+import pytest
+from sqlalchemy import event, select
+
+import recommender
+from models import Recommend, UserCollection, UserViewHistory
+from settings import db
+
+# 用户 -> 浏览过的房源；收藏过的房源
+VIEWS = {1: [1, 2, 3], 2: [2, 3, 4], 3: [1, 4, 5, 6], 4: [5, 6, 7], 5: [3, 7, 8]}
+COLLECTS = {1: [2], 3: [6], 5: [8]}
+
+
+@pytest.fixture()
+def interactions(app):
+    db.session.add_all(UserViewHistory(user_id=user_id, house_id=house_id, viewed_at=1700000000 + house_id)
+                       for user_id, house_ids in VIEWS.items() for house_id in house_ids)
+    db.session.add_all(UserCollection(user_id=user_id, house_id=house_id, created_at=1700000000)
+                       for user_id, house_ids in COLLECTS.items() for house_id in house_ids)
+    db.session.commit()
+
+
+def neighbours():
+    table = Recommend.__table__
+    with db.engine.connect() as conn:
+        rows = conn.execute(select(table.c.house_id, table.c.similar_id, table.c.score, table.c.similarity)
+                            .where(table.c.user_id.is_(None)))
+        return sorted(tuple(row) for row in rows)
+
+
+def refresh(house_ids):
+    with db.engine.begin() as conn:
+        return recommender.refresh_houses(conn, house_ids)
+
+
+def test_refresh_in_batches_matches_rebuild(interactions, monkeypatch):
+    with db.engine.begin() as conn:
+        recommender.rebuild_all(conn)
+    expected = neighbours()
+    with db.engine.begin() as conn:
+        conn.execute(Recommend.__table__.delete())
+    monkeypatch.setattr(recommender, 'QUERY_BATCH_SIZE', 2)
+    assert refresh(range(1, 9)) == 8
+    assert neighbours() == expected
+
+
+def test_partial_refresh_does_not_depend_on_batch_size(interactions, monkeypatch):
+    with db.engine.begin() as conn:
+        recommender.rebuild_all(conn)
+    db.session.add(UserViewHistory(user_id=2, house_id=7, viewed_at=1700000100))
+    db.session.commit()
+    table = Recommend.__table__
+    with db.engine.connect() as conn:
+        rebuilt = [row._asdict() for row in conn.execute(select(table))]
+
+    results = []
+    for batch_size in (1000, 1):
+        with db.engine.begin() as conn:
+            conn.execute(table.delete())
+            conn.execute(table.insert(), rebuilt)
+        monkeypatch.setattr(recommender, 'QUERY_BATCH_SIZE', batch_size)
+        refresh([2, 7, 8])
+        results.append(neighbours())
+    assert results[0] == results[1] != sorted((r['house_id'], r['similar_id'], r['score'], r['similarity'])
+                                                for r in rebuilt)
+
+
+def test_in_lists_are_bounded(interactions, monkeypatch):
+    monkeypatch.setattr(recommender, 'QUERY_BATCH_SIZE', 2)
+    sizes = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith('SELECT'):
+            return
+        sizes.extend(len(group.split(',')) for group in re.findall(r' IN \(([?, ]+)\)', statement))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        refresh(range(1, 9))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert sizes and max(sizes) <= 2
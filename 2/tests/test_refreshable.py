@@ -0,0 +1,73 @@
+import os
+import threading
+
+import pytest
+
+from refreshable import RefreshableIndex, reset_after_fork
+
+
+class CountingIndex(RefreshableIndex):
+    """每次重建返回递增的版本号，_load 可以被阻塞以模拟进行中的重建"""
+
+    refresh_config_key = 'TEST_INDEX_REFRESH_INTERVAL'
+
+    def __init__(self):
+        self.version = 0
+        self.items = set()
+        self.loading = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        super().__init__()
+        self.refresh_interval = 300
+
+    def _load(self):
+        self.loading.set()
+        self.release.wait(5)
+        return self.version + 1
+
+    def _install(self, version):
+        self.version = version
+        return version
+
+    def add(self, item):
+        self._modify(self.items.add, item)
+
+
+def test_changes_during_rebuild_are_replayed():
+    index = CountingIndex()
+    index.rebuild()
+    index.release.clear()
+    thread = threading.Thread(target=index.rebuild)
+    thread.start()
+    assert index.loading.wait(5)
+    index.add('a')
+    index.release.set()
+    thread.join(5)
+    assert index.version == 2 and index.items == {'a'}
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='需要 os.fork')
+def test_reset_after_fork_during_background_rebuild():
+    index = CountingIndex()
+    index.rebuild()
+    index.release.clear()
+    index.loading.clear()
+    index.invalidate()
+    index._ensure_fresh()
+    assert index.loading.wait(5)
+    # 父进程的后台重建进行中 (持有 _build_lock，_refreshing 为 True) 时 fork
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            reset_after_fork()
+            index.release.set()
+            assert not index._refreshing and index._stale
+            assert index.rebuild() == 2
+            index.add('b')
+            code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    index.release.set()
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,85 @@
+import pytest
+
+import app as app_module
+import saved_search
+from settings import db
+from models import House, SavedSearch, SavedSearchMatch
+from read_model import card_query
+from tests.conftest import make_house
+
+SEARCHES = [
+    {'region': '朝阳区'},
+    {'region': '海淀区-五道口', 'rooms': '3室1厅'},
+    {'region': '丰台', 'price': '2000-5000'},
+    {'keyword': '望京', 'rent_type': '整租'},
+    {'keyword': '园', 'area': '30-90', 'facilities': '冰箱'},
+    {'rooms': '4室及以上'},
+    {'price': '5000-10000', 'direction': '南'},
+    {'facilities': 'Wi-Fi,空调'},
+    {'region': '不存在的区'},
+]
+
+NEW_HOUSES = [
+    ('朝阳区', '望京', '望京西园', '3室1厅', '85平米', '7600元/月', '南', '整租', '冰箱-空调', 1705000000, 0),
+    ('海淀区', '五道口', '东升园', '3室1厅', '92平米', '9100元/月', '南', '整租', '网络-空调-冰箱', 1705000000, 0),
+    ('丰台区', '方庄', '芳古园', '6室2厅', '200平米', '4500元/月', '西', '合租', '床', 1705000000, 0),
+]
+
+
+def search_ids(params):
+    """/api/search 对同样的参数查询到的房源ID"""
+    with app_module.app.test_request_context(query_string=params):
+        selection = app_module.search_facet_selection(params)
+        query = card_query().filter(*app_module.search_range_filters(params),
+                                    *app_module.search_facet_filters(selection))
+        return {card.id for card in query}
+
+
+def matched_ids(search_id):
+    return {m.house_id for m in SavedSearchMatch.query.filter_by(search_id=search_id)}
+
+
+@pytest.fixture()
+def saved(houses, client):
+    client.post('/api/login', data={'username': 'alice', 'password': 'pw'})
+    ids = []
+    for params in SEARCHES:
+        response = client.post('/api/saved_searches', data=params)
+        assert response.json['code'] == 1
+        ids.append(response.json['data']['id'])
+    return ids
+
+
+def test_new_houses_match_like_search(saved):
+    """提交新房源后写入的匹配结果，与用同样的条件调用 /api/search 得到的新房源相同"""
+    existing = {h.id for h in House.query}
+    db.session.add_all(make_house(100 + i, *values) for i, values in enumerate(NEW_HOUSES))
+    db.session.commit()
+    new_ids = {h.id for h in House.query} - existing
+    for search_id, params in zip(saved, SEARCHES):
+        assert matched_ids(search_id) == search_ids(params) & new_ids, params
+    assert any(matched_ids(search_id) for search_id in saved)
+
+
+def test_all_houses_match_like_search(saved):
+    """对全部房源重新匹配 (批量导入后的路径)，结果与 /api/search 相同"""
+    with db.engine.begin() as conn:
+        saved_search.match_updated_since(conn, 0)
+    for search_id, params in zip(saved, SEARCHES):
+        assert matched_ids(search_id) == search_ids(params), params
+
+
+def test_updated_house_matches(saved):
+    """修改后满足条件的房源也会匹配，删除的检索条件不再匹配"""
+    house = House.query.filter_by(rooms='2室1厅', region='丰台区').first()
+    house.rooms = '4室2厅'
+    db.session.commit()
+    assert house.id in matched_ids(saved[SEARCHES.index({'rooms': '4室及以上'})])
+
+    removed = saved[0]
+    search = db.session.get(SavedSearch, removed)
+    db.session.delete(search)
+    db.session.commit()
+    db.session.add(make_house(200, *NEW_HOUSES[0]))
+    db.session.commit()
+    assert not matched_ids(removed)
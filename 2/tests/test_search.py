@@ -0,0 +1,45 @@
+import re
+
+import pytest
+
+from utils import clean_price, parse_area
+
+
+def result_ids(response):
+    assert response.status_code == 200
+    return {int(i) for i in re.findall(r'/house/(\d+)"><img', response.get_data(as_text=True))}
+
+
+@pytest.mark.parametrize('field, parse, value', [
+    ('price', clean_price, '3000-6000'),
+    ('price', clean_price, '0-2500'),
+    ('area', parse_area, '50-100'),
+])
+def test_range_search_uses_numeric_columns(houses, client, field, parse, value):
+    """区间按解析后的数值筛选 (下限包含、上限不包含)，无法解析或为 0 的值不参与"""
+    low, high = map(int, value.split('-'))
+    expected = {h.id for h in houses if 0 < parse(getattr(h, field)) and low <= parse(getattr(h, field)) < high}
+    assert result_ids(client.get('/api/search', query_string={field: value})) == expected
+
+
+def test_range_and_facet_filters_combined(houses, client):
+    expected = {h.id for h in houses
+                if 4000 <= clean_price(h.price) < 10000 and h.rent_type == '整租' and h.region == '海淀区'}
+    response = client.get('/api/search', query_string={'price': '4000-10000', 'rent_type': '整租',
+                                                       'region': '海淀区'})
+    assert result_ids(response) == expected and expected
+
+
+def test_results_paginated(houses, client):
+    first = result_ids(client.get('/api/search'))
+    second = result_ids(client.get('/api/search', query_string={'page': 2}))
+    assert len(first) == 9 and len(second) == len(houses) - 9
+    assert not first & second
+
+
+@pytest.mark.parametrize('url', ['/api/search', '/api/search/facets'])
+@pytest.mark.parametrize('args', [{'price': 'abc'}, {'area': '10-'}, {'price': '1-2-3'}])
+def test_malformed_range_rejected(houses, client, url, args):
+    response = client.get(url, query_string=args)
+    assert response.status_code == 200
+    assert response.json['code'] == 0
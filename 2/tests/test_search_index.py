@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import or_, select
+
+from models import House
+from search_index import FIELDS, make_grams, query_grams, search_index
+from settings import db
+
+
+def like_ids(keyword, fields):
+    term = f'%{keyword}%'
+    return set(db.session.scalars(select(House.id).where(or_(*(getattr(House, f).like(term) for f in fields)))))
+
+
+def test_grams():
+    assert make_grams('望京西园') == {'望', '京', '西', '园', '望京', '京西', '西园'}
+    assert query_grams('京') == {'京'}
+    assert query_grams('望京西') == {'望京', '京西'}
+
+
+@pytest.mark.parametrize('keyword', ['望京', '园', '科育小区', '1室', '朝阳区', '五道口华清', '不存在'])
+def test_search_matches_like(houses, keyword):
+    assert set(search_index.search(keyword, FIELDS)) == like_ids(keyword, FIELDS)
+
+
+def test_search_ranks_exact_and_prefix_matches_first(houses):
+    ids = search_index.search('望京', ('title', 'address', 'block'))
+    # 街道为 '望京' (完全相同) 的房源排在标题/小区只是包含 '望京' 的房源之前
+    exact = {h.id for h in houses if h.block == '望京'}
+    assert set(ids[:len(exact)]) == exact
+    assert search_index.search('望京', FIELDS, limit=2) == ids[:2]
+
+
+def test_index_follows_committed_changes(houses):
+    house = db.session.get(House, houses[0].id)
+    house.title = '独栋别墅'
+    db.session.delete(db.session.get(House, houses[1].id))
+    db.session.add(House(title='新房源', region='东城区', block='东直门', address='东环广场', house_num='N1'))
+    db.session.commit()
+    assert search_index.search('别墅') == [houses[0].id]
+    assert houses[1].id not in search_index.search('望京西园')
+    assert set(search_index.search('东直门')) == like_ids('东直门', FIELDS)
+
+
+def test_keyword_filter_falls_back_to_like(houses, monkeypatch):
+    fields = ('region',)
+    expected = like_ids('区', fields)
+    assert len(expected) > 1
+    clause = search_index.keyword_filter('区', fields)
+    assert set(db.session.scalars(select(House.id).where(clause))) == expected
+    monkeypatch.setattr(search_index, 'max_candidates', 1)
+    clause = search_index.keyword_filter('区', fields)
+    assert 'LIKE' in str(clause).upper()
+    assert set(db.session.scalars(select(House.id).where(clause))) == expected
+
+
+def test_result_page_uses_index(houses, client):
+    response = client.get('/query', query_string={'addr': '五道口'}, follow_redirects=True)
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert '华清嘉园' in text and '东升园' in text and '科育小区' not in text
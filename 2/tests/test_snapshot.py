@@ -0,0 +1,82 @@
+from collections import Counter, defaultdict
+
+import pytest
+
+from analytics import TOP_ADDRESS_LIMIT, normalize_region, parse_location
+from models import House
+from settings import app as flask_app, db
+from tests.conftest import make_house
+
+pytest.importorskip('numpy')
+from snapshot import ColumnarSnapshot, chart_snapshot  # noqa: E402
+
+REGIONS = ['朝阳区', '海淀', '海淀区-五道口', '丰台区-方庄-芳古园', '不存在的区']
+ROOMS = ['1室1厅', '2室1厅', '3室1厅']
+
+
+def located(region_str):
+    """按房源ID排序的该位置下的房源 (逐行计算的参考实现)"""
+    region, block, address = parse_location(region_str)
+    return [h for h in House.query.order_by(House.id)
+            if normalize_region(h.region) == region and (not block or h.block == block)
+            and (not address or h.address == address)]
+
+
+def expected_charts(region_str):
+    houses = located(region_str)
+    priced = [h for h in houses if h.price_value]
+    rooms = Counter(h.rooms for h in houses if h.rooms)
+    addresses = Counter(h.address for h in houses if h.address)
+    price_sums = defaultdict(list)
+    for h in priced:
+        price_sums[h.address].append(h.price_value)
+    return {
+        'scatter': [[h.area_value, h.price_value] for h in houses if h.area_value and h.price_value],
+        'rooms': dict(rooms),
+        'top_addresses': {(address, count, round(sum(price_sums[address]) / len(price_sums[address]), 2)
+                           if price_sums[address] else 0)
+                          for address, count in addresses.most_common(TOP_ADDRESS_LIMIT)},
+        'price_series': {r: [h.price_value for h in sorted((h for h in priced if h.rooms == r),
+                                                          key=lambda h: (h.publish_time or -1, h.id))]
+                         for r in ROOMS},
+    }
+
+
+def charts(snapshot, region_str):
+    data = snapshot.dashboard(region_str, 10, ROOMS)
+    return {
+        'scatter': data['scatter'],
+        'rooms': dict(data['rooms']),
+        'top_addresses': set(data['top_addresses']),
+        'price_series': data['price_series'],
+    }
+
+
+@pytest.mark.parametrize('region', REGIONS)
+def test_snapshot_charts_match_row_by_row_computation(houses, region):
+    chart_snapshot.rebuild()
+    assert charts(chart_snapshot, region) == expected_charts(region)
+
+
+def test_incremental_changes_match_rebuilt_snapshot(houses):
+    chart_snapshot.rebuild()
+    by_id = {h.id: h for h in House.query}
+    by_id[houses[0].id].price = '3900元/月'
+    by_id[houses[1].id].rooms = '3室1厅'
+    by_id[houses[5].id].region = '朝阳区'
+    by_id[houses[8].id].publish_time = 1690000000
+    db.session.delete(by_id[houses[2].id])
+    db.session.add(make_house(100, '海淀区', '五道口', '新小区', '2室1厅', '50平米', '4100元/月', '南', '整租', '',
+                              1700090000, 0))
+    db.session.commit()
+
+    rebuilt = ColumnarSnapshot(flask_app)
+    rebuilt.rebuild()
+    for region in REGIONS:
+        assert charts(chart_snapshot, region) == charts(rebuilt, region) == expected_charts(region), region
+
+
+def test_chart_endpoints_use_snapshot(houses, client):
+    chart_snapshot.rebuild()
+    expected = expected_charts('朝阳区')
+    assert client.get('/api/get/scatterdata/朝阳区').json['data'] == expected['scatter']
@@ -0,0 +1,121 @@
+import json
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+
+import trends
+from settings import db
+from models import House, PriceTrend
+from tests.conftest import make_house
+
+
+def trend_rows():
+    rows = db.session.query(PriceTrend).all()
+    return {(r.region, r.rooms, r.granularity, r.bucket): (r.house_count, r.price_sum, json.loads(r.histogram))
+            for r in rows}
+
+
+def assert_same_rows(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, (count, price_sum, histogram) in expected.items():
+        assert actual[key][0] == count, key
+        assert actual[key][1] == pytest.approx(price_sum), key
+        assert actual[key][2] == histogram, key
+
+
+def rebuilt_rows():
+    with db.engine.begin() as conn:
+        trends.rebuild_all(conn)
+    db.session.expire_all()
+    return trend_rows()
+
+
+def test_incremental_updates_match_rebuild(houses):
+    """房源新增、修改 (价格/户型/发布时间/所在区) 和删除后，增量维护的统计与全量重建的结果相同"""
+    seeded = trend_rows()
+    assert seeded
+    assert_same_rows(seeded, rebuilt_rows())
+
+    db.session.add(make_house(100, '海淀区', '中关村', '科育小区', '2室1厅', '66平米', '7300元/月', '南', '整租',
+                              '冰箱', 1701300000, 0))
+    db.session.commit()
+
+    by_id = {h.id: h for h in House.query.all()}
+    by_id[houses[0].id].price = '3900元/月'
+    by_id[houses[1].id].rooms = '3室1厅'
+    by_id[houses[2].id].publish_time = 1709000000
+    by_id[houses[3].id].region = '海淀区'
+    by_id[houses[4].id].publish_time = 1701000000
+    db.session.commit()
+
+    db.session.delete(by_id[houses[5].id])
+    by_id[houses[8].id].price = '0元/月'
+    db.session.commit()
+
+    # 同一事务中多次修改同一房源
+    house = db.session.get(House, houses[6].id)
+    house.price = '16000元/月'
+    db.session.flush()
+    house.price = '16500元/月'
+    house.region = '丰台区'
+    db.session.commit()
+
+    # 回滚的修改不计入统计
+    db.session.get(House, houses[7].id).price = '9999元/月'
+    db.session.flush()
+    db.session.rollback()
+
+    incremental = trend_rows()
+    assert_same_rows(incremental, rebuilt_rows())
+
+
+def test_load_trend_window(houses):
+    """朝阳区的 4 套有效房源都在 2023 年 11 月发布，'朝阳' 与 '朝阳区' 是同一个区"""
+    now = datetime(2023, 11, 30, tzinfo=trends.TREND_TZ).timestamp()
+    with db.engine.begin() as conn:
+        trends.rebuild_all(conn)
+        single = trends.load_trend(conn, '朝阳', granularity='month', points=3, now=now)
+        rolling = trends.load_trend(conn, '朝阳区', granularity='month', points=2, window=2, now=now)
+    assert single['x_axis'] == ['2023-09', '2023-10', '2023-11']
+    assert single['counts'] == [0, 0, 4]
+    assert single['series'][1]['data'] == [None, None, round((3500 + 6200 + 5800 + 9800) / 4, 2)]
+    assert rolling['x_axis'] == ['2023-10', '2023-11']
+    assert rolling['counts'] == [0, 4]
+
+
+def test_trend_ends_at_current_date(houses):
+    """很久没有新房源的区，走势截止到当前日期，末尾没有数据的时间桶为 null"""
+    now = datetime(2024, 2, 10, tzinfo=trends.TREND_TZ).timestamp()
+    with db.engine.begin() as conn:
+        trends.rebuild_all(conn)
+        trend = trends.load_trend(conn, '朝阳', granularity='month', points=4, now=now)
+        missing = trends.load_trend(conn, '不存在的区', granularity='month', now=now)
+    assert trend['x_axis'] == ['2023-11', '2023-12', '2024-01', '2024-02']
+    assert trend['counts'] == [4, 0, 0, 0]
+    assert trend['series'][0]['data'][1:] == [None, None, None]
+    assert missing['x_axis'] == []
+
+
+def test_concurrent_first_insert_merges(app, monkeypatch):
+    """两个写入同时发现统计行不存在时，后插入的一方合并到已有的行，增量不丢失"""
+    deltas = defaultdict(trends._Delta)
+    trends.contribute(deltas, '朝阳区', '1室1厅', 1700000000, 3000)
+    with db.engine.begin() as conn:
+        trends.apply_deltas(conn, deltas)
+
+    locked_row = trends._locked_row
+    calls = []
+
+    def row_not_yet_visible(conn, table, key):
+        # 第一次读取时另一个写入还没有提交
+        calls.append(key)
+        return None if len(calls) == 1 else locked_row(conn, table, key)
+
+    monkeypatch.setattr(trends, '_locked_row', row_not_yet_visible)
+    key = next(iter(deltas))
+    with db.engine.begin() as conn:
+        trends.apply_deltas(conn, {key: deltas[key]})
+    row = trend_rows()[key]
+    assert row[0] == 2 and row[1] == pytest.approx(6000)
+    assert sum(row[2].values()) == 2
@@ -0,0 +1,73 @@
+import re
+
+from models import User, UserCollection, UserViewHistory
+from settings import db
+from tests.conftest import HOUSES, make_house
+
+
+def login(client):
+    client.post('/api/login', data={'username': 'alice', 'password': 'pw'})
+
+
+def collections():
+    return sorted(c.house_id for c in UserCollection.query.order_by(UserCollection.created_at))
+
+
+def test_collect_and_uncollect(houses, client):
+    house_id = houses[2].id
+    assert client.get(f'/api/add/collection/{house_id}').json['valid'] == '0'
+    login(client)
+    assert client.get(f'/api/add/collection/{house_id}').json['valid'] == '1'
+    assert client.get(f'/api/add/collection/{house_id}').json['valid'] == '0'
+    assert collections() == [house_id]
+    response = client.post('/api/collect_off', data={'house_id': house_id, 'user_name': 'alice'})
+    assert response.json['valid'] == '1' and collections() == []
+    response = client.post('/api/collect_off', data={'house_id': house_id, 'user_name': 'alice'})
+    assert response.json['valid'] == '0'
+
+
+def test_detail_view_recorded_once(houses, client):
+    login(client)
+    for _ in range(2):
+        assert client.get(f'/house/{houses[0].id}').status_code == 200
+    assert [h.house_id for h in UserViewHistory.query] == [houses[0].id]
+    assert client.post('/api/del_record', data={'user_name': 'alice'}).json['valid'] == '1'
+    assert UserViewHistory.query.count() == 0
+
+
+def test_user_page_paginates_collections(houses, client):
+    extra = [make_house(100 + i, *HOUSES[i % len(HOUSES)]) for i in range(40)]
+    db.session.add_all(extra)
+    db.session.flush()
+    user = User.query.filter_by(name='alice').one()
+    all_houses = houses + extra
+    db.session.add_all(UserCollection(user_id=user.id, house_id=h.id, created_at=1700000000 + i)
+                       for i, h in enumerate(all_houses))
+    db.session.commit()
+    login(client)
+
+    def collected(page):
+        response = client.get('/user/alice', query_string={'page': page})
+        assert response.status_code == 200
+        text = response.get_data(as_text=True)
+        return [int(i) for i in re.findall(r'class="collect_off" id="(\d+)"', text)], '下一页' in text
+
+    # 每页 50 条，按收藏时间倒序
+    newest_first = [h.id for h in reversed(all_houses)]
+    assert collected(1) == (newest_first[:50], True)
+    assert collected(2) == (newest_first[50:], False)
+
+
+def test_migrate_legacy_relation_columns(houses, app):
+    user = User.query.filter_by(name='alice').one()
+    user.collect_id = f'{houses[3].id},{houses[1].id},x,{houses[3].id}'
+    user.seen_id = f'{houses[5].id}'
+    db.session.commit()
+    runner = app.test_cli_runner()
+    for _ in range(2):
+        result = runner.invoke(args=['migrate-user-relations'])
+        assert result.exit_code == 0, result.output
+    rows = UserCollection.query.order_by(UserCollection.created_at).all()
+    # 去重并保持旧字段中的先后顺序，重复执行不会重复写入
+    assert [r.house_id for r in rows] == [houses[3].id, houses[1].id]
+    assert [h.house_id for h in UserViewHistory.query] == [houses[5].id]
@@ -0,0 +1,72 @@
+import pytest
+
+from settings import db, cache
+from models import House
+from index_page import get_hot_houses
+from view_counter import view_counter
+
+
+@pytest.fixture()
+def counter(monkeypatch):
+    """不启动后台线程，测试中手动写回"""
+    monkeypatch.setattr(view_counter, '_ensure_worker', lambda: None)
+    view_counter.flush()
+    yield view_counter
+    view_counter.flush()
+
+
+def page_views(house_id):
+    db.session.expire_all()
+    return db.session.get(House, house_id).page_views
+
+
+def test_views_buffered_until_flush(houses, client, counter):
+    popular, unviewed = houses[11], houses[9]
+    for _ in range(3):
+        assert client.get(f'/house/{popular.id}').status_code == 200
+    for _ in range(2):
+        client.get(f'/house/{unviewed.id}')
+    # 请求线程只在内存中累加
+    assert page_views(popular.id) == 60
+    assert page_views(unviewed.id) is None
+
+    assert counter.flush() == 2
+    assert page_views(popular.id) == 63
+    assert page_views(unviewed.id) == 2
+    assert counter.flush() == 0
+
+
+def test_flush_invalidates_hot_houses_only_when_ranking_can_change(houses, client, counter):
+    get_hot_houses(10)
+    lowest = min(h['page_views'] for h in get_hot_houses(10))
+
+    # 浏览量仍低于榜单末尾的房源不影响缓存的榜单
+    counter.record(houses[9].id)
+    counter.flush()
+    assert page_views(houses[9].id) < lowest
+    assert cache.peek('hot_houses', 10) is not None
+
+    counter.record(houses[11].id)
+    counter.flush()
+    assert cache.peek('hot_houses', 10) is None
+
+
+def test_threshold_wakes_flush_thread(houses, counter, monkeypatch):
+    monkeypatch.setattr(counter, 'flush_threshold', 3)
+    counter._wake.clear()
+    counter.record(houses[0].id)
+    counter.record(houses[1].id)
+    assert not counter._wake.is_set()
+    counter.record(houses[0].id)
+    assert counter._wake.is_set()
+    counter._wake.clear()
+
+
+def test_failed_flush_keeps_counts(houses, counter, monkeypatch):
+    counter.record(houses[0].id)
+    with monkeypatch.context() as patched:
+        patched.setattr(House.__table__, 'update', lambda: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            counter.flush()
+    assert counter.flush() == 1
+    assert page_views(houses[0].id) == 121
@@ -0,0 +1,248 @@
+import bisect
+import json
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
+
+from settings import db, cache
+from models import House, PriceTrend
+from analytics import normalize_region
+from house_changes import house_changes
+from utils import clean_price
+
+# 时间桶按北京时间划分
+TREND_TZ = timezone(timedelta(hours=8))
+GRANULARITIES = ('day', 'week', 'month')
+LABEL_FORMATS = {'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m'}
+# 价格直方图的分桶边界：从 300 元起按 8% 递增 (估算分位数的相对误差约 4%)，超出范围的价格计入首尾两个桶
+PRICE_BIN_EDGES = tuple(round(300 * 1.08 ** i, 2) for i in range(80))
+# 走势接口一次最多返回的时间桶数量
+MAX_POINTS = 180
+MAX_WINDOW = 12
+
+
+# --- 时间桶 ---
+def bucket_start(timestamp, granularity):
+    """时间戳所在时间桶的起始时间：当天零点 / 所在周的周一零点 / 所在月的一号零点"""
+    day = datetime.fromtimestamp(timestamp, TREND_TZ).date()
+    if granularity == 'week':
+        day -= timedelta(days=day.weekday())
+    elif granularity == 'month':
+        day = day.replace(day=1)
+    return _day_timestamp(day)
+
+
+def _day_timestamp(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=TREND_TZ).timestamp())
+
+
+def previous_buckets(last_bucket, granularity, count):
+    """从 last_bucket 往前共 count 个时间桶的起始时间 (按时间升序)"""
+    day = datetime.fromtimestamp(last_bucket, TREND_TZ).date()
+    days = []
+    for _ in range(count):
+        days.append(day)
+        if granularity == 'day':
+            day -= timedelta(days=1)
+        elif granularity == 'week':
+            day -= timedelta(days=7)
+        else:
+            day = (day.replace(day=1) - timedelta(days=1)).replace(day=1)
+    return [_day_timestamp(d) for d in reversed(days)]
+
+
+# --- 价格直方图 ---
+def price_bin(price):
+    return min(max(bisect.bisect_right(PRICE_BIN_EDGES, price) - 1, 0), len(PRICE_BIN_EDGES) - 2)
+
+
+def histogram_quantile(histogram, q):
+    """由直方图估算分位数 (在所在分桶内线性插值)"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    target = q * total
+    cumulative = 0
+    for index in sorted(histogram):
+        count = histogram[index]
+        if count and cumulative + count >= target:
+            low, high = PRICE_BIN_EDGES[index], PRICE_BIN_EDGES[index + 1]
+            return round(low + (high - low) * (target - cumulative) / count, 2)
+        cumulative += count
+    return PRICE_BIN_EDGES[-1]
+
+
+class _Delta:
+    """某个 (区, 户型, 粒度, 时间桶) 的增量：房源数量、价格总和、直方图"""
+
+    def __init__(self):
+        self.count = 0
+        self.price_sum = 0.0
+        self.histogram = Counter()
+
+    def add(self, price, sign):
+        self.count += sign
+        self.price_sum += sign * price
+        self.histogram[price_bin(price)] += sign
+
+
+def contribute(deltas, region, rooms, publish_time, price, sign=1):
+    """一套房源对各时间桶的贡献 (sign=-1 表示撤销)，没有发布时间或价格无效的房源不参与统计"""
+    if not publish_time or not price or price <= 0:
+        return
+    region = normalize_region(region)
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(publish_time, granularity)
+        for rooms_key in {rooms or '', ''}:
+            deltas[(region, rooms_key, granularity, bucket)].add(price, sign)
+
+
+# --- 写入 ---
+def apply_deltas(conn, deltas):
+    """
+    把增量合并到已有的统计行 (行锁保证多个进程并发更新时不丢失)
+    行还不存在时 SELECT ... FOR UPDATE 锁不住任何行：并发的第一次写入由唯一键保证只有一个插入成功，
+    其余的改为合并到它插入的行
+    """
+    table = PriceTrend.__table__
+    for (region, rooms, granularity, bucket), delta in deltas.items():
+        if not delta.count and not any(delta.histogram.values()):
+            continue
+        key = and_(table.c.region == region, table.c.rooms == rooms,
+                   table.c.granularity == granularity, table.c.bucket == bucket)
+        row = _locked_row(conn, table, key)
+        if row is None:
+            if delta.count <= 0:
+                continue
+            try:
+                with conn.begin_nested():
+                    conn.execute(table.insert().values(region=region, rooms=rooms, granularity=granularity,
+                                                       bucket=bucket, **_merged(None, delta)))
+                continue
+            except IntegrityError:
+                row = _locked_row(conn, table, key)
+        record = _merged(row, delta)
+        if record['house_count'] <= 0:
+            conn.execute(table.delete().where(table.c.id == row.id))
+        else:
+            conn.execute(table.update().where(table.c.id == row.id).values(**record))
+
+
+def _locked_row(conn, table, key):
+    return conn.execute(select(table.c.id, table.c.house_count, table.c.price_sum, table.c.histogram)
+                        .where(key).with_for_update()).first()
+
+
+def _merged(row, delta):
+    """统计行 (不存在时为 None) 合并增量后的字段值"""
+    histogram = Counter({int(k): v for k, v in json.loads(row.histogram or '{}').items()}) if row else Counter()
+    histogram.update(delta.histogram)
+    return {
+        'house_count': (row.house_count if row else 0) + delta.count,
+        'price_sum': (row.price_sum if row else 0) + delta.price_sum,
+        'histogram': json.dumps({k: v for k, v in sorted(histogram.items()) if v > 0}),
+    }
+
+
+def rebuild_region(conn, region):
+    """重新计算某个区的全部走势数据，并替换原有记录"""
+    region = normalize_region(region)
+    deltas = defaultdict(_Delta)
+    rows = conn.execute(
+        select(House.rooms, House.publish_time, House.price_value, House.price)
+        .where(House.region.in_([region, region + '区']))
+    )
+    for row in rows:
+        price = row.price_value if row.price_value is not None else clean_price(row.price)
+        contribute(deltas, region, row.rooms, row.publish_time, price)
+    table = PriceTrend.__table__
+    conn.execute(table.delete().where(table.c.region == region))
+    records = [
+        {'region': key[0], 'rooms': key[1], 'granularity': key[2], 'bucket': key[3],
+         'house_count': delta.count, 'price_sum': delta.price_sum,
+         'histogram': json.dumps(dict(sorted(delta.histogram.items())))}
+        for key, delta in deltas.items()
+    ]
+    if records:
+        conn.execute(table.insert(), records)
+    return len(records)
+
+
+def rebuild_all(conn):
+    """重建全部区的走势数据，返回处理的区数量"""
+    regions = {normalize_region(r) for (r,) in conn.execute(select(House.region).distinct()) if r}
+    conn.execute(PriceTrend.__table__.delete())
+    for region in regions:
+        rebuild_region(conn, region)
+    return len(regions)
+
+
+# --- 读取 ---
+def load_trend(conn, region, rooms='', granularity='week', points=26, window=1, now=None):
+    """
+    某个区 (及户型) 截至当前时间 (now，默认为现在) 最近 points 个时间桶的价格走势：中位数、平均价格和 P90
+    window > 1 时每个点统计最近 window 个时间桶 (滚动窗口，直方图直接相加)
+    没有数据的时间桶返回 null (很久没有新房源的区末尾都是 null)，x 轴是真实日期
+    """
+    region = normalize_region(region)
+    table = PriceTrend.__table__
+    key = and_(table.c.region == region, table.c.rooms == rooms, table.c.granularity == granularity)
+    if conn.execute(select(table.c.id).where(key).limit(1)).first() is None:
+        return {'legend': [], 'x_axis': [], 'series': [], 'counts': []}
+    last_bucket = bucket_start(time.time() if now is None else now, granularity)
+    buckets = previous_buckets(last_bucket, granularity, points + window - 1)
+    rows = {row.bucket: row for row in conn.execute(
+        select(table.c.bucket, table.c.house_count, table.c.price_sum, table.c.histogram)
+        .where(key, table.c.bucket >= buckets[0]))}
+
+    medians, averages, p90s, counts = [], [], [], []
+    for i in range(window - 1, len(buckets)):
+        histogram = Counter()
+        count = 0
+        price_sum = 0.0
+        for bucket in buckets[i - window + 1:i + 1]:
+            row = rows.get(bucket)
+            if row is not None:
+                histogram.update({int(k): v for k, v in json.loads(row.histogram or '{}').items()})
+                count += row.house_count
+                price_sum += row.price_sum
+        counts.append(count)
+        medians.append(histogram_quantile(histogram, 0.5) if count else None)
+        averages.append(round(price_sum / count, 2) if count else None)
+        p90s.append(histogram_quantile(histogram, 0.9) if count else None)
+
+    label_format = LABEL_FORMATS[granularity]
+    series = [
+        {'name': '中位数', 'type': 'line', 'data': medians},
+        {'name': '平均价格', 'type': 'line', 'data': averages},
+        {'name': 'P90', 'type': 'line', 'data': p90s},
+    ]
+    return {
+        'legend': [s['name'] for s in series],
+        'x_axis': [datetime.fromtimestamp(b, TREND_TZ).strftime(label_format) for b in buckets[window - 1:]],
+        'series': series,
+        'counts': counts,
+    }
+
+
+# --- 增量维护：房源变化时记录增量，提交后在后台写入统计表 ---
+TREND_FIELDS = ('region', 'rooms', 'publish_time', 'price_value')
+
+
+def _write_trend_deltas(changes):
+    deltas = defaultdict(_Delta)
+    for change in changes:
+        if change.old is not None:
+            contribute(deltas, *(change.old[f] for f in TREND_FIELDS), -1)
+        if change.new is not None:
+            contribute(deltas, *(change.new[f] for f in TREND_FIELDS))
+    with db.engine.begin() as conn:
+        apply_deltas(conn, deltas)
+    for region in {key[0] for key in deltas}:
+        cache.invalidate_prefix('charts', f'{region}|')
+
+
+house_changes.subscribe(_write_trend_deltas, TREND_FIELDS, old_fields=TREND_FIELDS, background=True)
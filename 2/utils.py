@@ -0,0 +1,86 @@
+import re
+
+
+# --- 文本字段解析函数 ---
+def clean_price(price_str):
+    """从价格字符串（如 '3500元/月'）中提取数值"""
+    if not price_str:
+        return 0
+    match = re.search(r'(\d+)', str(price_str))
+    return float(match.group(1)) if match else 0
+
+
+def parse_area(area_str):
+    """从面积字符串 (如 '75平米') 中提取数值"""
+    if not area_str:
+        return 0
+    match = re.search(r'(\d+)', str(area_str))
+    return float(match.group(1)) if match else 0
+
+
+# --- 结构化字段编码 ---
+# 配套设施：(facilities 文本中匹配的关键词, 页面显示名称)，顺序即位掩码中的位序号，只能在末尾追加
+FACILITIES = (
+    ('冰箱', '冰箱'),
+    ('洗衣机', '洗衣机'),
+    ('电视', '电视'),
+    ('空调', '空调'),
+    ('暖气', '暖气'),
+    ('热水器', '热水器'),
+    ('燃气', '天然气'),
+    ('床', '床'),
+    ('网络', 'Wi-Fi'),
+    ('电梯', '电梯'),
+)
+FACILITY_BITS = {keyword: 1 << i for i, (keyword, _) in enumerate(FACILITIES)}
+# 朝向和租住类型的编码 (序号 + 1)，0 表示未知
+DIRECTIONS = ('东', '南', '西', '北', '东南', '东北', '西南', '西北', '南北', '东西')
+RENT_TYPES = ('整租', '合租')
+
+
+def parse_facilities(facilities_str):
+    """把配套设施文本 (如 '冰箱-洗衣机-空调') 解析为位掩码"""
+    if not facilities_str:
+        return 0
+    mask = 0
+    for keyword, bit in FACILITY_BITS.items():
+        if keyword in facilities_str:
+            mask |= bit
+    return mask
+
+
+def facilities_query_mask(names):
+    """查询参数中的设施名称 (关键词或显示名称均可) -> 位掩码，无法识别的名称返回 None"""
+    labels = {label: keyword for keyword, label in FACILITIES}
+    mask = 0
+    for name in names:
+        keyword = labels.get(name, name)
+        if keyword not in FACILITY_BITS:
+            return None
+        mask |= FACILITY_BITS[keyword]
+    return mask
+
+
+def encode_choice(value, choices):
+    """把文本编码为 choices 中的序号 + 1，未知的值编码为 0"""
+    value = (value or '').strip()
+    return choices.index(value) + 1 if value in choices else 0
+
+
+def decode_choice(code, choices):
+    return choices[code - 1] if code and 0 < code <= len(choices) else None
+
+
+def house_to_dict(house):
+    """将House对象转换为可序列化为JSON的字典"""
+    return {
+        'id': house.id,
+        'title': house.title or f"{house.address} {house.rooms}",  # 确保title不为空
+        'region': house.region,
+        'block': house.block,
+        'address': house.address,
+        'rooms': house.rooms,
+        'area': house.area,
+        'price': house.price,
+        'page_views': house.page_views
+    }
@@ -0,0 +1,115 @@
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+
+from sqlalchemy import case, func, select
+
+from settings import app, db
+from models import House
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """
+    房源浏览量的缓冲计数器
+    详情页的每次浏览只在进程内存中累加，由后台线程按时间间隔 (或累计条数达到阈值时提前)
+    用一条 UPDATE ... CASE 语句批量写回数据库，进程退出时再写回一次；请求线程本身从不访问数据库
+    """
+
+    def __init__(self, app=None):
+        self.flush_interval = 5
+        self.flush_threshold = 100
+        self._pending = Counter()
+        self._events = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._listeners = []
+        self._worker_pid = None
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('VIEW_COUNTER_FLUSH_INTERVAL', 5)
+        app.config.setdefault('VIEW_COUNTER_FLUSH_THRESHOLD', 100)
+        self.flush_interval = app.config['VIEW_COUNTER_FLUSH_INTERVAL']
+        self.flush_threshold = app.config['VIEW_COUNTER_FLUSH_THRESHOLD']
+        self.app = app
+        atexit.register(self.flush)
+
+    def add_flush_listener(self, callback):
+        """注册写回后的回调，参数为 {房源ID: 最新浏览量}"""
+        self._listeners.append(callback)
+
+    def record(self, house_id):
+        """记录一次浏览 (累计条数达到阈值时唤醒后台线程提前写回)"""
+        self._ensure_worker()
+        with self._lock:
+            self._pending[house_id] += 1
+            self._events += 1
+            should_flush = self._events >= self.flush_threshold
+        if should_flush:
+            self._wake.set()
+
+    def flush(self):
+        """把缓冲区中的浏览量一次性写回数据库，返回写回的房源数量"""
+        with self._flush_lock:
+            with self._lock:
+                increments = self._pending
+                self._pending = Counter()
+                self._events = 0
+            if not increments:
+                return 0
+            table = House.__table__
+            ids = list(increments)
+            try:
+                with self.app.app_context(), db.engine.begin() as conn:
+                    conn.execute(
+                        table.update()
+                        .where(table.c.id.in_(ids))
+                        .values(page_views=func.coalesce(table.c.page_views, 0)
+                                + case(dict(increments), value=table.c.id, else_=0))
+                    )
+                    totals = dict(conn.execute(
+                        select(table.c.id, table.c.page_views).where(table.c.id.in_(ids))
+                    ).all())
+            except Exception:
+                # 写回失败时把计数放回缓冲区，等待下一次写回
+                with self._lock:
+                    self._pending.update(increments)
+                raise
+            for callback in self._listeners:
+                try:
+                    callback(totals)
+                except Exception:
+                    # 浏览量已经写回，回调 (如缓存失效) 失败只记录日志
+                    logger.exception('[浏览量] 写回后的回调执行失败')
+            return len(ids)
+
+    def _ensure_worker(self):
+        """每个进程启动一个后台线程定时写回 (兼容 gunicorn 的 fork 模式)"""
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='view-counter-flush', daemon=True)
+            thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('[浏览量] 定时写回失败')
+
+
+# 初始化浏览量计数器，创建view_counter对象
+view_counter = ViewCounter(app)
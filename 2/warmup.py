@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import select
+
+from settings import app, db
+from models import House
+from analytics import normalize_region
+from search_index import search_index
+from facet_index import facet_index
+from snapshot import chart_snapshot
+from location import location_index
+
+logger = logging.getLogger(__name__)
+
+# 预热时请求的页面 (填充首页热门/最新房源和列表页的缓存)
+WARMUP_PAGES = ('/', '/list/hot_house/1', '/list/pattern/1')
+# 每个区预热的图表接口 (详情页使用 dashboard，其余接口供旧页面和外部调用)
+WARMUP_CHARTS = ('dashboard', 'scatterdata', 'piedata', 'columndata', 'brokenlinedata', 'trend')
+
+
+class Warmup:
+    """
+    启动预热：在接收流量之前建立进程内索引、填充热点查询的缓存
+    使用 gunicorn 的 preload_app 时在主进程中执行一次，fork 出的 worker 直接继承预热好的内存；
+    预热完成之前 /health/ready 返回 503，负载均衡据此决定何时把流量切过来
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.state = 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self.steps = {}
+        self._lock = threading.Lock()
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('WARMUP_ENABLED', True)
+        self.enabled = app.config['WARMUP_ENABLED']
+        self.app = app
+        app.add_url_rule('/health/live', 'health_live', self.live_view)
+        app.add_url_rule('/health/ready', 'health_ready', self.ready_view)
+
+    @property
+    def ready(self):
+        return not self.enabled or self.state == 'done'
+
+    # --- 预热步骤 ---
+    def _regions(self):
+        with self.app.app_context():
+            regions = db.session.scalars(select(House.region).distinct()).all()
+        return sorted({normalize_region(r) for r in regions if r})
+
+    def _indexes(self):
+        """进程内索引：搜索、分面、位置，以及图表使用的列式快照"""
+        search_index.rebuild()
+        facet_index.rebuild()
+        location_index.rebuild()
+        if chart_snapshot.available:
+            chart_snapshot.rebuild()
+
+    def _pages(self):
+        client = self.app.test_client()
+        for url in WARMUP_PAGES:
+            client.get(url)
+
+    def _charts(self):
+        client = self.app.test_client()
+        for region in self._regions():
+            for chart in WARMUP_CHARTS:
+                client.get(f'/api/get/{chart}/{region}')
+
+    def _step(self, name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as exc:
+            logger.exception('[预热] %s 失败', name)
+            self.steps[name] = {'ok': False, 'error': str(exc)}
+        else:
+            self.steps[name] = {'ok': True, 'seconds': round(time.perf_counter() - start, 3)}
+
+    def run(self):
+        """依次执行全部预热步骤 (单个步骤失败只记录日志，不影响启动)"""
+        with self._lock:
+            if not self.enabled or self.state != 'pending':
+                return
+            self.state = 'running'
+        self.started_at = time.time()
+        logger.info('[预热] 开始')
+        self._step('indexes', self._indexes)
+        self._step('pages', self._pages)
+        self._step('charts', self._charts)
+        self.finished_at = time.time()
+        self.state = 'done'
+        logger.info('[预热] 完成，耗时 %.2f 秒', self.finished_at - self.started_at)
+
+    def start(self, background=False):
+        """执行预热；background=True 时在后台线程中执行，期间 /health/ready 返回 503"""
+        if background:
+            threading.Thread(target=self.run, name='warmup', daemon=True).start()
+        else:
+            self.run()
+
+    # --- 健康检查接口 ---
+    def live_view(self):
+        return jsonify(status='ok')
+
+    def ready_view(self):
+        body = {
+            'ready': self.ready,
+            'state': self.state if self.enabled else 'disabled',
+            'steps': self.steps,
+        }
+        if self.finished_at is not None:
+            body['seconds'] = round(self.finished_at - self.started_at, 3)
+        return jsonify(body), 200 if self.ready else 503
+
+
+# 初始化启动预热，创建warmup对象
+warmup = Warmup(app)
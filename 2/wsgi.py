@@ -0,0 +1,41 @@
+# wsgi.py
+# 生产环境入口 (在本目录下执行)：
+#   gunicorn -c gunicorn.conf.py wsgi:application
+#   uwsgi --ini uwsgi.ini
+
+import os
+
+from app import app
+from settings import db
+from instrumentation import configure_logging
+from refreshable import reset_after_fork
+from warmup import warmup
+
+try:
+    import uwsgidecorators
+except ImportError:
+    uwsgidecorators = None
+
+application = app
+
+# 日志在运行入口中配置
+configure_logging(app)
+
+
+def after_fork():
+    """
+    worker 进程 fork 之后调用：丢弃从主进程继承的数据库连接 (连接不能在进程之间共享)，
+    并重置进程内索引的锁和后台重建状态 (主进程中的重建线程不会带到 worker 中)
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    reset_after_fork()
+
+
+if uwsgidecorators is not None:
+    uwsgidecorators.postfork(after_fork)
+
+# 预加载模式下在主进程中同步预热，worker 继承预热好的索引和缓存；
+# 每个 worker 各自加载应用时改为后台预热，预热完成前 /health/ready 返回 503
+warmup.start(background=os.environ.get('WARMUP_BACKGROUND') == '1')